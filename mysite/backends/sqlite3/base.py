@@ -0,0 +1,36 @@
+from django.db.backends.sqlite3 import base
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """
+    SQLite backend that applies the PRAGMAs listed in OPTIONS['pragmas']
+    to every new connection, and can start a transaction with
+    BEGIN IMMEDIATE instead of a deferred BEGIN.
+    """
+
+    # the mode of the next transaction opened by atomic(), see
+    # polls.voting.immediate_atomic
+    transaction_mode = None
+
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        params.pop('pragmas', None)
+        return params
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        pragmas = self.settings_dict['OPTIONS'].get('pragmas', {})
+        if self.is_in_memory_db():
+            # WAL needs a file, in-memory test databases keep their journal
+            pragmas = {name: value for name, value in pragmas.items()
+                       if name != 'journal_mode'}
+        for name, value in pragmas.items():
+            conn.execute(f"PRAGMA {name} = {value}")
+        return conn
+
+    def _start_transaction_under_autocommit(self):
+        mode, self.transaction_mode = self.transaction_mode, None
+        if mode:
+            self.cursor().execute(f"BEGIN {mode}")
+        else:
+            super()._start_transaction_under_autocommit()
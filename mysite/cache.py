@@ -0,0 +1,284 @@
+import contextlib
+import fcntl
+import hashlib
+import mmap
+import os
+import pickle
+import struct
+import threading
+import time
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+MAGIC = b'KUPOLLS1'
+# magic, number of slots, slot size
+HEADER = struct.Struct('<8sII')
+HEADER_SIZE = 64
+# seq, key hash, expiry (0 for never), last used (ns), key length,
+# value length
+SLOT = struct.Struct('<QQdQHI')
+SEQ = struct.Struct('<Q')
+USED_OFFSET = 24
+# slots a key may live in; the least recently used of them is evicted
+WAYS = 8
+
+
+def _hash(key):
+    # never 0, which marks a free slot
+    return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(),
+                          'little') or 1
+
+
+class SharedMemoryCache(BaseCache):
+    """
+    A cache shared by every process of the host through a memory-mapped
+    file, such as one in /dev/shm, named by LOCATION.
+
+    The file holds MAX_ENTRIES fixed-size slots of SLOT_SIZE bytes, grouped
+    in sets of WAYS. A key can only live in the slots of its set, and
+    taking a slot evicts the least recently used entry of the set, so
+    eviction never scans the whole cache. Values that do not fit in a slot
+    are not cached.
+
+    Reads take no lock: every slot carries a sequence number that writers
+    make odd while they change the slot, and a reader retries when the
+    number moved under it. Writes, including incr(), hold an exclusive
+    flock on the file, so increments are atomic across processes.
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS') or {}
+        self.path = location
+        self.slot_size = int(options.get('SLOT_SIZE', 4096))
+        sets = max(1, -(-self._max_entries // WAYS))
+        self.slots = sets * WAYS
+        self.sets = sets
+        self._lock = threading.Lock()
+        self._pid = None
+        self._fd = None
+        self._map = None
+
+    def _mapping(self):
+        """
+        Return the mapped file, opening it again in a forked process,
+        whose flock would otherwise be shared with its parent.
+        """
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._open()
+        return self._map
+
+    def _open(self):
+        size = HEADER_SIZE + self.slots * self.slot_size
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        try:
+            header = HEADER.pack(MAGIC, self.slots, self.slot_size)
+            if (os.pread(fd, HEADER.size, 0) != header
+                    or os.fstat(fd).st_size != size):
+                # a new file, or one laid out for other settings, which
+                # every process using the file must share
+                os.ftruncate(fd, 0)
+                os.ftruncate(fd, size)
+                os.pwrite(fd, header, 0)
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        self._map = mmap.mmap(fd, size)
+        self._fd = fd
+        self._pid = os.getpid()
+
+    def _offset(self, index):
+        return HEADER_SIZE + index * self.slot_size
+
+    def _set_slots(self, key_hash):
+        first = (key_hash % self.sets) * WAYS
+        return range(first, first + WAYS)
+
+    def _read(self, mapping, index, key_hash, key):
+        """
+        Return the (expiry, pickled value) held for `key` in a slot, or
+        None.
+        """
+        offset = self._offset(index)
+        for _ in range(100):
+            seq, slot_hash, expiry, _, key_length, value_length = (
+                SLOT.unpack_from(mapping, offset))
+            if seq & 1:
+                continue
+            if slot_hash != key_hash:
+                found = None
+            else:
+                start = offset + SLOT.size
+                data = mapping[start:start + key_length + value_length]
+                found = None
+                if data[:key_length] == key:
+                    found = expiry, data[key_length:]
+            if SEQ.unpack_from(mapping, offset)[0] == seq:
+                return found
+        # a writer kept changing the slot, wait for it
+        with self._locked():
+            return self._read(mapping, index, key_hash, key)
+
+    def _lookup(self, key):
+        """
+        Return the slot index, expiry and pickled value of a live key, or
+        None.
+        """
+        key = key.encode()
+        key_hash = _hash(key)
+        mapping = self._mapping()
+        for index in self._set_slots(key_hash):
+            found = self._read(mapping, index, key_hash, key)
+            if found is not None:
+                expiry, value = found
+                if expiry and expiry <= time.time():
+                    return None
+                # a racy store is fine, it only steers the eviction
+                struct.pack_into('<Q', mapping,
+                                 self._offset(index) + USED_OFFSET,
+                                 time.time_ns())
+                return index, expiry, value
+        return None
+
+    @contextlib.contextmanager
+    def _locked(self):
+        """
+        Hold the lock of the file, against other threads and processes.
+        """
+        self._mapping()
+        with self._lock:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def _write(self, index, key_hash, key, value, expiry):
+        mapping = self._map
+        offset = self._offset(index)
+        seq = SEQ.unpack_from(mapping, offset)[0]
+        SEQ.pack_into(mapping, offset, seq + 1)
+        SLOT.pack_into(mapping, offset, seq + 1, key_hash, expiry,
+                       time.time_ns(), len(key), len(value))
+        start = offset + SLOT.size
+        mapping[start:start + len(key) + len(value)] = key + value
+        SEQ.pack_into(mapping, offset, seq + 2)
+
+    def _entry(self, index):
+        """
+        Return the expiry and pickled value of a slot, under the lock.
+        """
+        offset = self._offset(index)
+        _, _, expiry, _, key_length, value_length = SLOT.unpack_from(
+            self._map, offset)
+        start = offset + SLOT.size + key_length
+        return expiry, self._map[start:start + value_length]
+
+    def _free(self, index):
+        self._write(index, 0, b'', b'', 0.0)
+
+    def _place(self, key_hash, key):
+        """
+        Return the slot of `key` in its set and whether it holds a live
+        entry, taking a free, expired or least recently used slot when
+        the key is not there.
+        """
+        now = time.time()
+        victim = None
+        victim_rank = None
+        for index in self._set_slots(key_hash):
+            _, slot_hash, expiry, used, key_length, _ = SLOT.unpack_from(
+                self._map, self._offset(index))
+            live = slot_hash and not (expiry and expiry <= now)
+            if slot_hash == key_hash:
+                start = self._offset(index) + SLOT.size
+                if self._map[start:start + key_length] == key:
+                    return index, live
+            rank = (1, used) if live else (0, 0)
+            if victim_rank is None or rank < victim_rank:
+                victim, victim_rank = index, rank
+        return victim, False
+
+    def _store(self, key, value, timeout, only_if_missing=False):
+        key = key.encode()
+        key_hash = _hash(key)
+        value = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        expiry = self.get_backend_timeout(timeout) or 0.0
+        fits = SLOT.size + len(key) + len(value) <= self.slot_size
+        with self._locked():
+            index, live = self._place(key_hash, key)
+            if only_if_missing and live:
+                return False
+            if not fits:
+                # never leave an older value of the key behind
+                if live:
+                    self._free(index)
+                return False
+            self._write(index, key_hash, key, value, expiry)
+            return True
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        return self._store(key, value, timeout, only_if_missing=True)
+
+    def get(self, key, default=None, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        found = self._lookup(key)
+        if found is None:
+            return default
+        return pickle.loads(found[2])
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        self._store(key, value, timeout)
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version).encode()
+        key_hash = _hash(key)
+        with self._locked():
+            index, live = self._place(key_hash, key)
+            if not live:
+                return False
+            _, value = self._entry(index)
+            self._write(index, key_hash, key, value,
+                        self.get_backend_timeout(timeout) or 0.0)
+            return True
+
+    def incr(self, key, delta=1, version=None):
+        key = self.make_and_validate_key(key, version=version).encode()
+        key_hash = _hash(key)
+        with self._locked():
+            index, live = self._place(key_hash, key)
+            if not live:
+                raise ValueError(f"Key '{key.decode()}' not found")
+            expiry, value = self._entry(index)
+            value = pickle.loads(value)
+            value += delta
+            self._write(index, key_hash, key,
+                        pickle.dumps(value, pickle.HIGHEST_PROTOCOL), expiry)
+            return value
+
+    def delete(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version).encode()
+        key_hash = _hash(key)
+        with self._locked():
+            index, live = self._place(key_hash, key)
+            if not live:
+                return False
+            self._free(index)
+            return True
+
+    def has_key(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        return self._lookup(key) is not None
+
+    def clear(self):
+        with self._locked():
+            for index in range(self.slots):
+                self._free(index)
+
+    def close(self, **kwargs):
+        # the mapping is kept open for the life of the process
+        pass
@@ -0,0 +1,221 @@
+import glob
+import json
+import os
+import threading
+import time
+
+from django.conf import settings
+
+# Upper bounds of the histogram buckets of each metric.
+BUCKETS = {
+    'http_request_duration_seconds': (0.005, 0.01, 0.025, 0.05, 0.1, 0.25,
+                                      0.5, 1, 2.5, 5, 10),
+    'http_request_db_queries': (0, 1, 2, 5, 10, 20, 50, 100),
+    'http_request_db_duration_seconds': (0.001, 0.005, 0.01, 0.025, 0.05,
+                                         0.1, 0.25, 0.5, 1, 5),
+    'http_template_render_seconds': (0.001, 0.005, 0.01, 0.025, 0.05, 0.1,
+                                     0.25, 1),
+    'http_response_size_bytes': (256, 1024, 4096, 16384, 65536, 262144,
+                                 1048576),
+    'polls_vote_buffer_flush_seconds': (0.001, 0.005, 0.01, 0.025, 0.05,
+                                        0.1, 0.25, 0.5, 1, 5),
+}
+
+HELP = {
+    'http_requests_total': "Requests handled, by view, method and status.",
+    'http_request_duration_seconds': "Time spent handling a request.",
+    'http_request_db_queries': "SQL queries run by a request.",
+    'http_request_db_duration_seconds': "Time a request spent in SQL.",
+    'http_template_render_seconds': "Time spent rendering the template "
+                                    "of a response.",
+    'http_response_size_bytes': "Size of non-streaming response bodies.",
+    'polls_vote_writes_avoided_total': "Vote submissions answered without "
+                                       "a database write, by reason.",
+    'polls_vote_buffer_queue_depth': "Votes waiting in the write-behind "
+                                     "buffer.",
+    'polls_vote_buffer_flush_seconds': "Time spent writing a batch of "
+                                       "buffered votes.",
+    'polls_vote_buffer_flushed_votes_total': "Buffered votes written, "
+                                             "coalesced ones included.",
+}
+
+
+class Registry:
+    """
+    Counters, gauges and histograms aggregated in this process.
+
+    Every sample is kept as a running count per label set, so memory only
+    grows with the number of views. Gauges of every process add up. When `directory` is set the totals are
+    also written there every `interval` seconds, one file per process, and
+    snapshot(merge=True) adds up the files of every process.
+    """
+
+    def __init__(self, directory=None, interval=1.0):
+        self.directory = directory
+        self.interval = interval
+        self._counters = {}
+        self._gauges = {}
+        self._histograms = {}
+        self._lock = threading.Lock()
+        self._written = 0.0
+
+    def inc(self, name, labels, amount=1):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def set(self, name, labels, value):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._gauges[key] = value
+
+    def observe(self, name, labels, value):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = {
+                    'buckets': [0] * len(BUCKETS[name]), 'sum': 0.0,
+                    'count': 0}
+            for index, bound in enumerate(BUCKETS[name]):
+                if value <= bound:
+                    histogram['buckets'][index] += 1
+            histogram['sum'] += value
+            histogram['count'] += 1
+
+    def snapshot(self, merge=False):
+        """
+        Return the counters, gauges and histograms as plain, JSON-ready
+        data.
+        """
+        with self._lock:
+            data = {
+                'counters': [[name, list(labels), value] for
+                             (name, labels), value in self._counters.items()],
+                'gauges': [[name, list(labels), value] for
+                           (name, labels), value in self._gauges.items()],
+                'histograms': [[name, list(labels), dict(histogram,
+                                buckets=list(histogram['buckets']))]
+                               for (name, labels), histogram
+                               in self._histograms.items()],
+            }
+        if merge and self.directory:
+            self.write(data)
+            data = _merge(_read_all(self.directory))
+        return data
+
+    def maybe_write(self):
+        """
+        Write this process's totals if `interval` has passed since the last
+        write.
+        """
+        if self.directory and time.monotonic() - self._written >= self.interval:
+            self.write(self.snapshot())
+
+    def write(self, data):
+        self._written = time.monotonic()
+        path = os.path.join(self.directory, f'metrics-{os.getpid()}.json')
+        temporary = f'{path}.tmp'
+        with open(temporary, 'w') as file:
+            json.dump(data, file)
+        os.replace(temporary, path)
+
+
+def _read_all(directory):
+    for path in glob.glob(os.path.join(directory, 'metrics-*.json')):
+        try:
+            with open(path) as file:
+                yield json.load(file)
+        except (OSError, ValueError):
+            continue
+
+
+def _merge(snapshots):
+    counters = {}
+    gauges = {}
+    histograms = {}
+    for snapshot in snapshots:
+        for name, labels, value in snapshot['counters']:
+            key = (name, tuple(map(tuple, labels)))
+            counters[key] = counters.get(key, 0) + value
+        # files written before gauges were added have none
+        for name, labels, value in snapshot.get('gauges', ()):
+            key = (name, tuple(map(tuple, labels)))
+            gauges[key] = gauges.get(key, 0) + value
+        for name, labels, histogram in snapshot['histograms']:
+            key = (name, tuple(map(tuple, labels)))
+            total = histograms.setdefault(key, {
+                'buckets': [0] * len(histogram['buckets']), 'sum': 0.0,
+                'count': 0})
+            total['buckets'] = [a + b for a, b in
+                                zip(total['buckets'], histogram['buckets'])]
+            total['sum'] += histogram['sum']
+            total['count'] += histogram['count']
+    return {
+        'counters': [[name, list(labels), value]
+                     for (name, labels), value in counters.items()],
+        'gauges': [[name, list(labels), value]
+                   for (name, labels), value in gauges.items()],
+        'histograms': [[name, list(labels), histogram]
+                       for (name, labels), histogram in histograms.items()],
+    }
+
+
+def _labels(labels, **extra):
+    pairs = [*labels, *extra.items()]
+    if not pairs:
+        return ''
+    text = ','.join(
+        '{}="{}"'.format(name, str(value).replace('\\', '\\\\')
+                         .replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in pairs)
+    return '{' + text + '}'
+
+
+def exposition(data):
+    """
+    Render a snapshot in the Prometheus text exposition format.
+    """
+    lines = []
+    typed = set()
+
+    def header(name, kind):
+        if name not in typed:
+            typed.add(name)
+            lines.append(f'# HELP {name} {HELP[name]}')
+            lines.append(f'# TYPE {name} {kind}')
+
+    for name, labels, value in sorted(data['counters']):
+        header(name, 'counter')
+        lines.append(f'{name}{_labels(labels)} {value}')
+    for name, labels, value in sorted(data['gauges']):
+        header(name, 'gauge')
+        lines.append(f'{name}{_labels(labels)} {value}')
+    for name, labels, histogram in sorted(data['histograms'],
+                                          key=lambda item: item[:2]):
+        header(name, 'histogram')
+        for bound, count in zip(BUCKETS[name], histogram['buckets']):
+            lines.append(f'{name}_bucket{_labels(labels, le=bound)} {count}')
+        lines.append(f'{name}_bucket{_labels(labels, le="+Inf")} '
+                     f'{histogram["count"]}')
+        lines.append(f'{name}_sum{_labels(labels)} {histogram["sum"]}')
+        lines.append(f'{name}_count{_labels(labels)} {histogram["count"]}')
+    return '\n'.join(lines) + '\n'
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_registry():
+    """
+    Return the metrics registry of this process.
+    """
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            directory = settings.METRICS_DIR or None
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            _registry = Registry(directory)
+    return _registry
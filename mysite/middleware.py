@@ -0,0 +1,261 @@
+import logging
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import (iscoroutinefunction, markcoroutinefunction,
+                          sync_to_async)
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse
+
+from .metrics import get_registry
+from .ratelimit import get_backend, parse_limit
+from .routers import pin_to_primary
+
+logger = logging.getLogger(__name__)
+
+
+class ReplicaPinMiddleware:
+    """
+    Read from the primary database for a while after a user writes.
+
+    A POST (a vote, a signup, a login) runs pinned to the primary and sets
+    a short-lived cookie, so the pages that follow it read the user's own
+    writes before the replicas have caught up.
+    """
+
+    sync_capable = True
+    async_capable = True
+    cookie_name = 'pin_primary'
+    safe_methods = ('GET', 'HEAD', 'OPTIONS', 'TRACE')
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if self._pinned(request):
+            with pin_to_primary():
+                response = self.get_response(request)
+        else:
+            response = self.get_response(request)
+        return self._set_cookie(request, response)
+
+    async def __acall__(self, request):
+        if self._pinned(request):
+            with pin_to_primary():
+                response = await self.get_response(request)
+        else:
+            response = await self.get_response(request)
+        return self._set_cookie(request, response)
+
+    def _pinned(self, request):
+        return (request.method not in self.safe_methods
+                or self.cookie_name in request.COOKIES)
+
+    def _set_cookie(self, request, response):
+        if request.method not in self.safe_methods:
+            response.set_cookie(self.cookie_name, '1',
+                                max_age=settings.DATABASE_REPLICA_PIN_SECONDS,
+                                httponly=True, samesite='Lax')
+        return response
+
+
+# The (duration, sql) list of the queries of the current request. Context
+# variables follow a request into the threads its async views run the ORM
+# in, where the connections are.
+_request_queries = ContextVar('request_queries', default=None)
+
+
+def _record_query(execute, sql, params, many, context):
+    queries = _request_queries.get()
+    if queries is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        queries.append((time.perf_counter() - started, sql))
+
+
+def _install_query_recorder():
+    """
+    Put _record_query on every database connection of this thread, once.
+
+    It goes first in the list, so the execute_wrapper() blocks of other
+    code keep popping their own wrappers.
+    """
+    for connection in connections.all():
+        if _record_query not in connection.execute_wrappers:
+            connection.execute_wrappers.insert(0, _record_query)
+
+
+class MetricsMiddleware:
+    """
+    Record the latency, SQL queries, template render time and response
+    size of every request, labelled by URL name, in the metrics registry.
+
+    Requests slower than METRICS_SLOW_REQUEST_MS are logged with their
+    slowest queries.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        _install_query_recorder()
+        queries = []
+        token = _request_queries.set(queries)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _request_queries.reset(token)
+        self._record(request, response, time.perf_counter() - started,
+                     queries)
+        return response
+
+    async def __acall__(self, request):
+        # the sync thread of this request, which its ORM calls run in
+        await sync_to_async(_install_query_recorder)()
+        queries = []
+        token = _request_queries.set(queries)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _request_queries.reset(token)
+        self._record(request, response, time.perf_counter() - started,
+                     queries)
+        return response
+
+    def _record(self, request, response, duration, queries):
+        match = request.resolver_match
+        view = match.view_name if match else 'unmatched'
+        labels = {'view': view, 'method': request.method}
+        registry = get_registry()
+        registry.inc('http_requests_total',
+                     dict(labels, status=response.status_code))
+        registry.observe('http_request_duration_seconds', labels, duration)
+        registry.observe('http_request_db_queries', labels, len(queries))
+        registry.observe('http_request_db_duration_seconds', labels,
+                         sum(elapsed for elapsed, _ in queries))
+        render = getattr(request, '_metrics_render_time', None)
+        if render is not None:
+            registry.observe('http_template_render_seconds', labels, render)
+        if not response.streaming:
+            registry.observe('http_response_size_bytes', labels,
+                             len(response.content))
+        registry.maybe_write()
+
+        if duration * 1000 >= settings.METRICS_SLOW_REQUEST_MS:
+            slowest = sorted(queries, reverse=True)[:5]
+            logger.warning(
+                "Slow request %s %s (%s) took %.0f ms with %d queries%s",
+                request.method, request.path, view, duration * 1000,
+                len(queries), ''.join(f"\n  {elapsed * 1000:.1f} ms: {sql}"
+                                      for elapsed, sql in slowest))
+
+    def process_template_response(self, request, response):
+        started = time.perf_counter()
+
+        def rendered(response):
+            request._metrics_render_time = time.perf_counter() - started
+
+        response.add_post_render_callback(rendered)
+        return response
+
+
+class RateLimitMiddleware:
+    """
+    Throttle the POST requests of the views named in RATELIMITS with token
+    buckets per user and per client IP.
+
+    A request that finds one of its buckets empty is answered with 429 Too
+    Many Requests and a Retry-After header, before its view runs. The
+    buckets live in RATELIMIT_BACKEND.
+    """
+
+    sync_capable = True
+    async_capable = True
+    safe_methods = ('GET', 'HEAD', 'OPTIONS', 'TRACE')
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+            # an async hook is awaited, a sync one would run in a thread
+            self.process_view = self.aprocess_view
+
+    def __call__(self, request):
+        return self.get_response(request)
+
+    def _limits(self, request):
+        if request.method in self.safe_methods or not settings.RATELIMITS:
+            return ()
+        name = request.resolver_match.view_name
+        return [(name, *parse_limit(limit))
+                for limit in settings.RATELIMITS.get(name, ())]
+
+    def _client_ip(self, request):
+        # each proxy appends the address it got the request from, so only
+        # the entries added by the trusted proxies, counted from the
+        # right, cannot be forged by the client
+        addresses = request.META.get(settings.RATELIMIT_CLIENT_IP_HEADER,
+                                     '').split(',')
+        trusted = max(settings.RATELIMIT_TRUSTED_PROXIES, 1)
+        return addresses[-min(trusted, len(addresses))].strip()
+
+    def _bucket_key(self, request, name, key, user_id):
+        if key == 'user' and user_id is not None:
+            return f'{name}:user:{user_id}'
+        return f'{name}:ip:{self._client_ip(request)}'
+
+    def _backend(self):
+        return get_backend(settings.RATELIMIT_BACKEND,
+                           tuple(settings.RATELIMIT_OPTIONS.items()))
+
+    def _too_many(self, wait):
+        response = HttpResponse("Too many requests, try again later.",
+                                status=429, content_type='text/plain')
+        response['Retry-After'] = str(int(wait) + 1)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        limits = self._limits(request)
+        if not limits:
+            return None
+        user_id = None
+        if any(key == 'user' for _, key, _, _ in limits):
+            user_id = request.user.pk
+        backend = self._backend()
+        wait = max(backend.take(self._bucket_key(request, name, key, user_id),
+                                rate, capacity)
+                   for name, key, rate, capacity in limits)
+        return self._too_many(wait) if wait else None
+
+    async def aprocess_view(self, request, view_func, view_args, view_kwargs):
+        limits = self._limits(request)
+        if not limits:
+            return None
+        user_id = None
+        if any(key == 'user' for _, key, _, _ in limits):
+            user_id = await sync_to_async(lambda: request.user.pk)()
+        backend = self._backend()
+        wait = 0
+        for name, key, rate, capacity in limits:
+            wait = max(wait, await backend.atake(
+                self._bucket_key(request, name, key, user_id), rate, capacity))
+        return self._too_many(wait) if wait else None
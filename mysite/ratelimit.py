@@ -0,0 +1,103 @@
+import functools
+import threading
+import time
+
+from django.core.cache import caches
+from django.utils.module_loading import import_string
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600}
+
+
+@functools.lru_cache(maxsize=None)
+def parse_limit(limit):
+    """
+    Return the (key, rate per second, capacity) of a limit such as
+    'ip:10/m', which lets ten requests through at once and refills one
+    token every six seconds.
+    """
+    key, _, rate = limit.partition(':')
+    count, _, period = rate.partition('/')
+    if key not in ('user', 'ip') or period not in PERIODS:
+        raise ValueError(f"Invalid rate limit {limit!r}")
+    count = int(count)
+    return key, count / PERIODS[period], count
+
+
+def refill(bucket, rate, capacity, now):
+    """
+    Take a token from a (tokens, updated) bucket.
+
+    Returns the new bucket and how many seconds to wait before a token is
+    available, 0 when one was taken.
+    """
+    tokens, updated = bucket if bucket is not None else (capacity, now)
+    tokens = min(capacity, tokens + (now - updated) * rate)
+    if tokens >= 1:
+        return (tokens - 1, now), 0
+    return (tokens, now), (1 - tokens) / rate
+
+
+class LocalBackend:
+    """
+    Token buckets in the memory of this process.
+
+    The fastest backend, but every worker process counts on its own, so
+    the effective limit is multiplied by the number of workers. Buckets
+    that have filled up again are dropped once `max_keys` are kept.
+    """
+
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def take(self, key, rate, capacity):
+        now = time.monotonic()
+        with self._lock:
+            bucket, wait = refill(self._buckets.get(key), rate, capacity, now)
+            self._buckets[key] = bucket
+            if len(self._buckets) > self.max_keys:
+                self._prune(rate, capacity, now)
+        return wait
+
+    async def atake(self, key, rate, capacity):
+        return self.take(key, rate, capacity)
+
+    def _prune(self, rate, capacity, now):
+        full_after = capacity / rate
+        self._buckets = {key: bucket for key, bucket in self._buckets.items()
+                         if now - bucket[1] < full_after}
+
+
+class CacheBackend:
+    """
+    Token buckets in a Django cache, shared by every process that uses it.
+
+    A bucket is read and written back without a lock, so concurrent
+    requests of one client may occasionally both get the last token.
+    """
+
+    def __init__(self, alias='default'):
+        self.cache = caches[alias]
+
+    def take(self, key, rate, capacity):
+        key = f'ratelimit:{key}'
+        bucket, wait = refill(self.cache.get(key), rate, capacity, time.time())
+        self.cache.set(key, bucket, int(capacity / rate) + 1)
+        return wait
+
+    async def atake(self, key, rate, capacity):
+        key = f'ratelimit:{key}'
+        bucket, wait = refill(await self.cache.aget(key), rate, capacity,
+                              time.time())
+        await self.cache.aset(key, bucket, int(capacity / rate) + 1)
+        return wait
+
+
+@functools.lru_cache(maxsize=None)
+def get_backend(path, options):
+    """
+    Return the backend instance of a dotted path and frozen options, one
+    per process.
+    """
+    return import_string(path)(**dict(options))
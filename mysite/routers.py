@@ -0,0 +1,54 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+import random
+
+from django.conf import settings
+from django.db import connections
+
+# True while reads must see the primary, see ReplicaPinMiddleware
+_pinned = ContextVar('pinned_to_primary', default=False)
+
+
+@contextmanager
+def pin_to_primary():
+    """
+    Send every read inside the block to the primary database.
+    """
+    token = _pinned.set(True)
+    try:
+        yield
+    finally:
+        _pinned.reset(token)
+
+
+class ReplicaRouter:
+    """
+    Send writes to `default` and spread reads over the read replicas.
+
+    The replicas are the databases whose alias starts with `replica`. Reads
+    stay on the primary when there is no replica, inside a transaction on
+    the primary, and while pinned by pin_to_primary().
+    """
+
+    primary = 'default'
+
+    def replicas(self):
+        return [alias for alias in settings.DATABASES
+                if alias.startswith('replica')]
+
+    def db_for_read(self, model, **hints):
+        replicas = self.replicas()
+        if (not replicas or _pinned.get()
+                or connections[self.primary].in_atomic_block):
+            return self.primary
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        return self.primary
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # the replicas hold the same rows as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        return db == self.primary
@@ -43,6 +43,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'mysite.middleware.MetricsMiddleware',
+    'mysite.middleware.ReplicaPinMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -50,21 +52,32 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'mysite.middleware.RateLimitMiddleware',
 ]
 
 ROOT_URLCONF = 'mysite.urls'
 
+TEMPLATE_LOADERS = [
+    'django.template.loaders.filesystem.Loader',
+    'django.template.loaders.app_directories.Loader',
+]
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [BASE_DIR / 'templates'],
-        'APP_DIRS': True,
         'OPTIONS': {
             'context_processors': [
                 'django.template.context_processors.debug',
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'polls.caching.fragment_cache_timeout',
+            ],
+            # compiled templates are kept in memory unless debugging, so
+            # edits still show up without a restart during development
+            'loaders': TEMPLATE_LOADERS if DEBUG else [
+                ('django.template.loaders.cached.Loader', TEMPLATE_LOADERS),
             ],
         },
     },
@@ -76,13 +89,201 @@ WSGI_APPLICATION = 'mysite.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
 
+# The SQLite backend in mysite.backends runs the PRAGMAs below on every new
+# connection. WAL lets readers carry on while a vote is written, and
+# busy_timeout makes a writer wait for the lock instead of failing with
+# "database is locked". Connections are kept for CONN_MAX_AGE seconds
+# (0 closes them after every request) and checked before reuse.
+
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'ENGINE': 'mysite.backends.sqlite3',
+        'NAME': config('DATABASE_NAME', default=str(BASE_DIR / 'db.sqlite3')),
+        'CONN_MAX_AGE': config('DATABASE_CONN_MAX_AGE', cast=int,
+                               default=600),
+        'CONN_HEALTH_CHECKS': config('DATABASE_CONN_HEALTH_CHECKS',
+                                     cast=bool, default=True),
+        'OPTIONS': {
+            'pragmas': {
+                'journal_mode': config('SQLITE_JOURNAL_MODE', default='wal'),
+                'synchronous': config('SQLITE_SYNCHRONOUS',
+                                      default='normal'),
+                'busy_timeout': config('SQLITE_BUSY_TIMEOUT_MS', cast=int,
+                                       default=5000),
+                'mmap_size': config('SQLITE_MMAP_SIZE', cast=int,
+                                    default=256 * 1024 * 1024),
+                # negative sizes are in KiB
+                'cache_size': config('SQLITE_CACHE_SIZE', cast=int,
+                                     default=-20000),
+            },
+        },
+        'TEST': {
+            # a file rather than memory, so test threads can share it
+            'NAME': config('DATABASE_TEST_NAME',
+                           default=str(BASE_DIR / 'test_db.sqlite3')),
+        },
     }
 }
 
+# Read replicas, a comma-separated list of SQLite files kept in step with
+# the primary by an outside tool. Each becomes a `replicaN` database that
+# mysite.routers.ReplicaRouter sends reads to; other engines can be added
+# to DATABASES under an alias starting with `replica`. After a write, the
+# user reads from the primary for DATABASE_REPLICA_PIN_SECONDS.
+DATABASE_REPLICAS = config('DATABASE_REPLICAS', cast=Csv(), default='')
+for number, replica in enumerate(DATABASE_REPLICAS, 1):
+    DATABASES[f'replica{number}'] = {
+        **DATABASES['default'],
+        'NAME': replica,
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['mysite.routers.ReplicaRouter']
+
+DATABASE_REPLICA_PIN_SECONDS = config('DATABASE_REPLICA_PIN_SECONDS',
+                                      cast=int, default=10)
+
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': config(
+            'CACHE_BACKEND',
+            default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', default='ku-polls'),
+    }
+}
+
+# With several workers on one host, mysite.cache.SharedMemoryCache keeps
+# one cache for all of them in the file named by CACHE_LOCATION, ideally
+# under /dev/shm: CACHE_MAX_ENTRIES slots of CACHE_SLOT_SIZE bytes, values
+# larger than a slot are not cached.
+if CACHES['default']['BACKEND'] == 'mysite.cache.SharedMemoryCache':
+    CACHES['default']['OPTIONS'] = {
+        'MAX_ENTRIES': config('CACHE_MAX_ENTRIES', cast=int, default=2048),
+        'SLOT_SIZE': config('CACHE_SLOT_SIZE', cast=int, default=16384),
+    }
+
+# How long computed poll results stay cached, in seconds. Results are also
+# invalidated whenever a vote is committed.
+POLLS_RESULTS_CACHE_TIMEOUT = config('POLLS_RESULTS_CACHE_TIMEOUT',
+                                     cast=int, default=300)
+
+# How long a submitted vote form is remembered, in seconds. Submitting the
+# same form again for the same choice within it writes nothing.
+POLLS_VOTE_TOKEN_TIMEOUT = config('POLLS_VOTE_TOKEN_TIMEOUT', cast=int,
+                                  default=3600)
+
+# How long anonymous visitors are served a cached copy of the polls index,
+# detail and results pages, in seconds, 0 to turn it off. Pages are also
+# invalidated when a question is edited or voted on, and the index when
+# one of its polls closes.
+POLLS_PAGE_CACHE_TIMEOUT = config('POLLS_PAGE_CACHE_TIMEOUT', cast=int,
+                                  default=60)
+
+# How long rendered question cards and choice lists stay cached, in
+# seconds. They are keyed on the question version, so never go stale.
+POLLS_FRAGMENT_CACHE_TIMEOUT = config('POLLS_FRAGMENT_CACHE_TIMEOUT',
+                                      cast=int, default=3600)
+
+# Longest time, in seconds, between two looks for poll status transitions
+# by `manage.py run_schedule`, and how long requests trust the cached time
+# of the next one, so edits that bypass Question.save() are still seen.
+POLLS_SCHEDULE_INTERVAL = config('POLLS_SCHEDULE_INTERVAL', cast=int,
+                                 default=60)
+
+# How long clients and proxies may cache the JSON results of a closed
+# poll, in seconds. Open polls are always revalidated with their ETag.
+POLLS_API_CLOSED_MAX_AGE = config('POLLS_API_CLOSED_MAX_AGE', cast=int,
+                                  default=86400)
+
+# Serve the poll detail, results and vote pages with async views. Only
+# useful when the site runs under an ASGI server such as uvicorn.
+POLLS_ASYNC_VIEWS = config('POLLS_ASYNC_VIEWS', cast=bool, default=False)
+
+# Live results over Server-Sent Events. Each process checks the results
+# version of a watched question every POLL_MS milliseconds, sends a
+# heartbeat after HEARTBEAT_SECONDS of silence and tells clients to
+# reconnect after RETRY_MS milliseconds.
+POLLS_STREAM_POLL_MS = config('POLLS_STREAM_POLL_MS', cast=int, default=200)
+POLLS_STREAM_HEARTBEAT_SECONDS = config('POLLS_STREAM_HEARTBEAT_SECONDS',
+                                        cast=int, default=15)
+POLLS_STREAM_RETRY_MS = config('POLLS_STREAM_RETRY_MS', cast=int,
+                               default=3000)
+
+# Number of questions on each page of the polls index.
+POLLS_INDEX_PAGE_SIZE = config('POLLS_INDEX_PAGE_SIZE', cast=int, default=5)
+
+# Number of questions on each page of search results.
+POLLS_SEARCH_PAGE_SIZE = config('POLLS_SEARCH_PAGE_SIZE', cast=int,
+                                default=10)
+
+# Write-behind vote buffer. When enabled, votes are queued in memory and
+# written in batches every FLUSH_MS milliseconds or MAX_BATCH votes. Set
+# JOURNAL to a file path to keep queued votes across crashes (each worker
+# process needs its own path), and FSYNC to also sync every vote to disk
+# before it is accepted.
+POLLS_VOTE_BUFFER_ENABLED = config('POLLS_VOTE_BUFFER_ENABLED',
+                                   cast=bool, default=False)
+POLLS_VOTE_BUFFER_FLUSH_MS = config('POLLS_VOTE_BUFFER_FLUSH_MS',
+                                    cast=int, default=200)
+POLLS_VOTE_BUFFER_MAX_BATCH = config('POLLS_VOTE_BUFFER_MAX_BATCH',
+                                     cast=int, default=200)
+POLLS_VOTE_BUFFER_JOURNAL = config('POLLS_VOTE_BUFFER_JOURNAL', default='')
+POLLS_VOTE_BUFFER_FSYNC = config('POLLS_VOTE_BUFFER_FSYNC',
+                                 cast=bool, default=False)
+
+# Append-only log of every vote cast, changed or deleted, as NDJSON
+# segments in this directory (empty to turn it off), rotated every
+# SEGMENT_BYTES. Each process writes its own segments, after a baseline of
+# the votes cast before the log was started; replay them with
+# `manage.py replay_votes` and `manage.py vote_timeline`. FSYNC syncs every
+# batch to disk before the vote is answered.
+POLLS_VOTE_LOG_DIR = config('POLLS_VOTE_LOG_DIR', default='')
+POLLS_VOTE_LOG_SEGMENT_BYTES = config('POLLS_VOTE_LOG_SEGMENT_BYTES',
+                                      cast=int, default=64 * 1024 * 1024)
+POLLS_VOTE_LOG_FSYNC = config('POLLS_VOTE_LOG_FSYNC', cast=bool,
+                              default=False)
+
+
+# Token-bucket rate limits of the POST requests of views, by URL name.
+# Each limit is "<user|ip>:<count>/<s|m|h>": a bucket of `count` tokens per
+# user (per IP for anonymous users) or per client IP, refilled at `count`
+# tokens per period. RATELIMIT_BACKEND keeps the buckets, either
+# mysite.ratelimit.LocalBackend, per process, or
+# mysite.ratelimit.CacheBackend, shared through the cache named by
+# RATELIMIT_OPTIONS = {'alias': ...}, such as a SharedMemoryCache. Behind
+# proxies, set RATELIMIT_CLIENT_IP_HEADER to the META key of the client
+# address, such as HTTP_X_FORWARDED_FOR, and RATELIMIT_TRUSTED_PROXIES to
+# the number of proxies that append to it: the client address is taken
+# that many entries from the right, as the entries before it are sent by
+# the client.
+RATELIMITS = {
+    'polls:vote': ['user:30/m', 'ip:300/m'],
+    'login': ['ip:10/m'],
+    'polls:login': ['ip:10/m'],
+    'signup': ['ip:5/m'],
+    'polls:signup': ['ip:5/m'],
+} if config('RATELIMIT_ENABLED', cast=bool, default=True) else {}
+RATELIMIT_BACKEND = config('RATELIMIT_BACKEND',
+                           default='mysite.ratelimit.LocalBackend')
+RATELIMIT_OPTIONS = {}
+RATELIMIT_CLIENT_IP_HEADER = config('RATELIMIT_CLIENT_IP_HEADER',
+                                    default='REMOTE_ADDR')
+RATELIMIT_TRUSTED_PROXIES = config('RATELIMIT_TRUSTED_PROXIES', cast=int,
+                                   default=1)
+
+# Request metrics, served at /metrics to staff users and to scrapers that
+# send METRICS_TOKEN as a bearer token. Set METRICS_DIR to a directory
+# shared by the worker processes to report their combined totals.
+# Requests slower than METRICS_SLOW_REQUEST_MS are logged with their
+# slowest queries.
+METRICS_TOKEN = config('METRICS_TOKEN', default='')
+METRICS_DIR = config('METRICS_DIR', default='')
+METRICS_SLOW_REQUEST_MS = config('METRICS_SLOW_REQUEST_MS', cast=int,
+                                 default=200)
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -109,9 +310,18 @@ AUTH_PASSWORD_VALIDATORS = [
 ]
 
 AUTHENTICATION_BACKENDS = [
-    'django.contrib.auth.backends.ModelBackend',
+    'polls.auth.CachedModelBackend',
 ]
 
+# How long the user of a session stays cached, in seconds.
+POLLS_USER_CACHE_TIMEOUT = config('POLLS_USER_CACHE_TIMEOUT', cast=int,
+                                  default=300)
+
+# Where sessions are kept: cached_db (the cache, backed by the database),
+# signed_cookies (in the browser, no storage at all), cache or db.
+SESSION_ENGINE = ('django.contrib.sessions.backends.'
+                  + config('SESSION_BACKEND', default='cached_db'))
+
 LOGIN_REDIRECT_URL = 'polls:index'
 LOGOUT_REDIRECT_URL = 'login'
 
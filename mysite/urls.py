@@ -14,15 +14,18 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+from django.conf import settings
 from django.contrib import admin
 from django.urls import include, path
 from django.views.generic import RedirectView
 from . import views
 
 urlpatterns = [
-    path('polls/', include('polls.urls')),
+    path('polls/', include('polls.async_urls' if settings.POLLS_ASYNC_VIEWS
+                           else 'polls.urls')),
     path('admin/', admin.site.urls),
     path('accounts/', include('django.contrib.auth.urls')),
     path("", RedirectView.as_view(url="polls/")),
-    path('signup/', views.signup, name="signup")
+    path('signup/', views.signup, name="signup"),
+    path('metrics', views.metrics, name='metrics'),
 ]
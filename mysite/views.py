@@ -1,8 +1,14 @@
 
+import hmac
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
 from django.shortcuts import render, redirect
 from django.contrib.auth import login, authenticate
 from django.contrib.auth.forms import UserCreationForm
 
+from .metrics import exposition, get_registry
+
 
 def signup(request):
     """Register a new user."""
@@ -23,3 +29,19 @@ def signup(request):
         # create a user form and display it the signup page
         form = UserCreationForm()
     return render(request, 'registration/signup.html', {'form': form})
+
+
+def metrics(request):
+    """
+    Show the request metrics in the Prometheus text format.
+
+    Open to staff users, and to scrapers that send the METRICS_TOKEN as a
+    bearer token.
+    """
+    token = settings.METRICS_TOKEN
+    authorization = request.headers.get('Authorization', '')
+    if not (request.user.is_staff or (token and hmac.compare_digest(
+            authorization, f'Bearer {token}'))):
+        return HttpResponseForbidden()
+    return HttpResponse(exposition(get_registry().snapshot(merge=True)),
+                        content_type='text/plain; version=0.0.4')
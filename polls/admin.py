@@ -1,5 +1,213 @@
-from django.contrib import admin
+from django.contrib import admin, messages
+from django.core.paginator import Paginator
+from django.db import DatabaseError, connections
+from django.utils import timezone
+from django.utils.functional import cached_property
 
-from .models import Question
+from .caching import bump_index_version
+from .models import Choice, Question, ResultSnapshot, Vote
+from .results import bump_results_version
+from .votelog import get_vote_log, record_votes
+from .voting import immediate_atomic, recount_tallies
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator that does not COUNT(*) a whole table.
+
+    An unfiltered list is counted from the table statistics on
+    PostgreSQL. Elsewhere rows are counted up to `count_limit`, and a
+    larger table is counted from the sqlite_stat1 statistics that ANALYZE
+    writes, or as just over the limit when there are none. Filtered lists
+    are counted as usual.
+    """
+    count_limit = 10000
+
+    @cached_property
+    def count(self):
+        query = self.object_list.query
+        if query.where:
+            return super().count
+        table = self.object_list.model._meta.db_table
+        connection = connections[self.object_list.db]
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT reltuples FROM pg_class "
+                               "WHERE relname = %s", [table])
+                row = cursor.fetchone()
+            return max(int(row[0]), 0) if row else 0
+        counted = self.object_list.order_by()[:self.count_limit + 1].count()
+        if counted <= self.count_limit:
+            return counted
+        return max(self._analyzed_count(connection, table), counted)
+
+    def _analyzed_count(self, connection, table):
+        if connection.vendor != 'sqlite':
+            return 0
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT stat FROM sqlite_stat1 WHERE tbl = %s "
+                               "LIMIT 1", [table])
+                row = cursor.fetchone()
+        except DatabaseError:
+            # ANALYZE was never run
+            return 0
+        return int(row[0].split()[0]) if row else 0
+
+
+class ChoiceInline(admin.TabularInline):
+    model = Choice
+    extra = 1
+    fields = ['choice_text', 'votes']
+    readonly_fields = ['votes']
+
+
+@admin.register(Question)
+class QuestionAdmin(admin.ModelAdmin):
+    list_display = ['question_text', 'pub_date', 'end_date', 'status',
+                    'live_total', 'tally_shards']
+    list_filter = ['status', 'pub_date', 'end_date']
+    search_fields = ['question_text']
+    date_hierarchy = 'pub_date'
+    readonly_fields = ['status', 'total_votes']
+    inlines = [ChoiceInline]
+    actions = ['close_now', 'reset_votes', 'recount']
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).with_live_total()
+
+    @admin.display(description="Votes", ordering='live_total_votes')
+    def live_total(self, question):
+        return question.live_total_votes
+
+    @admin.action(description="Close the selected polls now")
+    def close_now(self, request, queryset):
+        # the ids are taken first, as closing can drop the polls out of
+        # the changelist filters
+        # scheduled polls are left alone, closing them would publish them
+        now = timezone.now()
+        selected = list(queryset.values_list('id', 'pub_date'))
+        question_ids = [question_id for question_id, pub_date in selected
+                        if pub_date <= now]
+        closed = Question.objects.filter(pk__in=question_ids).update(
+            end_date=now, status=Question.Status.CLOSED)
+        invalidate_questions(question_ids)
+        self.message_user(request, f"Closed {closed} polls.",
+                          messages.SUCCESS)
+        skipped = len(selected) - len(question_ids)
+        if skipped:
+            self.message_user(request, f"Skipped {skipped} polls that are "
+                              f"not published yet.", messages.WARNING)
+
+    @admin.action(description="Delete every vote of the selected polls")
+    def reset_votes(self, request, queryset):
+        # the votes of archived polls are no longer in the Vote table, and
+        # their frozen results are kept
+        selected = list(queryset.values_list('id', 'snapshot__archived'))
+        question_ids = [question_id for question_id, archived in selected
+                        if not archived]
+        votes = Vote.objects.filter(question__in=question_ids)
+        with immediate_atomic():
+            record_deletions(votes)
+            deleted, _ = votes.delete()
+            ResultSnapshot.objects.filter(question__in=question_ids).delete()
+            recount_tallies(Question.objects.filter(pk__in=question_ids))
+        invalidate_questions(question_ids)
+        self.message_user(request, f"Deleted {deleted} votes.",
+                          messages.SUCCESS)
+        skipped = len(selected) - len(question_ids)
+        if skipped:
+            self.message_user(request, f"Skipped {skipped} archived polls.",
+                              messages.WARNING)
+
+    @admin.action(description="Recount the tallies of the selected polls")
+    def recount(self, request, queryset):
+        question_ids = list(queryset.exclude(snapshot__archived=True)
+                            .values_list('id', flat=True))
+        recounted = recount_tallies(
+            Question.objects.filter(pk__in=question_ids))
+        invalidate_questions(question_ids)
+        self.message_user(request, f"Recounted {recounted} polls.",
+                          messages.SUCCESS)
+
+
+def invalidate_questions(question_ids):
+    """
+    Drop the cached results and pages of questions changed in bulk.
+    """
+    for question_id in question_ids:
+        bump_results_version(question_id)
+    bump_index_version()
+
+
+def record_deletions(votes):
+    """
+    Log the deletion of votes about to be deleted in bulk.
+    """
+    if get_vote_log() is None:
+        return
+    record_votes([(user_id, question_id, None, choice_id)
+                  for user_id, question_id, choice_id in votes.values_list(
+                      'user_id', 'question_id', 'choice_id').iterator()])
+
+
+@admin.register(Choice)
+class ChoiceAdmin(admin.ModelAdmin):
+    list_display = ['choice_text', 'question', 'live_votes']
+    list_select_related = ['question']
+    search_fields = ['choice_text', 'question__question_text']
+    autocomplete_fields = ['question']
+    readonly_fields = ['votes']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).with_live_votes()
+
+    @admin.display(description="Votes", ordering='live_votes')
+    def live_votes(self, choice):
+        return choice.live_votes
+
+
+@admin.register(Vote)
+class VoteAdmin(admin.ModelAdmin):
+    list_display = ['id', 'user', 'question', 'choice']
+    list_select_related = ['user', 'question', 'choice']
+    # prefix and exact matches can use the username and primary key indexes
+    search_fields = ['^user__username', '=question__id']
+    raw_id_fields = ['user', 'question', 'choice']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    ordering = ['-id']
+
+    # votes are only cast through the site, which keeps the tallies in
+    # step; deleting them here recounts the polls they belonged to
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def delete_model(self, request, obj):
+        self.delete_queryset(request, Vote.objects.filter(pk=obj.pk))
+
+    def delete_queryset(self, request, queryset):
+        question_ids = set(queryset.values_list('question_id', flat=True))
+        with immediate_atomic():
+            record_deletions(queryset)
+            queryset.delete()
+            ResultSnapshot.objects.filter(question__in=question_ids,
+                                          archived=False).delete()
+            recount_tallies(Question.objects.filter(pk__in=question_ids)
+                            .exclude(snapshot__archived=True))
+        invalidate_questions(question_ids)
+
+
+@admin.register(ResultSnapshot)
+class ResultSnapshotAdmin(admin.ModelAdmin):
+    list_display = ['question', 'total_votes', 'finalized_at', 'archived']
+    list_select_related = ['question']
+    list_filter = ['archived']
+    readonly_fields = ['question', 'choices', 'total_votes', 'finalized_at',
+                       'archived']
 
-admin.site.register(Question)
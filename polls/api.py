@@ -0,0 +1,98 @@
+from django.conf import settings
+from django.http import JsonResponse
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition, require_safe
+
+from .models import Question
+from .results import get_results, results_modified, results_version
+from .views import (encode_cursor, encode_search_cursor, question_page,
+                    search_page)
+
+
+@require_safe
+def questions(request):
+    """
+    List published questions as JSON, newest first, a page at a time.
+
+    Takes the same `status` and `cursor` parameters as the polls index.
+    """
+    page, has_next = question_page(request.GET,
+                                   Question.objects.with_live_total())
+    data = {
+        'questions': [{
+            'id': question.id,
+            'question_text': question.question_text,
+            'pub_date': question.pub_date,
+            'end_date': question.end_date,
+            'is_open': question.is_open,
+            'total_votes': question.live_total_votes,
+            'results_url': reverse('polls:api-results', args=(question.id,)),
+        } for question in page],
+        'next_cursor': None,
+    }
+    if has_next:
+        data['next_cursor'] = encode_cursor(page[-1])
+    return JsonResponse(data)
+
+
+@require_safe
+def search(request):
+    """
+    List the published questions matching the `q` parameter as JSON, best
+    match first, a page at a time.
+
+    Takes the same `q` and `cursor` parameters as the search page.
+    """
+    page, has_next = search_page(request.GET)
+    data = {
+        'questions': [{
+            'id': question.id,
+            'question_text': question.question_text,
+            'pub_date': question.pub_date,
+            'end_date': question.end_date,
+            'is_open': question.is_open,
+            'rank': question.search_rank,
+            'results_url': reverse('polls:api-results', args=(question.id,)),
+        } for question in page],
+        'next_cursor': None,
+    }
+    if has_next:
+        data['next_cursor'] = encode_search_cursor(page[-1])
+    return JsonResponse(data)
+
+
+def results_etag(request, pk):
+    """
+    Strong ETag of the results of a question, read from the cache only.
+    """
+    return f'{pk}-{results_version(pk)}'
+
+
+def results_last_modified(request, pk):
+    """
+    When the results of a question last changed, read from the cache only.
+    """
+    return results_modified(pk)
+
+
+@require_safe
+@condition(etag_func=results_etag, last_modified_func=results_last_modified)
+def results(request, pk):
+    """
+    Return the tallies of a question as JSON.
+
+    Conditional requests are answered from the results version in the
+    cache, so a client that is up to date gets a 304 without a query.
+    Closed polls cannot change any more and may be cached for a long time.
+    """
+    data = get_results(pk)
+    response = JsonResponse(data)
+    end_date = data['end_date']
+    if end_date is not None and end_date <= timezone.now():
+        patch_cache_control(response, public=True,
+                            max_age=settings.POLLS_API_CLOSED_MAX_AGE)
+    else:
+        patch_cache_control(response, no_cache=True)
+    return response
@@ -0,0 +1,18 @@
+from django.urls import path
+
+from . import async_views
+from .urls import app_name, urlpatterns as sync_urlpatterns  # noqa: F401
+
+# The polls URLs with the detail, results and vote pages served by the
+# async views. Used instead of polls.urls when POLLS_ASYNC_VIEWS is on.
+async_views_by_name = {
+    'detail': path('<int:pk>/', async_views.detail, name='detail'),
+    'results': path('<int:pk>/results/', async_views.results,
+                    name='results'),
+    'vote': path('<int:question_id>/vote/', async_views.vote, name='vote'),
+}
+
+urlpatterns = [
+    async_views_by_name.get(getattr(pattern, 'name', None), pattern)
+    for pattern in sync_urlpatterns
+]
@@ -0,0 +1,142 @@
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.contrib import messages
+from django.contrib.auth.views import redirect_to_login
+from django.core.handlers.asgi import ASGIRequest
+from django.http import Http404, HttpResponseRedirect, StreamingHttpResponse
+from django.shortcuts import redirect, render
+from django.urls import reverse
+
+from .buffer import get_vote_buffer
+from .caching import anonymous_page_cache
+from .models import Choice, Question
+from .results import aget_results, aresults_version, results_version
+from .schedule import advance, current_results_version
+from .streams import results_events, results_snapshot_events
+from .voting import (aclaim_vote_token, cast_vote, count_avoided_writes,
+                     release_vote_token)
+
+
+def async_login_required(view):
+    """
+    login_required for async views.
+
+    Loading request.user reads the session and the user from the database,
+    so it is done in the sync thread pool.
+    """
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        is_authenticated = await sync_to_async(
+            lambda: request.user.is_authenticated)()
+        if not is_authenticated:
+            return redirect_to_login(request.get_full_path())
+        return await view(request, *args, **kwargs)
+    return wrapper
+
+
+@anonymous_page_cache(lambda pk: current_results_version(pk))
+async def detail(request, pk):
+    """
+    Async version of DetailView.
+    """
+    await sync_to_async(advance)()
+    try:
+        question = await Question.objects.published().aget(pk=pk)
+    except Question.DoesNotExist:
+        raise Http404("No question found matching the query")
+    choices = [choice async for choice in question.choice_set.all()]
+    return render(request, 'polls/detail.html', {
+        'question': question,
+        'choices': choices,
+        'question_version': await aresults_version(pk),
+    })
+
+
+@anonymous_page_cache(lambda pk: results_version(pk))
+async def results(request, pk):
+    """
+    Async version of ResultsView.
+    """
+    return render(request, 'polls/results.html', {
+        'results': await aget_results(pk),
+    })
+
+
+async def results_stream(request, pk):
+    """
+    Stream the results of a question as Server-Sent Events.
+
+    Under WSGI the response is a short sync stream with a single snapshot,
+    as an endless one would block a worker for as long as the page is
+    open.
+    """
+    if not await Question.objects.filter(pk=pk).aexists():
+        raise Http404("No question found matching the query")
+    last_event_id = request.headers.get('Last-Event-ID')
+    if isinstance(request, ASGIRequest):
+        events = results_events(pk, last_event_id)
+    else:
+        events = results_snapshot_events(pk, last_event_id)
+    return StreamingHttpResponse(events, content_type='text/event-stream',
+                                 headers={'Cache-Control': 'no-cache',
+                                          'X-Accel-Buffering': 'no'})
+
+
+@async_login_required
+async def vote(request, question_id):
+    """
+    Async version of vote. Only the transaction that records the vote runs
+    in the sync thread pool.
+    """
+    this_user = request.user
+    token = request.POST.get('vote_token')
+    choice_id = request.POST.get('choice')
+    results_url = reverse("polls:results", args=(question_id,))
+    if not await aclaim_vote_token(this_user.id, token, choice_id):
+        count_avoided_writes('duplicate')
+        return HttpResponseRedirect(results_url)
+    # a submission turned down below can be sent again
+    release = sync_to_async(release_vote_token)
+    try:
+        question = await Question.objects.aget(pk=question_id)
+    except Question.DoesNotExist:
+        await release(this_user.id, token, choice_id)
+        raise Http404("No question found matching the query")
+
+    if not question.can_vote():
+        await release(this_user.id, token, choice_id)
+        messages.error(request, f"Poll number {question.id}"
+                                f"id not available to vote")
+        return redirect("polls:index")
+
+    try:
+        selected_choice = await (question.choice_set.with_voted(this_user)
+                                 .aget(pk=request.POST['choice']))
+    except (KeyError, Choice.DoesNotExist):
+        await release(this_user.id, token, choice_id)
+        return render(request, 'polls/detail.html', {
+            'question': question,
+            'choices': [choice async for choice in question.choice_set.all()],
+            'question_version': await aresults_version(question.id),
+            'error_message': "You didn't select a choice.",
+        })
+
+    buffer = get_vote_buffer()
+    if buffer is not None:
+        # a newer choice may still be waiting in the buffer
+        # the journal write can block on fsync
+        await sync_to_async(buffer.submit)(this_user.id, question.id,
+                                           selected_choice.id)
+    elif selected_choice.voted:
+        count_avoided_writes('unchanged')
+    else:
+        try:
+            changed = await sync_to_async(cast_vote)(this_user, question,
+                                                     selected_choice)
+        except Exception:
+            await release(this_user.id, token, choice_id)
+            raise
+        if not changed:
+            count_avoided_writes('unchanged')
+    return HttpResponseRedirect(results_url)
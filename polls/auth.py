@@ -0,0 +1,29 @@
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+
+
+def user_cache_key(user_id):
+    return f'polls:user:{user_id}'
+
+
+class CachedModelBackend(ModelBackend):
+    """
+    ModelBackend that loads the user of a session from the cache.
+
+    AuthenticationMiddleware looks the user up on every request that
+    touches request.user. The user is kept in the cache for
+    POLLS_USER_CACHE_TIMEOUT seconds and dropped whenever it is saved,
+    deleted or logs out, see polls.signals.
+    """
+
+    def get_user(self, user_id):
+        key = user_cache_key(user_id)
+        user = cache.get(key)
+        if user is None:
+            user = super().get_user(user_id)
+            if user is not None:
+                cache.set(key, user, settings.POLLS_USER_CACHE_TIMEOUT)
+        elif not self.user_can_authenticate(user):
+            return None
+        return user
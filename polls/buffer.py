@@ -0,0 +1,228 @@
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection
+
+from mysite.metrics import get_registry
+
+from .voting import count_avoided_writes, write_votes
+
+logger = logging.getLogger(__name__)
+
+
+class VoteBuffer:
+    """
+    Accepts votes in memory and writes them to the database in batches.
+
+    Votes are coalesced per (user, question), so only the last choice of
+    a user survives until the next flush. A background thread flushes
+    every `flush_interval` seconds, or as soon as `max_batch` votes are
+    waiting. When `journal` is a file path every accepted vote is also
+    appended to it (and fsynced when `fsync` is True), and votes left in
+    the journal by a crashed process are queued again on start. The queue
+    depth and flush times are also exported to the metrics registry.
+    """
+
+    def __init__(self, flush_interval=0.2, max_batch=500, journal=None,
+                 fsync=False):
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.journal = journal
+        self.fsync = fsync
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+        self._journal_file = None
+        self._flushing_journals = []
+        self.flushed_votes = 0
+        self.written_votes = 0
+        self.flushes = 0
+        self.last_flush_size = 0
+        self.last_flush_latency = 0.0
+        if journal:
+            self._recover()
+            self._journal_file = open(journal, 'a', encoding='utf-8')
+
+    def submit(self, user_id, question_id, choice_id):
+        """
+        Accept a vote to be written by the next flush.
+        """
+        with self._lock:
+            if self._journal_file is not None:
+                self._journal_file.write(json.dumps(
+                    [user_id, question_id, choice_id]) + '\n')
+                self._journal_file.flush()
+                if self.fsync:
+                    os.fsync(self._journal_file.fileno())
+            coalesced = (user_id, question_id) in self._pending
+            self._pending[(user_id, question_id)] = choice_id
+            depth = len(self._pending)
+            get_registry().set('polls_vote_buffer_queue_depth', {}, depth)
+        if coalesced:
+            count_avoided_writes('coalesced')
+        if depth >= self.max_batch:
+            self._wakeup.set()
+
+    def flush(self):
+        """
+        Write every waiting vote and return how many were written.
+        """
+        with self._flush_lock:
+            registry = get_registry()
+            with self._lock:
+                votes, self._pending = self._pending, {}
+                self._rotate_journal()
+                registry.set('polls_vote_buffer_queue_depth', {}, 0)
+            if not votes:
+                return 0
+            started = time.perf_counter()
+            try:
+                written = write_votes(votes)
+            except Exception:
+                # put the batch back, newer votes of the same user win
+                with self._lock:
+                    votes.update(self._pending)
+                    self._pending = votes
+                    registry.set('polls_vote_buffer_queue_depth', {},
+                                 len(votes))
+                raise
+            for path in self._flushing_journals:
+                os.remove(path)
+            self._flushing_journals = []
+            self.last_flush_latency = time.perf_counter() - started
+            self.last_flush_size = len(votes)
+            self.flushed_votes += len(votes)
+            self.written_votes += written
+            count_avoided_writes('unchanged', len(votes) - written)
+            self.flushes += 1
+            registry.observe('polls_vote_buffer_flush_seconds', {},
+                             self.last_flush_latency)
+            registry.inc('polls_vote_buffer_flushed_votes_total', {},
+                         len(votes))
+            return written
+
+    def stats(self):
+        """
+        Return the queue depth and flush counters of the buffer.
+        """
+        return {
+            'queue_depth': len(self._pending),
+            'flushes': self.flushes,
+            'flushed_votes': self.flushed_votes,
+            'written_votes': self.written_votes,
+            'last_flush_size': self.last_flush_size,
+            'last_flush_latency_seconds': self.last_flush_latency,
+        }
+
+    def start(self):
+        """
+        Start the background flush thread.
+        """
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._run, name='polls-vote-buffer', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """
+        Stop the flush thread and write every waiting vote.
+        """
+        self._stopping.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+        if self._journal_file is not None:
+            self._journal_file.close()
+            self._journal_file = None
+
+    def _run(self):
+        try:
+            while not self._stopping.is_set():
+                self._wakeup.wait(self.flush_interval)
+                self._wakeup.clear()
+                try:
+                    self.flush()
+                except Exception:
+                    logger.exception("Flushing the vote buffer failed")
+        finally:
+            connection.close()
+
+    def _rotate_journal(self):
+        """
+        Move the journal aside for the batch being flushed and start a new
+        one. Called with the lock held. The moved journals are deleted once
+        their votes are committed.
+        """
+        if self._journal_file is None or self._journal_file.tell() == 0:
+            return
+        self._journal_file.close()
+        flushing = f'{self.journal}.{time.time_ns()}.flushing'
+        os.replace(self.journal, flushing)
+        self._flushing_journals.append(flushing)
+        self._journal_file = open(self.journal, 'a', encoding='utf-8')
+
+    def _recover(self):
+        """
+        Queue the votes of journals left behind by an earlier process.
+
+        The old journals are kept until the next flush commits their votes,
+        so nothing touches the database here.
+        """
+        directory, name = os.path.split(os.path.abspath(self.journal))
+        leftovers = sorted(
+            os.path.join(directory, entry) for entry in os.listdir(directory)
+            if entry.startswith(f'{name}.') and entry.endswith('.flushing')
+        )
+        if os.path.exists(self.journal):
+            flushing = f'{self.journal}.{time.time_ns()}.flushing'
+            os.replace(self.journal, flushing)
+            leftovers.append(flushing)
+        for path in leftovers:
+            with open(path, encoding='utf-8') as journal:
+                for line in journal:
+                    try:
+                        user_id, question_id, choice_id = json.loads(line)
+                    except ValueError:
+                        # a torn last line from a crash mid-write
+                        continue
+                    self._pending[(user_id, question_id)] = choice_id
+        if self._pending:
+            logger.info("Recovered %d buffered votes", len(self._pending))
+        self._flushing_journals = leftovers
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_vote_buffer():
+    """
+    Return the vote buffer of this process, or None when buffering is off.
+
+    The buffer is created and started on first use, and drained when the
+    process exits.
+    """
+    global _buffer
+    if not settings.POLLS_VOTE_BUFFER_ENABLED:
+        return None
+    with _buffer_lock:
+        if _buffer is None:
+            _buffer = VoteBuffer(
+                flush_interval=settings.POLLS_VOTE_BUFFER_FLUSH_MS / 1000,
+                max_batch=settings.POLLS_VOTE_BUFFER_MAX_BATCH,
+                journal=settings.POLLS_VOTE_BUFFER_JOURNAL or None,
+                fsync=settings.POLLS_VOTE_BUFFER_FSYNC,
+            )
+            _buffer.start()
+            atexit.register(_buffer.stop)
+    return _buffer
@@ -0,0 +1,154 @@
+import asyncio
+import hashlib
+import time
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.messages.storage.cookie import CookieStorage
+from django.contrib.messages.storage.session import SessionStorage
+from django.core.cache import cache
+from django.utils import timezone
+from django.utils.cache import patch_vary_headers
+
+_INDEX_VERSION_KEY = 'polls:index-version'
+
+
+def index_version():
+    """
+    Return the version of the polls index, bumped whenever a question is
+    added, edited, closed or deleted.
+    """
+    version = cache.get(_INDEX_VERSION_KEY)
+    if version is None:
+        cache.add(_INDEX_VERSION_KEY, time.time_ns(), None)
+        version = cache.get(_INDEX_VERSION_KEY)
+    return version
+
+
+def bump_index_version():
+    """
+    Invalidate the cached pages of the polls index.
+    """
+    try:
+        cache.incr(_INDEX_VERSION_KEY)
+    except ValueError:
+        cache.add(_INDEX_VERSION_KEY, time.time_ns(), None)
+
+
+def cache_page_until(request, *moments):
+    """
+    Keep the cached page of this request no later than the earliest of
+    `moments` still to come, when a question shown on it opens or closes.
+    """
+    now = timezone.now()
+    upcoming = [moment for moment in moments
+                if moment is not None and moment > now]
+    if upcoming:
+        until = min(upcoming)
+        current = getattr(request, '_page_cache_until', None)
+        if current is None or until < current:
+            request._page_cache_until = until
+
+
+def _is_anonymous(request):
+    """
+    Whether the request may be answered with a page shared by every
+    anonymous visitor: a GET or HEAD without a logged-in user or pending
+    messages. The session is only read when the request carries one.
+    """
+    if request.method not in ('GET', 'HEAD'):
+        return False
+    if CookieStorage.cookie_name in request.COOKIES:
+        return False
+    if settings.SESSION_COOKIE_NAME in request.COOKIES:
+        if (request.user.is_authenticated
+                or SessionStorage.session_key in request.session):
+            return False
+    return True
+
+
+def _page_key(request, version, args, kwargs):
+    """
+    Return the cache key of the page of an anonymous request, or None when
+    the page must be rendered for this request only.
+    """
+    if not settings.POLLS_PAGE_CACHE_TIMEOUT or not _is_anonymous(request):
+        return None
+    url = hashlib.md5(request.build_absolute_uri().encode()).hexdigest()
+    return f'polls:page:{version(*args, **kwargs)}:{url}'
+
+
+def _timeout(request, response):
+    """
+    Return how long a response may stay cached, or None when it may not.
+    """
+    if (response.status_code != 200 or response.streaming
+            or response.cookies):
+        return None
+    timeout = settings.POLLS_PAGE_CACHE_TIMEOUT
+    until = getattr(request, '_page_cache_until', None)
+    if until is not None:
+        timeout = min(timeout, int((until - timezone.now()).total_seconds()))
+    return timeout if timeout > 0 else None
+
+
+def _store(key, request, response):
+    """
+    Cache a response once it is rendered.
+    """
+    patch_vary_headers(response, ['Cookie'])
+    timeout = _timeout(request, response)
+    if timeout is None:
+        return
+    if hasattr(response, 'render') and not response.is_rendered:
+        response.add_post_render_callback(
+            lambda rendered: cache.set(key, rendered, timeout))
+    else:
+        cache.set(key, response, timeout)
+
+
+def anonymous_page_cache(version):
+    """
+    Serve the whole page of a view from the cache to anonymous visitors.
+
+    `version` is called with the arguments of the view and returns the
+    version the page is keyed on, so bumping it drops every cached copy.
+    Logged-in users and requests with pending messages always get a fresh
+    page, and pages that set a cookie are never cached. A view can keep
+    its page for less than POLLS_PAGE_CACHE_TIMEOUT with
+    cache_page_until().
+    """
+    def decorator(view):
+        if asyncio.iscoroutinefunction(view):
+            @wraps(view)
+            async def wrapper(request, *args, **kwargs):
+                key = await sync_to_async(_page_key)(request, version, args,
+                                                     kwargs)
+                if key is None:
+                    return await view(request, *args, **kwargs)
+                response = await cache.aget(key)
+                if response is None:
+                    response = await view(request, *args, **kwargs)
+                    await sync_to_async(_store)(key, request, response)
+                return response
+        else:
+            @wraps(view)
+            def wrapper(request, *args, **kwargs):
+                key = _page_key(request, version, args, kwargs)
+                if key is None:
+                    return view(request, *args, **kwargs)
+                response = cache.get(key)
+                if response is None:
+                    response = view(request, *args, **kwargs)
+                    _store(key, request, response)
+                return response
+        return wrapper
+    return decorator
+
+
+def fragment_cache_timeout(request):
+    """
+    Template context processor with the timeout of cached fragments.
+    """
+    return {'fragment_cache_timeout': settings.POLLS_FRAGMENT_CACHE_TIMEOUT}
@@ -0,0 +1,162 @@
+import csv
+import datetime
+import zlib
+
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import Http404, HttpResponseBadRequest, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from django.views.decorators.http import require_safe
+
+from .models import Choice, Vote
+
+FORMATS = ('csv', 'ndjson')
+
+# The columns of each kind of export, in order.
+COLUMNS = {
+    'votes': ['id', 'question_id', 'question_text', 'choice_id',
+              'choice_text', 'user_id', 'username'],
+    'tallies': ['question_id', 'question_text', 'choice_id', 'choice_text',
+                'votes'],
+}
+
+CONTENT_TYPES = {'csv': 'text/csv', 'ndjson': 'application/x-ndjson'}
+
+
+def export_rows(kind, questions=None, since=None, until=None,
+                chunk_size=2000):
+    """
+    Yield the rows of an export as dicts, reading them from the database
+    `chunk_size` at a time.
+
+    `votes` yields one row per Vote with its question, choice and
+    username; `tallies` yields one row per choice with its stored tally.
+    Both can be limited to a list of question ids and to questions
+    published between `since` and `until`.
+    """
+    if kind == 'votes':
+        queryset = Vote.objects.order_by('id').values_list(
+            'id', 'question_id', 'question__question_text', 'choice_id',
+            'choice__choice_text', 'user_id', 'user__username')
+    else:
+        queryset = (Choice.objects.with_live_votes()
+                    .order_by('question_id', 'id')
+                    .values_list('question_id', 'question__question_text',
+                                 'id', 'choice_text', 'live_votes'))
+    if questions:
+        queryset = queryset.filter(question__in=questions)
+    if since is not None:
+        queryset = queryset.filter(question__pub_date__gte=since)
+    if until is not None:
+        queryset = queryset.filter(question__pub_date__lt=until)
+    columns = COLUMNS[kind]
+    for row in queryset.iterator(chunk_size=chunk_size):
+        yield dict(zip(columns, row))
+
+
+class _Line:
+    """
+    A file-like object that hands back what csv.writer writes to it.
+    """
+
+    def write(self, value):
+        return value
+
+
+def render(rows, columns, file_format, lines_per_chunk=500):
+    """
+    Yield the rows as CSV or NDJSON text, a few hundred lines per chunk.
+
+    The CSV header is yielded on its own first, so a response starts
+    before the first query has finished.
+    """
+    if file_format == 'csv':
+        writer = csv.writer(_Line())
+        yield writer.writerow(columns)
+
+        def line(row):
+            return writer.writerow([row[column] for column in columns])
+    else:
+        encoder = DjangoJSONEncoder()
+
+        def line(row):
+            return encoder.encode(row) + '\n'
+    chunk = []
+    for row in rows:
+        chunk.append(line(row))
+        if len(chunk) >= lines_per_chunk:
+            yield ''.join(chunk)
+            chunk = []
+    if chunk:
+        yield ''.join(chunk)
+
+
+def gzip_chunks(chunks):
+    """
+    Compress text chunks into a gzip stream on the fly.
+
+    The first chunk is flushed right away, so the client gets its first
+    bytes without waiting for a full compression block.
+    """
+    compressor = zlib.compressobj(wbits=zlib.MAX_WBITS | 16)
+    first = True
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode())
+        if first:
+            data += compressor.flush(zlib.Z_SYNC_FLUSH)
+            first = False
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def parse_when(value):
+    """
+    Return an aware datetime for a date or datetime string, or raise
+    ValueError.
+    """
+    when = parse_datetime(value)
+    if when is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(f"Invalid date {value!r}")
+        when = datetime.datetime.combine(day, datetime.time())
+    if timezone.is_naive(when):
+        when = timezone.make_aware(when)
+    return when
+
+
+@require_safe
+@staff_member_required
+def export(request, kind):
+    """
+    Stream the votes or the tallies as CSV or NDJSON, to staff only.
+
+    Takes `format` (csv or ndjson), `gzip=1`, any number of `question`
+    ids, and `since` and `until` dates of question publication.
+    """
+    if kind not in COLUMNS:
+        raise Http404("No such export")
+    file_format = request.GET.get('format', 'csv')
+    if file_format not in FORMATS:
+        return HttpResponseBadRequest("Unknown format")
+    try:
+        questions = [int(pk) for pk in request.GET.getlist('question')]
+        since, until = (parse_when(request.GET[name])
+                        if request.GET.get(name) else None
+                        for name in ('since', 'until'))
+    except ValueError as error:
+        return HttpResponseBadRequest(str(error))
+    chunks = render(export_rows(kind, questions, since, until),
+                    COLUMNS[kind], file_format)
+    filename = f'{kind}.{file_format}'
+    content_type = CONTENT_TYPES[file_format]
+    if request.GET.get('gzip'):
+        chunks = gzip_chunks(chunks)
+        filename += '.gz'
+        content_type = 'application/gzip'
+    return StreamingHttpResponse(chunks, content_type=content_type, headers={
+        'Content-Disposition': f'attachment; filename="{filename}"',
+        'X-Accel-Buffering': 'no',
+    })
@@ -0,0 +1,335 @@
+import csv
+import datetime
+import json
+import time
+
+from django.conf import settings
+from django.contrib.auth.hashers import identify_hasher, make_password
+from django.contrib.auth.models import User
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.utils import timezone
+
+from .caching import bump_index_version
+from .models import Choice, Question, Vote
+from .results import bump_results_version
+from .schedule import reschedule
+from .votelog import record_votes
+from .voting import immediate_atomic, rebuild_tallies
+
+# Models that can be imported, in the order their batches are written so
+# that every foreign key points at a row written before it.
+MODELS = {
+    'auth.user': User,
+    'polls.question': Question,
+    'polls.choice': Choice,
+    'polls.vote': Vote,
+}
+
+# The columns a row is matched on to update an existing row instead of
+# inserting a new one.
+UNIQUE_FIELDS = {
+    User: ['username'],
+    Question: ['id'],
+    Choice: ['id'],
+    Vote: ['user', 'question'],
+}
+
+FORMATS = ('json', 'ndjson', 'csv')
+
+
+class InvalidRow(ValueError):
+    """
+    A row that cannot be imported.
+    """
+
+
+def read_json(file, chunk_size=64 * 1024):
+    """
+    Yield the objects of a JSON array one at a time, reading the file in
+    chunks instead of loading it whole.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ''
+    position = 0
+    started = False
+    eof = False
+    while True:
+        while position < len(buffer) and buffer[position] in ' \t\r\n,':
+            position += 1
+        if position < len(buffer):
+            if not started:
+                if buffer[position] != '[':
+                    raise InvalidRow("JSON input must be an array")
+                started = True
+                position += 1
+                continue
+            if buffer[position] == ']':
+                return
+            try:
+                item, position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                if eof:
+                    raise InvalidRow("Malformed JSON input")
+            else:
+                yield item
+                continue
+        elif eof:
+            raise InvalidRow("Unexpected end of JSON input")
+        chunk = file.read(chunk_size)
+        eof = not chunk
+        buffer = buffer[position:] + chunk
+        position = 0
+
+
+def read_ndjson(file):
+    """
+    Yield one object per non-blank line.
+    """
+    for number, line in enumerate(file, 1):
+        if line.strip():
+            try:
+                yield json.loads(line)
+            except ValueError:
+                raise InvalidRow(f"Line {number} is not valid JSON")
+
+
+def read_csv(file):
+    """
+    Yield one dict per CSV row, keyed by the header row.
+    """
+    yield from csv.DictReader(file)
+
+
+READERS = {'json': read_json, 'ndjson': read_ndjson, 'csv': read_csv}
+
+
+def _split_record(record, model_label):
+    """
+    Return the model label, primary key and field values of a record.
+
+    Records are either in the fixture layout of `dumpdata`
+    ({"model", "pk", "fields"}) or flat, with the model given by the
+    record or by `model_label`.
+    """
+    if not isinstance(record, dict):
+        raise InvalidRow("Each row must be an object")
+    if 'fields' in record:
+        values = dict(record['fields'])
+        pk = record.get('pk')
+    else:
+        values = dict(record)
+        pk = values.pop('pk', None)
+        if pk is None:
+            pk = values.pop('id', None)
+    label = values.pop('model', None) or record.get('model') or model_label
+    return label, pk, values
+
+
+def build_object(record, model_label=None):
+    """
+    Validate a record and return an unsaved model instance.
+
+    Raises InvalidRow when the model is unknown, a field does not exist or
+    a value does not fit its field.
+    """
+    label, pk, values = _split_record(record, model_label)
+    model = MODELS.get(str(label).lower())
+    if model is None:
+        raise InvalidRow(f"Unknown model {label!r}")
+    kwargs = {}
+    if pk not in (None, ''):
+        try:
+            kwargs['pk'] = model._meta.pk.to_python(pk)
+        except ValidationError as error:
+            raise InvalidRow(f"pk: {'; '.join(error.messages)}")
+    for name, value in values.items():
+        try:
+            field = model._meta.get_field(name)
+        except FieldDoesNotExist:
+            raise InvalidRow(f"Unknown field {label}.{name}")
+        if field.many_to_many:
+            if value:
+                raise InvalidRow(f"Cannot import {label}.{name}")
+            continue
+        if value == '' and (field.null or field.is_relation):
+            value = None
+        if value is None:
+            if not field.null:
+                raise InvalidRow(f"{name}: This field cannot be null.")
+        else:
+            try:
+                value = field.to_python(value)
+            except ValidationError as error:
+                raise InvalidRow(f"{name}: {'; '.join(error.messages)}")
+            # as saving would, so the question status can be worked out
+            if (isinstance(value, datetime.datetime) and settings.USE_TZ
+                    and timezone.is_naive(value)):
+                value = timezone.make_aware(value)
+        kwargs[field.attname] = value
+    for field in model._meta.concrete_fields:
+        # a vote without a question takes the question of its choice
+        if (field.attname not in kwargs and not field.primary_key
+                and not field.has_default() and not field.null
+                and not field.blank and field is not Vote.question.field):
+            raise InvalidRow(f"{field.name}: This field is required.")
+    obj = model(**kwargs)
+    if model is User and obj.password:
+        try:
+            identify_hasher(obj.password)
+        except ValueError:
+            obj.password = make_password(obj.password)
+    return obj
+
+
+class Importer:
+    """
+    Writes validated rows in batches.
+
+    Rows are collected per model, and as soon as any model has
+    `batch_size` rows waiting every waiting batch is written with one bulk
+    upsert per model in a single transaction. Rows that match an existing
+    row on UNIQUE_FIELDS update it, so an import can be run again. The
+    tallies of every question the import touched are rebuilt at the end.
+    """
+
+    def __init__(self, batch_size=1000, on_invalid=None, progress=None):
+        self.batch_size = batch_size
+        self.on_invalid = on_invalid
+        self.progress = progress
+        self._pending = {model: [] for model in MODELS.values()}
+        self._touched_questions = set()
+        self.imported = 0
+        self.invalid = 0
+        self.started = time.perf_counter()
+
+    def add(self, number, record, model_label=None):
+        """
+        Validate record number `number` and queue it for the next batch.
+        """
+        try:
+            obj = build_object(record, model_label)
+        except InvalidRow as error:
+            self.reject(number, error)
+            return
+        batch = self._pending[type(obj)]
+        batch.append((number, obj))
+        if len(batch) >= self.batch_size:
+            self.flush()
+
+    def reject(self, number, error):
+        self.invalid += 1
+        if self.on_invalid is not None:
+            self.on_invalid(number, error)
+
+    def flush(self):
+        """
+        Write every waiting row.
+        """
+        written = 0
+        with immediate_atomic():
+            for model, batch in self._pending.items():
+                written += self._write(model, batch)
+        self._pending = {model: [] for model in MODELS.values()}
+        self.imported += written
+        if written and self.progress is not None:
+            self.progress(self)
+
+    def finish(self):
+        """
+        Write the last rows and rebuild the tallies they changed.
+        """
+        self.flush()
+        if self._touched_questions:
+            rebuild_tallies(
+                Question.objects.filter(pk__in=self._touched_questions))
+            for question_id in self._touched_questions:
+                bump_results_version(question_id)
+            bump_index_version()
+            reschedule()
+
+    def rate(self):
+        """
+        Return the imported rows per second so far.
+        """
+        elapsed = time.perf_counter() - self.started
+        return self.imported / elapsed if elapsed else 0.0
+
+    def _write(self, model, batch):
+        if model is Vote:
+            batch = self._fill_vote_questions(batch)
+        if not batch:
+            return 0
+        objs = [obj for _, obj in batch]
+        if model is Question:
+            now = timezone.now()
+            for obj in objs:
+                obj.status = obj.status_at(now)
+        unique_fields = UNIQUE_FIELDS[model]
+        update_fields = [
+            field.name for field in model._meta.concrete_fields
+            if not field.primary_key and field.name not in unique_fields
+        ]
+        model.objects.bulk_create(
+            objs,
+            update_conflicts=True,
+            unique_fields=unique_fields,
+            update_fields=update_fields,
+        )
+        if model is Vote:
+            # whether a vote was replaced is not known, the log gets it as
+            # a first vote
+            record_votes([(vote.user_id, vote.question_id, vote.choice_id,
+                           None) for vote in objs])
+        if model is Question:
+            self._touched_questions.update(obj.pk for obj in objs)
+        elif model is not User:
+            self._touched_questions.update(obj.question_id for obj in objs)
+        return len(objs)
+
+    def _fill_vote_questions(self, batch):
+        """
+        Set the question of votes that only name their choice, and reject
+        votes for choices that do not exist.
+        """
+        missing = {vote.choice_id for _, vote in batch
+                   if vote.question_id is None}
+        questions = dict(Choice.objects.filter(pk__in=missing)
+                         .values_list('id', 'question_id'))
+        valid = []
+        for number, vote in batch:
+            if vote.question_id is None:
+                vote.question_id = questions.get(vote.choice_id)
+            if vote.question_id is None:
+                self.reject(number, InvalidRow(
+                    f"choice: Unknown choice {vote.choice_id}"))
+            else:
+                valid.append((number, vote))
+        return valid
+
+
+def import_rows(rows, model_label=None, batch_size=1000, on_invalid=None,
+                progress=None):
+    """
+    Validate and write a stream of records, and return the Importer with
+    its counters.
+
+    Invalid rows are skipped and passed with their 1-based number and the
+    error to `on_invalid`.
+    """
+    importer = Importer(batch_size=batch_size, on_invalid=on_invalid,
+                        progress=progress)
+    for number, record in enumerate(rows, 1):
+        importer.add(number, record, model_label)
+    importer.finish()
+    return importer
+
+
+def guess_format(path):
+    """
+    Return the input format implied by a file name, or None.
+    """
+    for suffix, name in (('.ndjson', 'ndjson'), ('.jsonl', 'ndjson'),
+                         ('.json', 'json'), ('.csv', 'csv')):
+        if str(path).lower().endswith(suffix):
+            return name
+    return None
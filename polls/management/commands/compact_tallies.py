@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from polls.models import Question
+from polls.voting import compact_tallies
+
+
+class Command(BaseCommand):
+    help = "Fold the vote tally shards back into the stored tallies."
+
+    def add_arguments(self, parser):
+        parser.add_argument('question_ids', nargs='*', type=int,
+                            help="Only compact these questions.")
+
+    def handle(self, *args, **options):
+        questions = None
+        if options['question_ids']:
+            questions = Question.objects.filter(pk__in=options['question_ids'])
+        moved = compact_tallies(questions)
+        self.stdout.write(self.style.SUCCESS(
+            f"Compacted {moved} votes into the stored tallies."))
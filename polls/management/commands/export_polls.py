@@ -0,0 +1,51 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from polls.exports import (COLUMNS, FORMATS, export_rows, gzip_chunks,
+                           parse_when, render)
+
+
+class Command(BaseCommand):
+    help = "Stream the votes or the tallies as CSV or NDJSON."
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=sorted(COLUMNS))
+        parser.add_argument('--format', choices=FORMATS, default='csv')
+        parser.add_argument('--gzip', action='store_true',
+                            help="Compress the output with gzip.")
+        parser.add_argument('--question', type=int, action='append',
+                            help="Only export this question, can be "
+                                 "repeated.")
+        parser.add_argument('--since',
+                            help="Only questions published on or after "
+                                 "this date.")
+        parser.add_argument('--until',
+                            help="Only questions published before this "
+                                 "date.")
+        parser.add_argument('-o', '--output',
+                            help="File to write, standard output by "
+                                 "default.")
+
+    def handle(self, *args, **options):
+        try:
+            since, until = (parse_when(options[name]) if options[name]
+                            else None for name in ('since', 'until'))
+        except ValueError as error:
+            raise CommandError(error)
+        chunks = render(
+            export_rows(options['kind'], options['question'], since, until),
+            COLUMNS[options['kind']], options['format'])
+        if options['output']:
+            if options['gzip']:
+                chunks = gzip_chunks(chunks)
+            else:
+                chunks = (chunk.encode() for chunk in chunks)
+            with open(options['output'], 'wb') as out:
+                out.writelines(chunks)
+        elif options['gzip']:
+            sys.stdout.buffer.writelines(gzip_chunks(chunks))
+            sys.stdout.buffer.flush()
+        else:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
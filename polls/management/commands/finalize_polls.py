@@ -0,0 +1,39 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from polls.models import Question, ResultSnapshot
+from polls.results import archive_votes, finalize_results
+from polls.schedule import advance
+
+
+class Command(BaseCommand):
+    help = ("Write the frozen results of closed polls, and optionally move "
+            "their votes out of the Vote table.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('question_ids', nargs='*', type=int,
+                            help="Only finalize these questions.")
+        parser.add_argument('--archive-dir',
+                            help="Move the votes of finalized questions to "
+                                 "gzipped NDJSON files in this directory.")
+
+    def handle(self, *args, **options):
+        advance()
+        questions = Question.objects.all()
+        if options['question_ids']:
+            questions = questions.filter(pk__in=options['question_ids'])
+        finalized = finalize_results(questions)
+        self.stdout.write(self.style.SUCCESS(
+            f"Finalized {len(finalized)} questions."))
+        directory = options['archive_dir']
+        if not directory:
+            return
+        if not os.path.isdir(directory):
+            raise CommandError(f"{directory} is not a directory.")
+        snapshots = ResultSnapshot.objects.filter(
+            question__in=questions, archived=False)
+        for question_id in snapshots.values_list('question_id', flat=True):
+            path = archive_votes(question_id, directory)
+            self.stdout.write(f"Archived the votes of question "
+                              f"{question_id} to {path}")
@@ -0,0 +1,62 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError
+
+from polls.importer import (FORMATS, MODELS, READERS, InvalidRow,
+                            guess_format, import_rows)
+
+
+class Command(BaseCommand):
+    help = ("Import users, questions, choices and votes from JSON, NDJSON "
+            "or CSV files, streaming them in batches.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('files', nargs='+',
+                            help="Files to import, or - for standard input.")
+        parser.add_argument('--format', choices=FORMATS,
+                            help="Input format, by default taken from the "
+                                 "file extension.")
+        parser.add_argument('--model', choices=sorted(MODELS),
+                            help="Model of rows that do not name one, "
+                                 "required for CSV.")
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help="Rows written per transaction.")
+
+    def handle(self, *args, **options):
+        for path in options['files']:
+            file_format = options['format'] or guess_format(path)
+            if file_format is None:
+                raise CommandError(f"Cannot tell the format of {path}, "
+                                   f"use --format.")
+            if file_format == 'csv' and not options['model']:
+                raise CommandError("CSV files need --model.")
+            if path == '-':
+                self.import_file(sys.stdin, path, file_format, options)
+            else:
+                with open(path, newline='', encoding='utf-8') as file:
+                    self.import_file(file, path, file_format, options)
+
+    def import_file(self, file, path, file_format, options):
+        def on_invalid(number, error):
+            self.stderr.write(f"{path}: row {number}: {error}")
+
+        def progress(importer):
+            if options['verbosity'] > 1:
+                self.stdout.write(f"{path}: {importer.imported} rows, "
+                                  f"{importer.rate():.0f} rows/s")
+
+        try:
+            importer = import_rows(
+                READERS[file_format](file),
+                model_label=options['model'],
+                batch_size=options['batch_size'],
+                on_invalid=on_invalid,
+                progress=progress,
+            )
+        except (InvalidRow, DatabaseError) as error:
+            raise CommandError(f"{path}: {error}")
+        self.stdout.write(self.style.SUCCESS(
+            f"{path}: imported {importer.imported} rows "
+            f"({importer.rate():.0f} rows/s), "
+            f"skipped {importer.invalid} invalid rows."))
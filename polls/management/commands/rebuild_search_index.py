@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from polls.search import rebuild_index
+
+
+class Command(BaseCommand):
+    help = ("Fill the full-text search table again from the questions and "
+            "their choices.")
+
+    def handle(self, *args, **options):
+        indexed = rebuild_index()
+        if indexed is None:
+            self.stdout.write("This database is searched without a "
+                              "full-text table, nothing to rebuild.")
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f"Indexed {indexed} questions."))
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from polls.models import Question
+from polls.voting import rebuild_tallies
+
+
+class Command(BaseCommand):
+    help = "Rebuild the stored vote tallies from the Vote table."
+
+    def add_arguments(self, parser):
+        parser.add_argument('question_ids', nargs='*', type=int,
+                            help="Only rebuild these questions.")
+        parser.add_argument('--check', action='store_true',
+                            help="Only report drifted tallies, "
+                                 "do not rewrite them.")
+
+    def handle(self, *args, **options):
+        questions = Question.objects.all()
+        if options['question_ids']:
+            questions = questions.filter(pk__in=options['question_ids'])
+        drift = rebuild_tallies(questions, fix=not options['check'])
+        for obj, stored, actual in drift:
+            self.stdout.write(f"{obj._meta.model_name} {obj.pk} "
+                              f"'{obj}': stored {stored}, actual {actual}")
+        if not drift:
+            self.stdout.write(self.style.SUCCESS("All tallies are correct."))
+        elif options['check']:
+            raise CommandError(f"{len(drift)} tallies are out of date.")
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                f"Rebuilt {len(drift)} tallies."))
@@ -0,0 +1,97 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_datetime
+
+from polls.models import Vote
+from polls.votelog import baseline, read_events, replay
+from polls.voting import restore_votes
+
+
+def parse_until(value):
+    """
+    Return an ISO 8601 date and time with a time zone as nanoseconds since
+    the epoch, or None when it is not given.
+    """
+    if not value:
+        return None
+    moment = parse_datetime(value)
+    if moment is None or moment.tzinfo is None:
+        raise CommandError(f"{value} is not a date and time with a time "
+                           f"zone, such as 2026-01-31T12:00:00+00:00.")
+    return int(moment.timestamp()) * 10**9 + moment.microsecond * 1000
+
+
+def log_directory(options):
+    directory = options['log_dir'] or settings.POLLS_VOTE_LOG_DIR
+    if not directory:
+        raise CommandError("Set POLLS_VOTE_LOG_DIR or pass --log-dir.")
+    return directory
+
+
+class Command(BaseCommand):
+    help = ("Replay the vote event log to find the vote of every user at a "
+            "point in time, and optionally write those votes and their "
+            "tallies back.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('question_ids', nargs='*', type=int,
+                            help="Only replay these questions.")
+        parser.add_argument('--until',
+                            help="Stop at this ISO 8601 date and time "
+                                 "instead of the end of the log.")
+        parser.add_argument('--log-dir',
+                            help="Read the log from this directory instead "
+                                 "of POLLS_VOTE_LOG_DIR.")
+        parser.add_argument('--apply', action='store_true',
+                            help="Replace the votes and tallies of the "
+                                 "replayed questions with the result.")
+
+    def handle(self, *args, **options):
+        directory = log_directory(options)
+        question_ids = set(options['question_ids']) or None
+        events = read_events(directory, parse_until(options['until']),
+                             question_ids)
+        read = 0
+        # the votes the log knows of, needed when it has no baseline
+        logged = set() if baseline(directory) is None else None
+
+        def counted(events):
+            nonlocal read
+            for read, event in enumerate(events, 1):
+                if logged is not None:
+                    logged.add((event[1], event[2]))
+                yield event
+
+        started = time.perf_counter()
+        votes = replay(counted(events))
+        elapsed = time.perf_counter() - started
+        rate = read / elapsed * 60 if elapsed else 0
+        self.stdout.write(f"Replayed {read} events into {len(votes)} votes "
+                          f"in {elapsed:.2f}s ({rate:,.0f} events a minute).")
+        if not options['apply']:
+            return
+        if question_ids is None:
+            question_ids = {question_id for _, question_id in votes}
+        if logged is not None:
+            self.check_unlogged(question_ids, logged)
+        restored, written = restore_votes(votes, question_ids)
+        self.stdout.write(self.style.SUCCESS(
+            f"Restored {written} votes of {len(restored)} questions."))
+
+    def check_unlogged(self, question_ids, logged):
+        """
+        Refuse to restore a log without a baseline over votes it never
+        saw, such as votes cast before it was started, which the restore
+        would delete.
+        """
+        unlogged = sum(
+            1 for vote in Vote.objects.filter(question__in=question_ids)
+            .values_list('user_id', 'question_id').iterator()
+            if vote not in logged)
+        if unlogged:
+            raise CommandError(
+                f"The log has no baseline and {unlogged} votes of these "
+                f"questions are not in it, they would be lost. Log a vote "
+                f"to write a baseline and replay from it.")
@@ -0,0 +1,37 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from polls.models import Question
+from polls.results import finalize_results
+from polls.schedule import apply_transitions
+
+
+class Command(BaseCommand):
+    help = ("Open and close polls at their pub_date and end_date, and write "
+            "the frozen results of the polls that close.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true',
+                            help="Apply the transitions due now and exit.")
+
+    def handle(self, *args, **options):
+        while True:
+            opened, closed, upcoming = apply_transitions()
+            if opened:
+                self.stdout.write(f"Opened questions {opened}.")
+            if closed:
+                self.stdout.write(f"Closed questions {closed}.")
+                finalized = finalize_results(
+                    Question.objects.filter(pk__in=closed))
+                self.stdout.write(f"Finalized questions {finalized}.")
+            if options['once']:
+                return
+            # wake up at the next transition, and at least every interval
+            # to see dates changed without Question.save()
+            delay = settings.POLLS_SCHEDULE_INTERVAL
+            if upcoming is not None:
+                delay = min(delay, (upcoming - timezone.now()).total_seconds())
+            time.sleep(max(delay, 0))
@@ -0,0 +1,47 @@
+import csv
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from polls.models import Choice, Question
+from polls.votelog import read_events, timeline
+
+from .replay_votes import log_directory, parse_until
+
+
+class Command(BaseCommand):
+    help = ("Write the tallies of a question over time, with the votes cast, "
+            "changed and deleted in each interval, as CSV from the vote "
+            "event log.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('question_id', type=int)
+        parser.add_argument('--interval', type=float, default=3600,
+                            help="Length of an interval in seconds, an hour "
+                                 "by default.")
+        parser.add_argument('--until',
+                            help="Stop at this ISO 8601 date and time "
+                                 "instead of the end of the log.")
+        parser.add_argument('--log-dir',
+                            help="Read the log from this directory instead "
+                                 "of POLLS_VOTE_LOG_DIR.")
+
+    def handle(self, *args, **options):
+        if options['interval'] <= 0:
+            raise CommandError("--interval must be positive.")
+        question_id = options['question_id']
+        if not Question.objects.filter(pk=question_id).exists():
+            raise CommandError(f"Question {question_id} does not exist.")
+        choice_ids = list(Choice.objects.filter(question=question_id)
+                          .order_by('id').values_list('id', flat=True))
+        events = read_events(log_directory(options),
+                             parse_until(options['until']), {question_id})
+        writer = csv.writer(self.stdout)
+        writer.writerow(['time', 'cast', 'changed', 'deleted']
+                        + [f'choice_{choice_id}' for choice_id in choice_ids])
+        for end, tallies, cast, changed, deleted in timeline(
+                events, options['interval']):
+            moment = datetime.datetime.fromtimestamp(end / 1e9,
+                                                     datetime.timezone.utc)
+            writer.writerow([moment.isoformat(), cast, changed, deleted]
+                            + [tallies[choice_id] for choice_id in choice_ids])
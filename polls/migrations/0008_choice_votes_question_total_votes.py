@@ -0,0 +1,36 @@
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_tallies(apps, schema_editor):
+    """
+    Fill the new tally columns from the existing Vote rows.
+    """
+    Question = apps.get_model('polls', 'Question')
+    Choice = apps.get_model('polls', 'Choice')
+    for choice in Choice.objects.annotate(actual=Count('vote')):
+        Choice.objects.filter(pk=choice.pk).update(votes=choice.actual)
+    for question in Question.objects.annotate(actual=Count('choice__vote')):
+        Question.objects.filter(pk=question.pk).update(
+            total_votes=question.actual)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0007_alter_question_pub_date'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='choice',
+            name='votes',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='question',
+            name='total_votes',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_tallies, migrations.RunPython.noop),
+    ]
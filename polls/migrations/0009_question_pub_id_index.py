@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-18 20:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0008_choice_votes_question_total_votes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='question',
+            index=models.Index(fields=['pub_date', 'id'], name='polls_question_pub_id_idx'),
+        ),
+    ]
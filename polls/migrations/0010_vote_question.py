@@ -0,0 +1,60 @@
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Max, OuterRef, Subquery
+import django.db.models.deletion
+
+
+def backfill_vote_question(apps, schema_editor):
+    """
+    Copy the question of every vote from its choice, keep only the latest
+    vote of each user per question and recount the tallies.
+    """
+    Vote = apps.get_model('polls', 'Vote')
+    Choice = apps.get_model('polls', 'Choice')
+    Question = apps.get_model('polls', 'Question')
+    Vote.objects.update(question_id=Subquery(
+        Choice.objects.filter(pk=OuterRef('choice_id')).values('question_id')
+    ))
+    duplicates = (Vote.objects.values('user_id', 'question_id')
+                  .annotate(count=Count('id'), latest=Max('id'))
+                  .filter(count__gt=1))
+    for duplicate in duplicates:
+        Vote.objects.filter(
+            user_id=duplicate['user_id'],
+            question_id=duplicate['question_id'],
+        ).exclude(pk=duplicate['latest']).delete()
+    for choice in Choice.objects.annotate(actual=Count('vote')):
+        Choice.objects.filter(pk=choice.pk).update(votes=choice.actual)
+    for question in Question.objects.annotate(actual=Count('vote')):
+        Question.objects.filter(pk=question.pk).update(
+            total_votes=question.actual)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('polls', '0009_question_pub_id_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='vote',
+            name='question',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to='polls.question'),
+        ),
+        migrations.RunPython(backfill_vote_question, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='vote',
+            name='question',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='polls.question'),
+        ),
+        migrations.AddConstraint(
+            model_name='vote',
+            constraint=models.UniqueConstraint(fields=('user', 'question'), name='polls_vote_one_per_question'),
+        ),
+        migrations.AddIndex(
+            model_name='vote',
+            index=models.Index(fields=['question', 'choice'], name='polls_vote_question_choice_idx'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.2.30 on 2026-10-18 20:52
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0011_tally_shards'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResultSnapshot',
+            fields=[
+                ('question', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='snapshot', serialize=False, to='polls.question')),
+                ('choices', models.JSONField()),
+                ('total_votes', models.IntegerField()),
+                ('finalized_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('archived', models.BooleanField(default=False)),
+            ],
+        ),
+    ]
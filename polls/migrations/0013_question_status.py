@@ -0,0 +1,41 @@
+# Generated by Django 4.2.30 on 2026-10-18 21:28
+
+from django.db import migrations, models
+from django.db.models import Q
+from django.utils import timezone
+
+
+def backfill_status(apps, schema_editor):
+    """
+    Work out the status of every question from its dates.
+    """
+    Question = apps.get_model('polls', 'Question')
+    now = timezone.now()
+    published = Question.objects.filter(pub_date__lte=now)
+    published.filter(end_date__lte=now).update(status=2)
+    published.filter(Q(end_date__isnull=True) | Q(end_date__gt=now)).update(
+        status=1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0012_resultsnapshot'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='question',
+            name='status',
+            field=models.PositiveSmallIntegerField(choices=[(0, 'Scheduled'), (1, 'Open'), (2, 'Closed')], default=0),
+        ),
+        migrations.RunPython(backfill_status, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='question',
+            index=models.Index(fields=['status', 'pub_date', 'id'], name='polls_question_status_pub_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='question',
+            index=models.Index(fields=['status', 'end_date'], name='polls_question_status_end_idx'),
+        ),
+    ]
@@ -0,0 +1,80 @@
+from django.db import migrations
+
+CHOICE_TEXTS = (
+    "(SELECT group_concat(choice_text, ' ') FROM polls_choice "
+    "WHERE question_id = {})"
+)
+
+FORWARD = [
+    # the question text and all choice texts of each question, by id, with
+    # the 2 and 3 letter prefixes indexed for searches as you type
+    "CREATE VIRTUAL TABLE polls_question_fts USING fts5("
+    "question_text, choice_text, "
+    "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')",
+    # rank the question text twice as high as the choices
+    "INSERT INTO polls_question_fts(polls_question_fts, rank) "
+    "VALUES ('rank', 'bm25(2.0, 1.0)')",
+    "INSERT INTO polls_question_fts(rowid, question_text, choice_text) "
+    "SELECT id, question_text, coalesce({}, '') FROM polls_question".format(
+        CHOICE_TEXTS.format('polls_question.id')),
+    "CREATE TRIGGER polls_question_fts_insert AFTER INSERT ON polls_question "
+    "BEGIN INSERT INTO polls_question_fts(rowid, question_text, choice_text) "
+    "VALUES (new.id, new.question_text, ''); END",
+    # only text changes, not the tallies and statuses updated on votes
+    "CREATE TRIGGER polls_question_fts_update AFTER UPDATE OF question_text "
+    "ON polls_question BEGIN UPDATE polls_question_fts "
+    "SET question_text = new.question_text WHERE rowid = new.id; END",
+    "CREATE TRIGGER polls_question_fts_delete AFTER DELETE ON polls_question "
+    "BEGIN DELETE FROM polls_question_fts WHERE rowid = old.id; END",
+    "CREATE TRIGGER polls_choice_fts_insert AFTER INSERT ON polls_choice "
+    "BEGIN UPDATE polls_question_fts SET choice_text = {} "
+    "WHERE rowid = new.question_id; END".format(
+        CHOICE_TEXTS.format('new.question_id')),
+    "CREATE TRIGGER polls_choice_fts_update "
+    "AFTER UPDATE OF choice_text, question_id ON polls_choice "
+    "BEGIN UPDATE polls_question_fts SET choice_text = coalesce({}, '') "
+    "WHERE rowid = old.question_id; "
+    "UPDATE polls_question_fts SET choice_text = {} "
+    "WHERE rowid = new.question_id; END".format(
+        CHOICE_TEXTS.format('old.question_id'),
+        CHOICE_TEXTS.format('new.question_id')),
+    "CREATE TRIGGER polls_choice_fts_delete AFTER DELETE ON polls_choice "
+    "BEGIN UPDATE polls_question_fts SET choice_text = coalesce({}, '') "
+    "WHERE rowid = old.question_id; END".format(
+        CHOICE_TEXTS.format('old.question_id')),
+]
+
+BACKWARD = [
+    "DROP TRIGGER polls_choice_fts_delete",
+    "DROP TRIGGER polls_choice_fts_update",
+    "DROP TRIGGER polls_choice_fts_insert",
+    "DROP TRIGGER polls_question_fts_delete",
+    "DROP TRIGGER polls_question_fts_update",
+    "DROP TRIGGER polls_question_fts_insert",
+    "DROP TABLE polls_question_fts",
+]
+
+
+def run(statements):
+    """
+    Return a migration function running `statements` on SQLite, whose FTS5
+    table backs the question search. Other databases search with
+    icontains and need nothing.
+    """
+    def migrate(apps, schema_editor):
+        if schema_editor.connection.vendor != 'sqlite':
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+    return migrate
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0013_question_status'),
+    ]
+
+    operations = [
+        migrations.RunPython(run(FORWARD), run(BACKWARD)),
+    ]
@@ -1,10 +1,76 @@
 import datetime
 from django.db import models
+from django.db.models.functions import Coalesce
 from django.utils import timezone
 from django.contrib.auth.models import User
 
 
 # Create your models here.
+class QuestionQuerySet(models.QuerySet):
+    """
+    Queries on questions that filter on their stored status instead of
+    calling is_published() and can_vote() on every row. Call
+    polls.schedule.advance() first to bring the statuses up to date.
+    """
+
+    def with_status(self):
+        """
+        Annotate every question with `is_open`, whether its stored status
+        is open.
+        """
+        return self.annotate(is_open=models.ExpressionWrapper(
+            models.Q(status=Question.Status.OPEN),
+            output_field=models.BooleanField(),
+        ))
+
+    def published(self):
+        """
+        Questions whose pub_date has passed.
+        """
+        return self.with_status().filter(
+            status__in=[Question.Status.OPEN, Question.Status.CLOSED])
+
+    def open(self):
+        """
+        Published questions that can still be voted on.
+        """
+        return self.with_status().filter(status=Question.Status.OPEN)
+
+    def closed(self):
+        """
+        Published questions whose end_date has passed.
+        """
+        return self.with_status().filter(status=Question.Status.CLOSED)
+
+    def newest_first(self):
+        """
+        Order by (pub_date, id) descending, the order of the keyset index.
+        """
+        return self.order_by('-pub_date', '-id')
+
+    def with_live_total(self):
+        """
+        Annotate every question with `live_total_votes`, its stored total
+        plus the votes still waiting in the shards of its choices.
+        """
+        shards = (ChoiceShard.objects
+                  .filter(choice__question=models.OuterRef('pk'))
+                  .values('choice__question')
+                  .annotate(total=models.Sum('votes'))
+                  .values('total'))
+        return self.annotate(live_total_votes=models.F('total_votes')
+                             + Coalesce(models.Subquery(shards), 0))
+
+    def before(self, pub_date, pk):
+        """
+        Questions that come after (pub_date, pk) in newest_first() order.
+        """
+        return self.filter(
+            models.Q(pub_date__lt=pub_date)
+            | models.Q(pub_date=pub_date, id__lt=pk)
+        )
+
+
 class Question(models.Model):
     """
     This class contains questions that will be shown on the web page.
@@ -12,6 +78,32 @@ class Question(models.Model):
     question_text = models.CharField(max_length=200)
     pub_date = models.DateTimeField('date published', default=timezone.now)
     end_date = models.DateTimeField('end date', null=True)
+    total_votes = models.IntegerField(default=0)
+    # number of ChoiceShard rows each choice's tally is spread over, raise
+    # it for polls so busy that voters queue on the same tally row
+    tally_shards = models.PositiveSmallIntegerField(default=1)
+
+    class Status(models.IntegerChoices):
+        SCHEDULED = 0, 'Scheduled'
+        OPEN = 1, 'Open'
+        CLOSED = 2, 'Closed'
+
+    # where the question stood at its last pub_date or end_date, set on
+    # save and moved on at those times by polls.schedule
+    status = models.PositiveSmallIntegerField(choices=Status.choices,
+                                              default=Status.SCHEDULED)
+
+    objects = QuestionQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['pub_date', 'id'],
+                         name='polls_question_pub_id_idx'),
+            models.Index(fields=['status', 'pub_date', 'id'],
+                         name='polls_question_status_pub_idx'),
+            models.Index(fields=['status', 'end_date'],
+                         name='polls_question_status_end_idx'),
+        ]
 
     def __str__(self):
         """
@@ -19,6 +111,26 @@ class Question(models.Model):
         """
         return self.question_text
 
+    def save(self, *args, **kwargs):
+        """
+        Work out the status from the dates being saved.
+        """
+        self.status = self.status_at(timezone.now())
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = {*update_fields, 'status'}
+        super().save(*args, **kwargs)
+
+    def status_at(self, now):
+        """
+        Return the status of the question at `now`.
+        """
+        if self.pub_date > now:
+            return self.Status.SCHEDULED
+        if self.end_date is not None and self.end_date <= now:
+            return self.Status.CLOSED
+        return self.Status.OPEN
+
     def was_published_recently(self):
         """
         This method is used to check if the question was published recently.
@@ -44,6 +156,32 @@ class Question(models.Model):
         return False
 
 
+class ChoiceQuerySet(models.QuerySet):
+    """
+    Queries on choices that see the votes still held in tally shards.
+    """
+
+    def with_live_votes(self):
+        """
+        Annotate every choice with `live_votes`, its stored tally plus the
+        sum of its shards.
+        """
+        shards = (ChoiceShard.objects.filter(choice=models.OuterRef('pk'))
+                  .values('choice')
+                  .annotate(total=models.Sum('votes'))
+                  .values('total'))
+        return self.annotate(live_votes=models.F('votes')
+                             + Coalesce(models.Subquery(shards), 0))
+
+    def with_voted(self, user):
+        """
+        Annotate every choice with `voted`, whether it is the current vote
+        of `user`.
+        """
+        return self.annotate(voted=models.Exists(Vote.objects.filter(
+            user=user, choice=models.OuterRef('pk'))))
+
+
 class Choice(models.Model):
     """
     This class contains choices to questions and
@@ -51,14 +189,12 @@ class Choice(models.Model):
     """
     question = models.ForeignKey(Question, on_delete=models.CASCADE)
     choice_text = models.CharField(max_length=200)
-    # votes = models.IntegerField(default=0)
+    # tally kept in step with the Vote table by polls.voting.cast_vote,
+    # rebuild with `manage.py rebuild_tallies` if it ever drifts. Votes of
+    # sharded questions wait in ChoiceShard until compacted into it.
+    votes = models.IntegerField(default=0)
 
-    @property
-    def votes(self):
-        """
-        Count the votes for this choice
-        """
-        return self.vote_set.count()
+    objects = ChoiceQuerySet.as_manager()
 
     def __str__(self):
         """
@@ -67,13 +203,78 @@ class Choice(models.Model):
         return self.choice_text
 
 
+class ChoiceShard(models.Model):
+    """
+    One slice of the tally of a Choice.
+
+    Votes on a question with more than one tally shard are counted here,
+    spread by user, so concurrent voters update different rows. The
+    shards are folded back into Choice.votes by `manage.py
+    compact_tallies`.
+    """
+    choice = models.ForeignKey(Choice, on_delete=models.CASCADE,
+                               related_name='shards')
+    shard = models.PositiveSmallIntegerField()
+    votes = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['choice', 'shard'],
+                                    name='polls_choiceshard_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.choice} shard {self.shard}: {self.votes}"
+
+
+class ResultSnapshot(models.Model):
+    """
+    The frozen results of a closed question.
+
+    Written once voting has ended, by `manage.py finalize_polls` or by the
+    first results request after the close, and read instead of counting
+    the Vote table. When `archived` is set the votes of the question have
+    been moved out of the Vote table.
+    """
+    question = models.OneToOneField(Question, on_delete=models.CASCADE,
+                                    primary_key=True,
+                                    related_name='snapshot')
+    # [{"id", "choice_text", "votes"}, ...] in choice id order
+    choices = models.JSONField()
+    total_votes = models.IntegerField()
+    finalized_at = models.DateTimeField(default=timezone.now)
+    archived = models.BooleanField(default=False)
+
+    def __str__(self):
+        return f"Results of {self.question}"
+
+
 class Vote(models.Model):
     """
     Records a Vote of a Choice by a User
     """
+    question = models.ForeignKey(Question, on_delete=models.CASCADE)
     choice = models.ForeignKey(Choice, on_delete=models.CASCADE)
     user = models.ForeignKey(User, on_delete=models.CASCADE)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'question'],
+                                    name='polls_vote_one_per_question'),
+        ]
+        indexes = [
+            models.Index(fields=['question', 'choice'],
+                         name='polls_vote_question_choice_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        """
+        Fill in the question from the choice when it is not given.
+        """
+        if self.question_id is None and self.choice_id is not None:
+            self.question_id = self.choice.question_id
+        super().save(*args, **kwargs)
+
     def __str__(self):
         """
         return text for vote
@@ -0,0 +1,278 @@
+import datetime
+import os
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.http import Http404
+from django.utils import timezone
+
+from .exports import COLUMNS, export_rows, gzip_chunks, render
+from .models import Choice, Question, ResultSnapshot, Vote
+
+
+def _version_key(question_id):
+    return f'polls:results-version:{question_id}'
+
+
+def _modified_key(question_id):
+    return f'polls:results-modified:{question_id}'
+
+
+def _results_key(question_id, version):
+    return f'polls:results:{question_id}:{version}'
+
+
+def results_version(question_id):
+    """
+    Return the current results version of a question.
+
+    A missing version starts from the clock rather than from 1, so an
+    evicted counter can never line up with results cached before it.
+    """
+    version = cache.get(_version_key(question_id))
+    if version is None:
+        cache.add(_version_key(question_id), time.time_ns(), None)
+        version = cache.get(_version_key(question_id))
+    return version
+
+
+def results_versions(question_ids):
+    """
+    Return the results versions of several questions, keyed by question
+    id, with one cache read.
+    """
+    keys = {_version_key(question_id): question_id
+            for question_id in question_ids}
+    found = cache.get_many(list(keys))
+    return {question_id: found.get(key) or results_version(question_id)
+            for key, question_id in keys.items()}
+
+
+def reset_results_version(question_id):
+    """
+    Forget the results version of a question, so its next version starts
+    from the clock. Used when a question is created, as its id may have
+    belonged to a deleted question whose pages are still cached.
+    """
+    cache.delete(_version_key(question_id))
+
+
+def bump_results_version(question_id):
+    """
+    Invalidate the cached results of a question.
+    """
+    cache.set(_modified_key(question_id), time.time(), None)
+    try:
+        cache.incr(_version_key(question_id))
+    except ValueError:
+        cache.add(_version_key(question_id), time.time_ns(), None)
+
+
+def results_modified(question_id):
+    """
+    Return when the results of a question last changed, as far as this
+    cache knows. A forgotten time restarts from now.
+    """
+    modified = cache.get(_modified_key(question_id))
+    if modified is None:
+        cache.add(_modified_key(question_id), time.time(), None)
+        modified = cache.get(_modified_key(question_id))
+    return datetime.datetime.fromtimestamp(modified, tz=datetime.timezone.utc)
+
+
+async def aresults_version(question_id):
+    """
+    Async version of results_version().
+    """
+    version = await cache.aget(_version_key(question_id))
+    if version is None:
+        await cache.aadd(_version_key(question_id), time.time_ns(), None)
+        version = await cache.aget(_version_key(question_id))
+    return version
+
+
+def _results_queries(question_id, using=None):
+    """
+    Return the question and tally querysets behind the results, read from
+    the `using` database or wherever the router sends them.
+
+    The question comes with its snapshot, if any, in the same query.
+    """
+    question = Question.objects.using(using).filter(pk=question_id).values(
+        'id', 'question_text', 'end_date', 'snapshot__choices',
+        'snapshot__total_votes')
+    choices = (Choice.objects.using(using).filter(question_id=question_id)
+               .with_live_votes()
+               .order_by('id')
+               .values('id', 'choice_text', 'live_votes'))
+    return question, choices
+
+
+def _from_snapshot(question):
+    """
+    Turn a question row into results when it has a snapshot.
+    """
+    choices = question.pop('snapshot__choices')
+    total_votes = question.pop('snapshot__total_votes')
+    if choices is None:
+        return None
+    question['choices'] = choices
+    question['total_votes'] = total_votes
+    question['final'] = True
+    return question
+
+
+def _build_results(question, choices):
+    for choice in choices:
+        choice['votes'] = choice.pop('live_votes')
+    question['choices'] = choices
+    question['total_votes'] = sum(choice['votes'] for choice in choices)
+    question['final'] = False
+    return question
+
+
+def _is_closed(results):
+    end_date = results['end_date']
+    return end_date is not None and end_date <= timezone.now()
+
+
+def _snapshot(results):
+    """
+    Return an unsaved ResultSnapshot of freshly counted results.
+    """
+    results['final'] = True
+    return ResultSnapshot(question_id=results['id'],
+                          choices=results['choices'],
+                          total_votes=results['total_votes'])
+
+
+def compute_results(question_id, using=None):
+    """
+    Read the results of a question from its tallies and their shards,
+    without counting the Vote table.
+
+    Returns a dict with the question id and text, one entry per choice,
+    the total and whether the results are `final`, or raises Http404 when
+    there is no such question. Closed questions are read from their
+    snapshot, which is written here the first time. `using` names the
+    database to read, the router's choice by default.
+    """
+    question, choices = _results_queries(question_id, using)
+    question = question.first()
+    if question is None:
+        raise Http404("No question found matching the query")
+    results = _from_snapshot(question)
+    if results is None:
+        if _is_closed(question):
+            # a snapshot is final, so count on the primary, never on a
+            # replica that may lag behind the last votes
+            question, choices = _results_queries(question_id, 'default')
+            question = question.first()
+            if question is None:
+                raise Http404("No question found matching the query")
+            results = _from_snapshot(question)
+            if results is not None:
+                return results
+            results = _build_results(question, list(choices))
+            ResultSnapshot.objects.bulk_create([_snapshot(results)],
+                                               ignore_conflicts=True)
+        else:
+            results = _build_results(question, list(choices))
+    return results
+
+
+async def acompute_results(question_id, using=None):
+    """
+    Async version of compute_results().
+    """
+    question, choices = _results_queries(question_id, using)
+    question = await question.afirst()
+    if question is None:
+        raise Http404("No question found matching the query")
+    results = _from_snapshot(question)
+    if results is None:
+        if _is_closed(question):
+            question, choices = _results_queries(question_id, 'default')
+            question = await question.afirst()
+            if question is None:
+                raise Http404("No question found matching the query")
+            results = _from_snapshot(question)
+            if results is not None:
+                return results
+            results = _build_results(question,
+                                     [choice async for choice in choices])
+            await ResultSnapshot.objects.abulk_create(
+                [_snapshot(results)], ignore_conflicts=True)
+        else:
+            results = _build_results(question,
+                                     [choice async for choice in choices])
+    return results
+
+
+def finalize_results(questions=None):
+    """
+    Write the snapshots of closed questions that do not have one yet.
+
+    `questions` narrows the questions looked at, all by default. Returns
+    the ids of the questions finalized.
+    """
+    if questions is None:
+        questions = Question.objects.all()
+    finalized = []
+    for question_id in (questions.closed().filter(snapshot__isnull=True)
+                        .values_list('id', flat=True).iterator()):
+        # counting the votes of a closed question writes its snapshot
+        compute_results(question_id)
+        finalized.append(question_id)
+    return finalized
+
+
+def archive_votes(question_id, directory):
+    """
+    Move the votes of a finalized question out of the Vote table into a
+    gzipped NDJSON file in `directory`, and return the file's path.
+
+    The file is synced to disk before the votes are deleted. The
+    question's results keep being served from its snapshot.
+    """
+    path = os.path.join(directory, f'question-{question_id}-votes.ndjson.gz')
+    rows = export_rows('votes', [question_id])
+    with open(path, 'wb') as file:
+        file.writelines(gzip_chunks(render(rows, COLUMNS['votes'], 'ndjson')))
+        file.flush()
+        os.fsync(file.fileno())
+    with transaction.atomic():
+        Vote.objects.filter(question_id=question_id).delete()
+        ResultSnapshot.objects.filter(question_id=question_id).update(
+            archived=True)
+    return path
+
+
+def get_results(question_id):
+    """
+    Return the results of a question, from the cache when possible.
+
+    The cache is filled from the primary: a replica may not have the vote
+    that bumped the version yet, and its tallies would then be cached as
+    the new results.
+    """
+    key = _results_key(question_id, results_version(question_id))
+    results = cache.get(key)
+    if results is None:
+        results = compute_results(question_id, 'default')
+        cache.set(key, results, settings.POLLS_RESULTS_CACHE_TIMEOUT)
+    return results
+
+
+async def aget_results(question_id):
+    """
+    Async version of get_results().
+    """
+    key = _results_key(question_id, await aresults_version(question_id))
+    results = await cache.aget(key)
+    if results is None:
+        results = await acompute_results(question_id, 'default')
+        await cache.aset(key, results, settings.POLLS_RESULTS_CACHE_TIMEOUT)
+    return results
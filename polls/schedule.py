@@ -0,0 +1,121 @@
+import math
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Min, Q
+from django.utils import timezone
+
+from .caching import bump_index_version, index_version
+from .models import Question
+from .results import bump_results_version, results_version
+from .voting import immediate_atomic
+
+_NEXT_TRANSITION_KEY = 'polls:next-transition'
+
+Status = Question.Status
+
+
+def next_transition():
+    """
+    Return when a stored status is next due to change: the earliest
+    pub_date of a scheduled question or end_date of an open one, or None.
+    """
+    moments = (Question.objects
+               .filter(status__in=[Status.SCHEDULED, Status.OPEN])
+               .aggregate(opens=Min('pub_date',
+                                    filter=Q(status=Status.SCHEDULED)),
+                          closes=Min('end_date',
+                                     filter=Q(status=Status.OPEN))))
+    return min((moment for moment in moments.values() if moment is not None),
+               default=None)
+
+
+def apply_transitions(now=None):
+    """
+    Open the scheduled questions whose pub_date has passed and close the
+    questions whose end_date has passed, and drop their cached results
+    and pages.
+
+    Returns the ids of the questions opened, the ids of those closed and
+    when the next transition is due, None when there is none. Only one
+    query is run when nothing is due.
+    """
+    if now is None:
+        now = timezone.now()
+    opened, closed = [], []
+    upcoming = next_transition()
+    if upcoming is not None and upcoming <= now:
+        opened, closed, upcoming = _transition(now)
+    cache.set(_NEXT_TRANSITION_KEY,
+              upcoming.timestamp() if upcoming is not None else math.inf,
+              settings.POLLS_SCHEDULE_INTERVAL)
+    return opened, closed, upcoming
+
+
+def _transition(now):
+    ends_later = Q(end_date__isnull=True) | Q(end_date__gt=now)
+    with immediate_atomic():
+        opened = list(Question.objects
+                      .filter(ends_later, status=Status.SCHEDULED,
+                              pub_date__lte=now)
+                      .values_list('id', flat=True))
+        closed = list(Question.objects
+                      .filter(status__in=[Status.SCHEDULED, Status.OPEN],
+                              pub_date__lte=now, end_date__lte=now)
+                      .values_list('id', flat=True))
+        Question.objects.filter(pk__in=opened).update(status=Status.OPEN)
+        Question.objects.filter(pk__in=closed).update(status=Status.CLOSED)
+        upcoming = next_transition()
+    changed = opened + closed
+
+    def invalidate():
+        for question_id in changed:
+            bump_results_version(question_id)
+        bump_index_version()
+
+    # only once committed, so a page read meanwhile is cached under the
+    # old version
+    if changed:
+        transaction.on_commit(invalidate)
+    return opened, closed, upcoming
+
+
+def advance():
+    """
+    Bring the stored statuses up to date when a transition is due.
+
+    Only reads the cache otherwise, so it can run before every query on
+    the status. The `run_schedule` worker applies transitions as they
+    fall due; this is the fallback for when it is late or not running.
+    """
+    due = cache.get(_NEXT_TRANSITION_KEY)
+    if due is not None and timezone.now().timestamp() < due:
+        return
+    apply_transitions()
+
+
+def reschedule():
+    """
+    Forget when the next transition is due, after questions were added or
+    their dates changed.
+    """
+    cache.delete(_NEXT_TRANSITION_KEY)
+
+
+def current_index_version():
+    """
+    Return the version of the polls index, which keys its cached pages,
+    once the statuses due to change are moved on.
+    """
+    advance()
+    return index_version()
+
+
+def current_results_version(question_id):
+    """
+    Return the version of a question, which keys its cached pages, once
+    the statuses due to change are moved on.
+    """
+    advance()
+    return results_version(question_id)
@@ -0,0 +1,114 @@
+import re
+
+from django.db import connections, router
+from django.db.models import Q, Value
+
+from .models import Question
+from .voting import immediate_atomic
+
+# FTS5 table of the question text and the choice texts of every question,
+# by question id, kept up to date by the triggers of migration 0014
+SEARCH_TABLE = 'polls_question_fts'
+
+_TERM = re.compile(r'\w+')
+
+_CHOICE_TEXTS = (
+    "SELECT group_concat(choice_text, ' ') FROM polls_choice "
+    "WHERE question_id = {}"
+)
+
+
+def uses_fts(connection):
+    """
+    Whether questions are searched with the FTS5 table on this connection,
+    rather than with icontains.
+    """
+    return connection.vendor == 'sqlite'
+
+
+def match_expression(query):
+    """
+    Return the FTS5 query matching every word of `query`, the last one as
+    a prefix since it may still be being typed, or '' when it has no
+    words. Quoting the words keeps FTS5 operators in the input from being
+    interpreted.
+    """
+    terms = [f'"{term}"' for term in _TERM.findall(query)]
+    if terms:
+        terms[-1] += '*'
+    return ' '.join(terms)
+
+
+def search_questions(query, after=None, limit=10):
+    """
+    Return up to `limit` published questions whose text or choices match
+    `query`, best match first, each with its `search_rank`.
+
+    Lower ranks are better matches; questions of equal rank come newest
+    first. `after` is the (search_rank, id) of the last question of the
+    previous page. FTS5 ranks every match with bm25, weighing the
+    question text twice as much as the choices; other backends match with
+    icontains and rank every question 0.
+    """
+    using = router.db_for_read(Question)
+    if uses_fts(connections[using]):
+        return _fts_search(using, query, after, limit)
+    return _icontains_search(using, query, after, limit)
+
+
+def _fts_search(using, query, after, limit):
+    expression = match_expression(query)
+    if not expression:
+        return []
+    sql = (
+        f"SELECT q.*, q.status = %s AS is_open, f.rank AS search_rank "
+        f"FROM (SELECT rowid, rank FROM {SEARCH_TABLE} "
+        f"WHERE {SEARCH_TABLE} MATCH %s) f "
+        f"JOIN polls_question q ON q.id = f.rowid "
+        f"WHERE q.status IN (%s, %s)"
+    )
+    params = [Question.Status.OPEN, expression,
+              Question.Status.OPEN, Question.Status.CLOSED]
+    if after is not None:
+        sql += " AND (f.rank > %s OR (f.rank = %s AND q.id < %s))"
+        params += [after[0], after[0], after[1]]
+    sql += " ORDER BY f.rank, q.id DESC LIMIT %s"
+    params.append(limit)
+    questions = list(Question.objects.raw(sql, params, using=using))
+    for question in questions:
+        question.is_open = bool(question.is_open)
+    return questions
+
+
+def _icontains_search(using, query, after, limit):
+    terms = _TERM.findall(query)
+    if not terms:
+        return []
+    questions = Question.objects.using(using).published()
+    for term in terms:
+        questions = questions.filter(
+            Q(question_text__icontains=term)
+            | Q(choice__choice_text__icontains=term))
+    if after is not None:
+        questions = questions.filter(id__lt=after[1])
+    return list(questions.annotate(search_rank=Value(0.0))
+                .order_by('-id').distinct()[:limit])
+
+
+def rebuild_index():
+    """
+    Fill the FTS5 table again from the questions and choices, and return
+    the number of questions indexed, or None when the database does not
+    use one.
+    """
+    connection = connections['default']
+    if not uses_fts(connection):
+        return None
+    with immediate_atomic(), connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {SEARCH_TABLE}")
+        cursor.execute(
+            f"INSERT INTO {SEARCH_TABLE}(rowid, question_text, choice_text) "
+            f"SELECT q.id, q.question_text, "
+            f"coalesce(({_CHOICE_TEXTS.format('q.id')}), '') "
+            f"FROM polls_question q")
+        return cursor.rowcount
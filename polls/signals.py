@@ -0,0 +1,119 @@
+from django.contrib.auth import get_user_model
+from django.conf import settings
+from django.contrib.auth.signals import user_logged_out
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from .auth import user_cache_key
+from .caching import bump_index_version
+from .models import Choice, Question, ResultSnapshot, Vote
+from .results import bump_results_version, reset_results_version
+from .schedule import reschedule
+from .voting import recount_tallies
+
+
+def _invalidate_question(question_id, using):
+    """
+    Bump the cached results and pages of a question now, and again once
+    the change is committed, so a request that read the old rows
+    meanwhile cannot leave them cached under the new version.
+    """
+    def invalidate():
+        bump_results_version(question_id)
+        bump_index_version()
+
+    invalidate()
+    transaction.on_commit(invalidate, using=using)
+
+
+@receiver([post_save, post_delete], sender=Question)
+def question_changed(sender, instance, using, created=False, **kwargs):
+    """
+    Drop the cached results and pages when a question is added, edited or
+    deleted, and look for the next status transition again.
+    """
+    if created:
+        reset_results_version(instance.pk)
+    _invalidate_question(instance.pk, using)
+    reschedule()
+    transaction.on_commit(reschedule, using=using)
+
+
+@receiver(post_save, sender=Question)
+def question_reopened(sender, instance, **kwargs):
+    """
+    Drop the results snapshot of a closed question whose voting is opened
+    again, unless its votes were archived.
+    """
+    if instance.can_vote():
+        ResultSnapshot.objects.filter(question_id=instance.pk,
+                                      archived=False).delete()
+
+
+@receiver([post_save, post_delete], sender=Choice)
+def choice_changed(sender, instance, using, **kwargs):
+    """
+    Drop the cached results when a choice is added, edited or deleted.
+    """
+    _invalidate_question(instance.question_id, using)
+
+
+@receiver(pre_delete, sender=Choice)
+@receiver(pre_delete, sender=get_user_model())
+def remember_voted_questions(sender, instance, origin=None, **kwargs):
+    """
+    Note the questions whose votes are about to be deleted along with a
+    choice or a user, unless the question goes as well.
+    """
+    if getattr(origin, 'model', type(origin)) is Question:
+        return
+    field = 'choice' if sender is Choice else 'user'
+    instance._voted_question_ids = set(
+        Vote.objects.filter(**{field: instance})
+        .values_list('question_id', flat=True).distinct())
+
+
+@receiver(post_delete, sender=Choice)
+@receiver(post_delete, sender=get_user_model())
+def recount_voted_questions(sender, instance, using, **kwargs):
+    """
+    Recount the tallies of the questions that lost votes with a deleted
+    choice or user, and drop their results.
+    """
+    question_ids = getattr(instance, '_voted_question_ids', None)
+    if not question_ids:
+        return
+    recount_tallies(Question.objects.filter(pk__in=question_ids)
+                    .exclude(snapshot__archived=True))
+    ResultSnapshot.objects.filter(question__in=question_ids,
+                                  archived=False).delete()
+    for question_id in question_ids:
+        _invalidate_question(question_id, using)
+
+
+@receiver([post_save, post_delete], sender=get_user_model())
+def user_changed(sender, instance, using, update_fields=None, **kwargs):
+    """
+    Drop the cached user when it is edited or deleted, and again once the
+    change is committed, so a request that reloaded the old row meanwhile
+    cannot leave it cached. Logging in only saves last_login, and caches
+    the user instead, as the next request of its session is about to load
+    it.
+    """
+    key = user_cache_key(instance.pk)
+    if update_fields == frozenset(['last_login']):
+        cache.set(key, instance, settings.POLLS_USER_CACHE_TIMEOUT)
+    else:
+        cache.delete(key)
+        transaction.on_commit(lambda: cache.delete(key), using=using)
+
+
+@receiver(user_logged_out)
+def logged_out(sender, request, user, **kwargs):
+    """
+    Drop the cached user when it logs out.
+    """
+    if user is not None:
+        cache.delete(user_cache_key(user.pk))
@@ -0,0 +1,144 @@
+import asyncio
+import json
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .results import (aget_results, aresults_version, get_results,
+                      results_version)
+
+
+class ResultsPublisher:
+    """
+    Watches the results of one question for every client of this process.
+
+    A single task checks the results version in the cache every
+    `interval` seconds, and when a vote has bumped it loads the new
+    results once and hands the changed tallies to every subscriber. Each
+    subscriber gets a queue of (previous_version, version, results,
+    changed) tuples, where `changed` maps choice ids to their new votes.
+    The task ends when the last subscriber leaves.
+    """
+
+    def __init__(self, question_id, interval):
+        self.question_id = question_id
+        self.interval = interval
+        self.subscribers = set()
+        self.version = None
+        self.results = None
+        self.task = None
+
+    def subscribe(self):
+        """
+        Return a new subscriber queue, primed with the current results.
+        """
+        queue = asyncio.Queue()
+        if self.results is not None:
+            queue.put_nowait((None, self.version, self.results,
+                              _tallies(self.results)))
+        self.subscribers.add(queue)
+        if self.task is None:
+            self.task = asyncio.create_task(self._run())
+        return queue
+
+    def unsubscribe(self, queue):
+        self.subscribers.discard(queue)
+
+    async def _run(self):
+        try:
+            while self.subscribers:
+                version = await aresults_version(self.question_id)
+                if version != self.version:
+                    await self._publish(version)
+                await asyncio.sleep(self.interval)
+        finally:
+            self.task = None
+            if _publishers.get(self.question_id) is self:
+                del _publishers[self.question_id]
+
+    async def _publish(self, version):
+        results = await aget_results(self.question_id)
+        old = _tallies(self.results) if self.results is not None else {}
+        changed = {choice_id: votes
+                   for choice_id, votes in _tallies(results).items()
+                   if old.get(choice_id) != votes}
+        event = (self.version, version, results, changed)
+        self.version, self.results = version, results
+        for queue in self.subscribers:
+            queue.put_nowait(event)
+
+
+def _tallies(results):
+    return {choice['id']: choice['votes'] for choice in results['choices']}
+
+
+_publishers = {}
+
+
+def get_publisher(question_id):
+    """
+    Return the publisher of a question, creating it on first use.
+    """
+    publisher = _publishers.get(question_id)
+    if publisher is None:
+        publisher = ResultsPublisher(
+            question_id, settings.POLLS_STREAM_POLL_MS / 1000)
+        _publishers[question_id] = publisher
+    return publisher
+
+
+def _event(name, version, data):
+    return (f"id: {version}\nevent: {name}\n"
+            f"data: {json.dumps(data, cls=DjangoJSONEncoder)}\n\n")
+
+
+async def results_events(question_id, last_event_id=None):
+    """
+    Yield the Server-Sent Events of the results of a question.
+
+    The first event is a `snapshot` with every tally, unless the client
+    reconnects with a Last-Event-ID that is still current. After that each
+    committed vote yields a `delta` with only the choices whose tally
+    changed, and a comment line is sent as a heartbeat when nothing
+    happens for POLLS_STREAM_HEARTBEAT_SECONDS.
+    """
+    publisher = get_publisher(question_id)
+    queue = publisher.subscribe()
+    sent = last_event_id
+    try:
+        yield f"retry: {settings.POLLS_STREAM_RETRY_MS}\n\n"
+        while True:
+            try:
+                previous, version, results, changed = await asyncio.wait_for(
+                    queue.get(), settings.POLLS_STREAM_HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                yield ": heartbeat\n\n"
+                continue
+            if str(version) == sent:
+                continue
+            if previous is not None and str(previous) == sent:
+                yield _event('delta', version, {
+                    'total_votes': results['total_votes'],
+                    'choices': changed,
+                })
+            else:
+                yield _event('snapshot', version, results)
+            sent = str(version)
+    finally:
+        publisher.unsubscribe(queue)
+
+
+def results_snapshot_events(question_id, last_event_id=None):
+    """
+    Yield the retry interval and one `snapshot`, unless the client already
+    has the current version, and end.
+
+    Used under WSGI, where an endless stream would hold a worker per
+    watcher: the browser reconnects every POLLS_STREAM_RETRY_MS
+    milliseconds instead, which turns the stream into cheap polling
+    answered from the cache.
+    """
+    yield f"retry: {settings.POLLS_STREAM_RETRY_MS}\n\n"
+    version = results_version(question_id)
+    if str(version) != last_event_id:
+        yield _event('snapshot', version, get_results(question_id))
@@ -0,0 +1,13 @@
+from django import template
+
+from polls.voting import new_vote_token
+
+register = template.Library()
+
+
+@register.simple_tag
+def vote_token():
+    """
+    Render a fresh idempotency token for a vote form.
+    """
+    return new_vote_token()
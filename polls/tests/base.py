@@ -0,0 +1,16 @@
+from django.core.cache import cache
+from django.test import TestCase
+
+
+class EmptyCacheTestCase(TestCase):
+    """
+    TestCase that starts every test with an empty cache.
+
+    Rolling back the questions of a test does not bump the versions the
+    cached pages are keyed on, so a later test could otherwise be served
+    a page cached by an earlier one.
+    """
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
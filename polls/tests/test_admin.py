@@ -0,0 +1,166 @@
+import datetime
+from unittest import mock
+
+from django.contrib.admin.helpers import ACTION_CHECKBOX_NAME
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from polls.caching import index_version
+from polls.admin import EstimatedCountPaginator
+from polls.models import Choice, Question, ResultSnapshot, Vote
+from polls.results import results_version
+from polls.voting import cast_vote
+
+
+def create_question(question_text='', days=0, end_time=1):
+    """
+    Create a question with the given `question_text` and published the
+    given number of `days` offset to now, open for `end_time` days.
+    """
+    time = timezone.now() + datetime.timedelta(days=days)
+    time_end = timezone.now() + datetime.timedelta(days=end_time)
+    return Question.objects.create(question_text=question_text, pub_date=time, end_date=time_end)
+
+
+class PollsAdminTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser(username='admin', password='Secret.Pass123')
+        self.client.force_login(self.admin)
+        self.question = create_question(question_text='Admin question', days=-1)
+        self.choice = self.question.choice_set.create(choice_text='Only choice')
+
+    def add_votes(self, count):
+        for n in range(count):
+            user = User.objects.create_user(username=f'voter{User.objects.count()}')
+            cast_vote(user, self.question, self.choice)
+
+    def test_vote_list_queries_do_not_grow(self):
+        """
+        The vote list runs the same number of queries however many votes it
+        shows, and does not count the whole table.
+        """
+        url = reverse('admin:polls_vote_changelist')
+        self.add_votes(2)
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as context:
+            self.client.get(url)
+        self.add_votes(10)
+        with self.assertNumQueries(len(context.captured_queries)):
+            response = self.client.get(url)
+        self.assertContains(response, 'voter')
+        self.assertFalse(any('COUNT(' in query['sql'] and 'LIMIT' not in query['sql']
+                             for query in context.captured_queries))
+
+    def test_vote_list_count_follows_deletions(self):
+        """
+        The vote list is counted exactly up to the paginator's limit, and
+        stays right when votes are deleted.
+        """
+        self.add_votes(5)
+        Vote.objects.filter(pk__lt=Vote.objects.order_by('-pk')[0].pk).delete()
+        self.assertEqual(EstimatedCountPaginator(Vote.objects.order_by('pk'), 2).count, 1)
+        self.add_votes(4)
+        with mock.patch.object(EstimatedCountPaginator, 'count_limit', 2):
+            self.assertEqual(EstimatedCountPaginator(Vote.objects.order_by('pk'), 2).count, 3)
+
+    def test_question_list_shows_totals(self):
+        self.add_votes(3)
+        response = self.client.get(reverse('admin:polls_question_changelist'))
+        self.assertContains(response, '<td class="field-live_total">3</td>', html=True)
+
+    def run_action(self, action):
+        return self.client.post(reverse('admin:polls_question_changelist'), {
+            'action': action,
+            ACTION_CHECKBOX_NAME: [self.question.pk],
+        })
+
+    def test_close_now(self):
+        self.run_action('close_now')
+        self.question.refresh_from_db()
+        self.assertFalse(self.question.can_vote())
+
+    def test_close_now_skips_scheduled_polls(self):
+        """
+        Closing a poll that is not published yet would publish it, so it
+        is left scheduled.
+        """
+        scheduled = create_question(question_text='Later', days=5, end_time=9)
+        version = index_version()
+        self.client.post(reverse('admin:polls_question_changelist'), {
+            'action': 'close_now',
+            ACTION_CHECKBOX_NAME: [self.question.pk, scheduled.pk],
+        })
+        scheduled.refresh_from_db()
+        self.question.refresh_from_db()
+        self.assertEqual(scheduled.status, Question.Status.SCHEDULED)
+        self.assertEqual(self.question.status, Question.Status.CLOSED)
+        self.assertFalse(Question.objects.published().filter(pk=scheduled.pk).exists())
+        self.assertNotEqual(index_version(), version)
+
+    def test_close_now_with_no_date_filter(self):
+        """
+        Polls closed from a changelist filtered on having no end date are
+        still invalidated, although they no longer match the filter.
+        """
+        Question.objects.filter(pk=self.question.pk).update(end_date=None)
+        version = results_version(self.question.id)
+        self.client.post(reverse('admin:polls_question_changelist') + '?end_date__isnull=True', {
+            'action': 'close_now',
+            ACTION_CHECKBOX_NAME: [self.question.pk],
+        })
+        self.assertNotEqual(results_version(self.question.id), version)
+
+    def test_votes_are_read_only(self):
+        self.add_votes(1)
+        vote = Vote.objects.get()
+        self.assertEqual(self.client.get(reverse('admin:polls_vote_add')).status_code, 403)
+        response = self.client.post(reverse('admin:polls_vote_change', args=(vote.pk,)),
+                                    {'choice': self.choice.pk})
+        self.assertEqual(response.status_code, 403)
+
+    def test_deleting_votes_recounts(self):
+        """
+        Votes deleted in the admin take their tallies with them.
+        """
+        self.add_votes(2)
+        version = results_version(self.question.id)
+        self.client.post(reverse('admin:polls_vote_changelist'), {
+            'action': 'delete_selected',
+            ACTION_CHECKBOX_NAME: [Vote.objects.first().pk],
+            'post': 'yes',
+        })
+        self.question.refresh_from_db()
+        self.assertEqual(Vote.objects.count(), 1)
+        self.assertEqual(self.question.total_votes, 1)
+        self.assertEqual(Choice.objects.get(pk=self.choice.pk).votes, 1)
+        self.assertNotEqual(results_version(self.question.id), version)
+
+    def test_reset_votes(self):
+        self.add_votes(3)
+        self.run_action('reset_votes')
+        self.question.refresh_from_db()
+        self.assertEqual(Vote.objects.count(), 0)
+        self.assertEqual(self.question.total_votes, 0)
+        self.assertEqual(Choice.objects.get(pk=self.choice.pk).votes, 0)
+
+    def test_reset_votes_keeps_archived_polls(self):
+        self.add_votes(2)
+        ResultSnapshot.objects.create(question=self.question, choices=[],
+                                      total_votes=2, archived=True)
+        response = self.run_action('reset_votes')
+        self.assertEqual(Vote.objects.count(), 2)
+        self.assertTrue(ResultSnapshot.objects.get(question=self.question).archived)
+        self.assertContains(self.client.get(response.url), 'Skipped 1 archived polls.')
+
+    def test_recount(self):
+        self.add_votes(2)
+        Choice.objects.update(votes=9)
+        Question.objects.update(total_votes=9)
+        self.run_action('recount')
+        self.question.refresh_from_db()
+        self.assertEqual(self.question.total_votes, 2)
+        self.assertEqual(Choice.objects.get(pk=self.choice.pk).votes, 2)
@@ -0,0 +1,89 @@
+import datetime
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from polls.models import Question
+from polls.voting import cast_vote
+
+
+def create_question(question_text='', days=0, end_time=1):
+    """
+    Create a question with the given `question_text` and published the
+    given number of `days` offset to now, open for `end_time` days.
+    """
+    time = timezone.now() + datetime.timedelta(days=days)
+    time_end = timezone.now() + datetime.timedelta(days=end_time)
+    return Question.objects.create(question_text=question_text, pub_date=time, end_date=time_end)
+
+
+class ResultsApiTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='tester')
+        self.question = create_question(question_text='Open question', days=-1)
+        self.choice = self.question.choice_set.create(choice_text='Only choice')
+        self.url = reverse('polls:api-results', args=(self.question.id,))
+
+    def test_results_json(self):
+        """
+        The results API returns the tallies with an ETag and Last-Modified.
+        """
+        response = self.client.get(self.url)
+        data = response.json()
+        self.assertEqual(data['question_text'], 'Open question')
+        self.assertEqual(data['choices'][0]['votes'], 0)
+        self.assertTrue(response['ETag'].startswith('"'))
+        self.assertIn('Last-Modified', response)
+        self.assertIn('no-cache', response['Cache-Control'])
+
+    def test_not_modified_without_queries(self):
+        """
+        A request with the current ETag gets a 304 without any query.
+        """
+        etag = self.client.get(self.url)['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_vote_changes_etag(self):
+        """
+        A committed vote changes the ETag, so the next request gets the new
+        tallies.
+        """
+        etag = self.client.get(self.url)['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            cast_vote(self.user, self.question, self.choice)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['total_votes'], 1)
+
+    def test_closed_poll_cached_long(self):
+        """
+        The results of a closed poll may be cached for a long time.
+        """
+        closed = create_question(question_text='Closed', days=-5, end_time=-1)
+        response = self.client.get(reverse('polls:api-results', args=(closed.id,)))
+        self.assertIn('max-age=86400', response['Cache-Control'])
+        self.assertIn('public', response['Cache-Control'])
+
+    def test_missing_question(self):
+        response = self.client.get(reverse('polls:api-results', args=(999,)))
+        self.assertEqual(response.status_code, 404)
+
+
+class QuestionsApiTests(TestCase):
+    def test_questions(self):
+        """
+        The questions API lists published questions, newest first.
+        """
+        create_question(question_text='Old', days=-2)
+        create_question(question_text='New', days=-1)
+        create_question(question_text='Future', days=3, end_time=5)
+        data = self.client.get(reverse('polls:api-questions')).json()
+        self.assertEqual([question['question_text'] for question in data['questions']],
+                         ['New', 'Old'])
+        self.assertIsNone(data['next_cursor'])
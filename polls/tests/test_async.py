@@ -0,0 +1,73 @@
+import datetime
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import include, path, reverse
+from django.utils import timezone
+
+from polls.models import Question, Vote
+
+urlpatterns = [
+    path('polls/', include('polls.async_urls')),
+    path('accounts/', include('django.contrib.auth.urls')),
+]
+
+
+def create_question(question_text='', days=0, end_time=1):
+    """
+    Create a question with the given `question_text` and published the
+    given number of `days` offset to now, open for `end_time` days.
+    """
+    time = timezone.now() + datetime.timedelta(days=days)
+    time_end = timezone.now() + datetime.timedelta(days=end_time)
+    return Question.objects.create(question_text=question_text, pub_date=time, end_date=time_end)
+
+
+@override_settings(ROOT_URLCONF=__name__)
+class AsyncViewTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='tester')
+        self.question = create_question(question_text='Async question', days=-1)
+        self.choice = self.question.choice_set.create(choice_text='Only choice')
+
+    async def test_detail(self):
+        """
+        The async detail page lists the choices of a published question.
+        """
+        response = await self.async_client.get(reverse('polls:detail', args=(self.question.id,)))
+        self.assertContains(response, 'Only choice')
+
+    async def test_detail_future_question(self):
+        """
+        The async detail page of an unpublished question returns 404.
+        """
+        future = await Question.objects.acreate(
+            question_text='Future', pub_date=timezone.now() + datetime.timedelta(days=5))
+        response = await self.async_client.get(reverse('polls:detail', args=(future.id,)))
+        self.assertEqual(response.status_code, 404)
+
+    async def test_vote_requires_login(self):
+        """
+        Anonymous votes are redirected to the login page.
+        """
+        url = reverse('polls:vote', args=(self.question.id,))
+        response = await self.async_client.post(url, {'choice': self.choice.id})
+        self.assertEqual(response.status_code, 302)
+        self.assertIn(reverse('login'), response.url)
+        self.assertEqual(await Vote.objects.acount(), 0)
+
+    async def test_vote_and_results(self):
+        """
+        An async vote is recorded and shows up on the async results page.
+        """
+        await sync_to_async(self.async_client.force_login)(self.user)
+        url = reverse('polls:vote', args=(self.question.id,))
+        response = await self.async_client.post(url, {'choice': self.choice.id})
+        results_url = reverse('polls:results', args=(self.question.id,))
+        self.assertEqual(response.url, results_url)
+        self.assertEqual(await Vote.objects.filter(user=self.user).acount(), 1)
+        response = await self.async_client.get(results_url)
+        self.assertContains(response, 'Async question')
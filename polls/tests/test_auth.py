@@ -0,0 +1,58 @@
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+
+from polls.auth import user_cache_key
+from polls.models import Question
+
+
+class CachedAuthTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='tester', password='Secret.Pass123')
+        self.client.login(username='tester', password='Secret.Pass123')
+        self.question = Question.objects.create(question_text='Question')
+
+    def test_authenticated_reads_skip_auth_queries(self):
+        """
+        Once warm, a logged-in index or results request loads neither the
+        session nor the user from the database.
+        """
+        self.client.get(reverse('polls:index'))
+        with self.assertNumQueries(1):
+            self.client.get(reverse('polls:index'))
+        results = reverse('polls:results', args=(self.question.id,))
+        self.client.get(results)
+        with self.assertNumQueries(0):
+            self.client.get(results)
+
+    def test_saving_user_drops_cache(self):
+        """
+        A user deactivated after being cached is logged out on the next
+        request.
+        """
+        self.client.get(reverse('polls:index'))
+        self.assertIsNotNone(cache.get(user_cache_key(self.user.pk)))
+        self.user.is_active = False
+        self.user.save()
+        self.assertIsNone(cache.get(user_cache_key(self.user.pk)))
+        response = self.client.post(reverse('polls:vote', args=(self.question.id,)))
+        self.assertEqual(response.status_code, 302)
+        self.assertIn(reverse('login'), response.url)
+
+    def test_user_recached_before_commit_is_dropped(self):
+        """
+        A stale user cached by another request while the change is not yet
+        committed is dropped again on commit.
+        """
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = False
+            self.user.save()
+            cache.set(user_cache_key(self.user.pk), User.objects.get(pk=self.user.pk))
+        self.assertIsNone(cache.get(user_cache_key(self.user.pk)))
+
+    def test_logout_drops_cache(self):
+        self.client.get(reverse('polls:index'))
+        self.client.post(reverse('logout'))
+        self.assertIsNone(cache.get(user_cache_key(self.user.pk)))
@@ -0,0 +1,126 @@
+import datetime
+import os
+import tempfile
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from django.urls import reverse
+
+from mysite import metrics
+from polls import buffer
+from polls.buffer import VoteBuffer
+from polls.models import Question, Vote
+
+
+def create_question(question_text='', days=0, end_time=1):
+    """
+    Create a question with the given `question_text` and published the
+    given number of `days` offset to now, open for `end_time` days.
+    """
+    time = timezone.now() + datetime.timedelta(days=days)
+    time_end = timezone.now() + datetime.timedelta(days=end_time)
+    return Question.objects.create(question_text=question_text, pub_date=time, end_date=time_end)
+
+
+class VoteBufferTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.users = [User.objects.create_user(username=f'user{n}') for n in range(3)]
+        self.question = create_question(question_text='Question', days=-1)
+        self.first = self.question.choice_set.create(choice_text='First')
+        self.second = self.question.choice_set.create(choice_text='Second')
+
+    def assertTallies(self, first, second, total):
+        self.first.refresh_from_db()
+        self.second.refresh_from_db()
+        self.question.refresh_from_db()
+        self.assertEqual((self.first.votes, self.second.votes, self.question.total_votes),
+                         (first, second, total))
+
+    def test_flush_coalesces_votes(self):
+        """
+        Only the last choice of each user is written when the buffer flushes.
+        """
+        votes = VoteBuffer()
+        votes.submit(self.users[0].id, self.question.id, self.first.id)
+        votes.submit(self.users[0].id, self.question.id, self.second.id)
+        votes.submit(self.users[1].id, self.question.id, self.first.id)
+        self.assertEqual(votes.stats()['queue_depth'], 2)
+        self.assertEqual(Vote.objects.count(), 0)
+        self.assertEqual(votes.flush(), 2)
+        self.assertTallies(1, 1, 2)
+        self.assertEqual(votes.stats()['queue_depth'], 0)
+
+    def test_metrics_are_exported(self):
+        """
+        The queue depth and flush times are exported for /metrics, the
+        depth added up over every process.
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            registry = metrics.Registry(directory)
+            original, metrics._registry = metrics._registry, registry
+            try:
+                votes = VoteBuffer()
+                votes.submit(self.users[0].id, self.question.id, self.first.id)
+                votes.submit(self.users[1].id, self.question.id, self.first.id)
+                registry.write(registry.snapshot())
+                os.rename(os.path.join(directory, f'metrics-{os.getpid()}.json'),
+                          os.path.join(directory, 'metrics-0.json'))
+                text = metrics.exposition(registry.snapshot(merge=True))
+                self.assertIn('# TYPE polls_vote_buffer_queue_depth gauge', text)
+                self.assertIn('polls_vote_buffer_queue_depth 4', text)
+                votes.flush()
+                text = metrics.exposition(registry.snapshot())
+            finally:
+                metrics._registry = original
+        self.assertIn('polls_vote_buffer_queue_depth 0', text)
+        self.assertIn('polls_vote_buffer_flush_seconds_count 1', text)
+        self.assertIn('polls_vote_buffer_flushed_votes_total 2', text)
+
+    def test_flush_moves_existing_votes(self):
+        """
+        A buffered vote that changes an earlier choice moves the tally.
+        """
+        votes = VoteBuffer()
+        votes.submit(self.users[0].id, self.question.id, self.first.id)
+        votes.flush()
+        votes.submit(self.users[0].id, self.question.id, self.second.id)
+        votes.submit(self.users[2].id, self.question.id, self.second.id)
+        votes.flush()
+        self.assertTallies(0, 2, 2)
+
+    def test_journal_recovery(self):
+        """
+        Votes accepted but never flushed are queued again by the next buffer
+        opened on the same journal.
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            journal = os.path.join(directory, 'votes.journal')
+            votes = VoteBuffer(journal=journal, fsync=True)
+            votes.submit(self.users[0].id, self.question.id, self.first.id)
+            votes.submit(self.users[1].id, self.question.id, self.second.id)
+            recovered = VoteBuffer(journal=journal)
+            self.assertEqual(recovered.stats()['queue_depth'], 2)
+            recovered.flush()
+            self.assertTallies(1, 1, 2)
+            self.assertEqual(os.listdir(directory), ['votes.journal'])
+
+    @override_settings(POLLS_VOTE_BUFFER_ENABLED=True)
+    def test_vote_view_uses_buffer(self):
+        """
+        With buffering on, the vote view queues the vote instead of writing it.
+        """
+        votes = VoteBuffer()
+        self.client.force_login(self.users[0])
+        url = reverse('polls:vote', args=(self.question.id,))
+        original, buffer._buffer = buffer._buffer, votes
+        try:
+            response = self.client.post(url, {'choice': self.first.id})
+        finally:
+            buffer._buffer = original
+        self.assertRedirects(response, reverse('polls:results', args=(self.question.id,)))
+        self.assertEqual(Vote.objects.count(), 0)
+        votes.flush()
+        self.assertTallies(1, 0, 1)
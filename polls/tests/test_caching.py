@@ -0,0 +1,113 @@
+import datetime
+
+from django.contrib.auth.models import User
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from polls.caching import _timeout, cache_page_until
+from polls.models import Question
+from polls.results import results_version
+from polls.tests.base import EmptyCacheTestCase
+
+
+def create_question(question_text='', days=0, end_time=1):
+    """
+    Create a question with the given `question_text` and published the
+    given number of `days` offset to now, open for `end_time` days.
+    """
+    time = timezone.now() + datetime.timedelta(days=days)
+    time_end = timezone.now() + datetime.timedelta(days=end_time)
+    return Question.objects.create(question_text=question_text, pub_date=time, end_date=time_end)
+
+
+class AnonymousPageCacheTests(EmptyCacheTestCase):
+    def setUp(self):
+        super().setUp()
+        self.question = create_question(question_text='Cached question', days=-1)
+        self.choice = self.question.choice_set.create(choice_text='Cached choice')
+
+    def test_index_is_served_from_cache(self):
+        """
+        Anonymous visitors get the index without a query until a question
+        changes.
+        """
+        url = reverse('polls:index')
+        self.client.get(url)
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertContains(response, 'Cached question')
+        self.assertIn('Cookie', response['Vary'])
+        create_question(question_text='Newer question')
+        self.assertContains(self.client.get(url), 'Newer question')
+
+    def test_detail_and_results_are_served_from_cache(self):
+        for name in ('polls:detail', 'polls:results'):
+            url = reverse(name, args=(self.question.id,))
+            self.client.get(url)
+            with self.assertNumQueries(0):
+                response = self.client.get(url)
+            self.assertContains(response, 'Cached choice')
+
+    def test_choice_edit_invalidates_detail(self):
+        url = reverse('polls:detail', args=(self.question.id,))
+        self.client.get(url)
+        self.choice.choice_text = 'Renamed choice'
+        self.choice.save()
+        self.assertContains(self.client.get(url), 'Renamed choice')
+
+    def test_edit_invalidates_again_on_commit(self):
+        """
+        A page cached while a question edit is not yet committed is not
+        served after the commit.
+        """
+        with self.captureOnCommitCallbacks(execute=True):
+            self.question.question_text = 'Edited question'
+            self.question.save()
+            version = results_version(self.question.id)
+        self.assertNotEqual(results_version(self.question.id), version)
+
+    def test_anonymous_detail_has_no_csrf_token(self):
+        """
+        The shared detail page asks anonymous visitors to log in instead of
+        embedding a CSRF token of its own.
+        """
+        response = self.client.get(reverse('polls:detail', args=(self.question.id,)))
+        self.assertNotContains(response, 'csrfmiddlewaretoken')
+        self.assertContains(response, reverse('login'))
+        self.assertFalse(response.cookies)
+
+    def test_logged_in_users_get_fresh_pages(self):
+        """
+        Logged-in users are not served the anonymous page, and their detail
+        page reads the choices only when the cached list is out of date.
+        """
+        User.objects.create_user(username='member', password='Secret.Pass123')
+        url = reverse('polls:detail', args=(self.question.id,))
+        self.client.get(url)
+        self.client.login(username='member', password='Secret.Pass123')
+        self.client.get(url)
+        with self.assertNumQueries(1):
+            response = self.client.get(url)
+        self.assertContains(response, 'csrfmiddlewaretoken')
+        self.assertContains(response, 'Cached choice')
+
+    @override_settings(POLLS_PAGE_CACHE_TIMEOUT=0)
+    def test_disabled(self):
+        url = reverse('polls:index')
+        self.client.get(url)
+        with self.assertNumQueries(1):
+            self.client.get(url)
+
+
+class PageTimeoutTests(TestCase):
+    def test_page_expires_when_a_poll_closes(self):
+        request = RequestFactory().get('/')
+        response = self.client.get(reverse('polls:index'))
+        cache_page_until(request, timezone.now() + datetime.timedelta(seconds=30),
+                         timezone.now() - datetime.timedelta(seconds=30), None)
+        self.assertLessEqual(_timeout(request, response), 30)
+
+    def test_error_pages_are_not_cached(self):
+        response = self.client.get(reverse('polls:detail', args=(999,)))
+        self.assertIsNone(_timeout(RequestFactory().get('/'), response))
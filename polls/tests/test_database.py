@@ -0,0 +1,77 @@
+import datetime
+import threading
+
+from django.contrib.auth.models import User
+from django.db import connection, connections, OperationalError
+from django.test import TestCase, TransactionTestCase
+from django.utils import timezone
+
+from polls.models import Question, Vote
+from polls.voting import cast_vote
+
+
+def create_question(question_text='', days=0, end_time=1):
+    """
+    Create a question with the given `question_text` and published the
+    given number of `days` offset to now, open for `end_time` days.
+    """
+    time = timezone.now() + datetime.timedelta(days=days)
+    time_end = timezone.now() + datetime.timedelta(days=end_time)
+    return Question.objects.create(question_text=question_text, pub_date=time, end_date=time_end)
+
+
+class SQLiteProfileTests(TestCase):
+    def pragma(self, name):
+        with connection.cursor() as cursor:
+            cursor.execute(f"PRAGMA {name}")
+            return cursor.fetchone()[0]
+
+    def test_pragmas_applied(self):
+        """
+        Every connection runs in WAL mode with a busy timeout.
+        """
+        self.assertEqual(self.pragma('journal_mode'), 'wal')
+        self.assertEqual(self.pragma('busy_timeout'), 5000)
+        # NORMAL
+        self.assertEqual(self.pragma('synchronous'), 1)
+
+
+class ConcurrentVoteTests(TransactionTestCase):
+    databases = '__all__'
+    writers = 16
+    votes_per_writer = 10
+
+    def setUp(self):
+        self.question = create_question(question_text='Busy question', days=-1)
+        self.choices = [self.question.choice_set.create(choice_text=str(n)) for n in range(3)]
+        self.users = [User.objects.create_user(username=f'voter{n}') for n in range(self.writers)]
+
+    def test_concurrent_writers(self):
+        """
+        Many threads voting at once never see "database is locked", and the
+        tallies add up afterwards.
+        """
+        errors = []
+        start = threading.Barrier(self.writers)
+
+        def voter(user):
+            try:
+                start.wait()
+                for n in range(self.votes_per_writer):
+                    cast_vote(user, self.question, self.choices[n % len(self.choices)])
+            except OperationalError as error:
+                errors.append(error)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=voter, args=(user,)) for user in self.users]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.question.refresh_from_db()
+        self.assertEqual(self.question.total_votes, self.writers)
+        self.assertEqual(Vote.objects.filter(question=self.question).count(), self.writers)
+        tallies = [choice.votes for choice in self.question.choice_set.all()]
+        self.assertEqual(sum(tallies), self.writers)
@@ -0,0 +1,94 @@
+import csv
+import datetime
+import gzip
+import json
+import os
+import tempfile
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from polls.models import Question
+from polls.voting import cast_vote
+
+
+def create_question(question_text='', days=0, end_time=1):
+    """
+    Create a question with the given `question_text` and published the
+    given number of `days` offset to now, open for `end_time` days.
+    """
+    time = timezone.now() + datetime.timedelta(days=days)
+    time_end = timezone.now() + datetime.timedelta(days=end_time)
+    return Question.objects.create(question_text=question_text, pub_date=time, end_date=time_end)
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        self.staff = User.objects.create_user(username='staff', is_staff=True)
+        self.voter = User.objects.create_user(username='voter')
+        self.old = create_question(question_text='Old question', days=-10)
+        self.new = create_question(question_text='New question', days=-1)
+        for question in (self.old, self.new):
+            choice = question.choice_set.create(choice_text=f'{question} choice')
+            cast_vote(self.voter, question, choice)
+
+    def export(self, kind, **params):
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse('polls:export', args=(kind,)), params)
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content)
+
+    def test_votes_csv(self):
+        """
+        The votes export has one row per vote with its question, choice and
+        username.
+        """
+        rows = list(csv.DictReader(StringIO(self.export('votes').decode())))
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(rows[0]['username'], 'voter')
+        self.assertEqual(rows[0]['question_text'], 'Old question')
+
+    def test_tallies_ndjson_filtered(self):
+        """
+        The tallies export can be limited to questions published since a date.
+        """
+        since = (timezone.now() - datetime.timedelta(days=5)).date().isoformat()
+        lines = self.export('tallies', format='ndjson', since=since).decode().splitlines()
+        self.assertEqual([json.loads(line)['question_text'] for line in lines],
+                         ['New question'])
+        self.assertEqual(json.loads(lines[0])['votes'], 1)
+
+    def test_gzip(self):
+        body = gzip.decompress(self.export('votes', gzip='1', question=self.new.id))
+        self.assertEqual(len(body.decode().splitlines()), 2)
+
+    def test_staff_only(self):
+        """
+        Users who are not staff are sent to the admin login.
+        """
+        self.client.force_login(self.voter)
+        response = self.client.get(reverse('polls:export', args=('votes',)))
+        self.assertEqual(response.status_code, 302)
+
+    def test_bad_parameters(self):
+        self.client.force_login(self.staff)
+        url = reverse('polls:export', args=('votes',))
+        self.assertEqual(self.client.get(url, {'since': 'soon'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'format': 'xml'}).status_code, 400)
+
+    def test_command(self):
+        """
+        export_polls writes the same export to stdout or to a file.
+        """
+        out = StringIO()
+        call_command('export_polls', 'tallies', stdout=out)
+        self.assertEqual(len(out.getvalue().splitlines()), 3)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'votes.ndjson.gz')
+            call_command('export_polls', 'votes', '--format', 'ndjson', '--gzip', '-o', path)
+            with gzip.open(path, 'rt') as file:
+                self.assertEqual(len(file.readlines()), 2)
@@ -0,0 +1,123 @@
+import json
+from io import StringIO
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import call_command, CommandError
+from django.test import SimpleTestCase
+from django.urls import reverse
+
+from polls.importer import import_rows, read_csv, read_json
+from polls.models import Choice, Question, Vote
+
+from .base import EmptyCacheTestCase
+
+
+class ImportPollsTests(EmptyCacheTestCase):
+    def import_fixtures(self):
+        call_command('import_polls', str(settings.BASE_DIR / 'data' / 'users.json'),
+                     str(settings.BASE_DIR / 'data' / 'polls.json'), stdout=StringIO())
+
+    def test_import_fixtures(self):
+        """
+        The dumpdata fixtures in data/ import with their pre-hashed passwords.
+        """
+        self.import_fixtures()
+        self.assertEqual(Question.objects.count(), 3)
+        self.assertEqual(Choice.objects.count(), 30)
+        self.assertEqual(User.objects.count(), 4)
+        self.assertTrue(User.objects.get(pk=1).password.startswith('pbkdf2_sha256$'))
+
+    def test_import_is_repeatable(self):
+        """
+        Importing the same rows twice updates them instead of failing.
+        """
+        self.import_fixtures()
+        self.import_fixtures()
+        self.assertEqual(Choice.objects.count(), 30)
+
+    def test_import_csv_votes(self):
+        """
+        CSV votes that only name their choice get its question, and the
+        tallies are rebuilt afterwards.
+        """
+        self.import_fixtures()
+        choice = Choice.objects.get(pk=1)
+        votes = StringIO(f"user,choice\n1,{choice.pk}\n2,{choice.pk}\n2,999\n")
+        errors = []
+        importer = import_rows(read_csv(votes), model_label='polls.vote', batch_size=1,
+                               on_invalid=lambda number, error: errors.append(number))
+        self.assertEqual((importer.imported, importer.invalid), (2, 1))
+        self.assertEqual(errors, [3])
+        choice.refresh_from_db()
+        self.assertEqual(choice.votes, 2)
+        self.assertEqual(Vote.objects.filter(question=choice.question).count(), 2)
+
+    def test_imported_questions_get_their_status(self):
+        rows = [
+            {'model': 'polls.question', 'question_text': 'Past',
+             'pub_date': '2020-01-01 10:00', 'end_date': '2020-02-01 10:00'},
+            {'model': 'polls.question', 'question_text': 'Future',
+             'pub_date': '2999-01-01 10:00'},
+        ]
+        import_rows(rows)
+        self.assertEqual(Question.objects.get(question_text='Past').status,
+                         Question.Status.CLOSED)
+        self.assertEqual(Question.objects.get(question_text='Future').status,
+                         Question.Status.SCHEDULED)
+
+    def test_imported_questions_show_on_the_cached_index(self):
+        self.assertNotContains(self.client.get(reverse('polls:index')), 'Imported')
+        import_rows([{'model': 'polls.question', 'question_text': 'Imported',
+                      'pub_date': '2020-01-01 10:00'}])
+        self.assertContains(self.client.get(reverse('polls:index')), 'Imported')
+
+    def test_plain_passwords_are_hashed(self):
+        rows = [{'model': 'auth.user', 'username': 'student', 'password': 'Secret.Pass123'}]
+        import_rows(rows)
+        user = User.objects.get(username='student')
+        self.assertTrue(user.check_password('Secret.Pass123'))
+
+    def test_invalid_rows_are_skipped(self):
+        """
+        Rows with unknown models, unknown fields or bad values are reported
+        and skipped.
+        """
+        rows = [
+            {'model': 'polls.question', 'question_text': 'Good'},
+            {'model': 'polls.nothing'},
+            {'model': 'polls.question', 'colour': 'red'},
+            {'model': 'polls.question', 'question_text': 'Bad', 'pub_date': 'yesterday'},
+            {'model': 'polls.choice', 'choice_text': 'No question'},
+        ]
+        importer = import_rows(rows)
+        self.assertEqual((importer.imported, importer.invalid), (1, 4))
+
+    def test_ndjson_command(self):
+        """
+        The command reads NDJSON from a file named on the command line.
+        """
+        question = Question.objects.create(question_text='Question')
+        lines = [json.dumps({'model': 'polls.choice', 'question': question.pk,
+                             'choice_text': f'Choice {n}'}) for n in range(5)]
+        path = settings.BASE_DIR / 'test_import.ndjson'
+        path.write_text('\n'.join(lines))
+        try:
+            call_command('import_polls', str(path), stdout=StringIO())
+        finally:
+            path.unlink()
+        self.assertEqual(question.choice_set.count(), 5)
+
+    def test_csv_needs_model(self):
+        with self.assertRaises(CommandError):
+            call_command('import_polls', 'votes.csv', stdout=StringIO())
+
+
+class ReadJsonTests(SimpleTestCase):
+    def test_read_in_small_chunks(self):
+        """
+        The JSON reader yields the same objects whatever the chunk size.
+        """
+        items = [{'n': n, 'text': 'x' * n} for n in range(50)]
+        text = json.dumps(items, indent=2)
+        self.assertEqual(list(read_json(StringIO(text), chunk_size=7)), items)
@@ -1,10 +1,11 @@
 import datetime
 
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from django.utils import timezone
 from django.urls import reverse
 
 from polls.models import Question
+from polls.tests.base import EmptyCacheTestCase
 
 
 def create_question(question_text='', days=0, end_time=0):
@@ -18,7 +19,7 @@ def create_question(question_text='', days=0, end_time=0):
     return Question.objects.create(question_text=question_text, pub_date=time, end_date=time_end)
 
 
-class QuestionIndexViewTests(TestCase):
+class QuestionIndexViewTests(EmptyCacheTestCase):
     def test_no_questions(self):
         """
         If no questions exist, an appropriate message is displayed.
@@ -72,4 +73,56 @@ class QuestionIndexViewTests(TestCase):
         self.assertQuerysetEqual(
             response.context['latest_question_list'],
             [question2, question1],
-        )
\ No newline at end of file
+        )
+
+
+class QuestionIndexPaginationTests(TestCase):
+    @override_settings(POLLS_INDEX_PAGE_SIZE=2)
+    def test_pages_follow_the_cursor(self):
+        """
+        Each page links to the next with a cursor until the questions run out.
+        """
+        questions = [create_question(question_text=f"Q{n}", days=-n) for n in range(5)]
+        seen = []
+        url = reverse('polls:index')
+        while url:
+            response = self.client.get(url)
+            seen.extend(response.context['latest_question_list'])
+            cursor = response.context.get('next_cursor')
+            url = f"{reverse('polls:index')}?cursor={cursor}" if cursor else None
+        self.assertEqual(seen, questions)
+
+    @override_settings(POLLS_INDEX_PAGE_SIZE=2)
+    def test_same_pub_date(self):
+        """
+        Questions published at the same time are neither skipped nor repeated.
+        """
+        time = timezone.now() - datetime.timedelta(days=1)
+        questions = [Question.objects.create(question_text=f"Q{n}", pub_date=time) for n in range(3)]
+        first = self.client.get(reverse('polls:index'))
+        cursor = first.context['next_cursor']
+        second = self.client.get(f"{reverse('polls:index')}?cursor={cursor}")
+        self.assertEqual(
+            first.context['latest_question_list'] + second.context['latest_question_list'],
+            questions[::-1],
+        )
+
+    def test_invalid_cursor(self):
+        """
+        A malformed cursor returns a 404 not found.
+        """
+        response = self.client.get(f"{reverse('polls:index')}?cursor=nonsense")
+        self.assertEqual(response.status_code, 404)
+
+    def test_open_filter(self):
+        """
+        The open filter hides polls whose end_date has passed, and the status
+        is worked out in SQL.
+        """
+        open_question = create_question(question_text="Open.", days=-2, end_time=2)
+        closed_question = create_question(question_text="Closed.", days=-2, end_time=-1)
+        response = self.client.get(f"{reverse('polls:index')}?status=open")
+        self.assertEqual(response.context['latest_question_list'], [open_question])
+        response = self.client.get(f"{reverse('polls:index')}?status=closed")
+        self.assertEqual(response.context['latest_question_list'], [closed_question])
+        self.assertIs(response.context['latest_question_list'][0].is_open, False)
@@ -0,0 +1,84 @@
+import os
+import tempfile
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from mysite import metrics
+from polls.models import Question
+from polls.schedule import advance
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        self.registry = metrics.Registry()
+        self.original, metrics._registry = metrics._registry, self.registry
+
+    def tearDown(self):
+        metrics._registry = self.original
+
+    def test_requests_are_recorded(self):
+        """
+        A request is counted with its latency, queries, render time and size
+        under its URL name.
+        """
+        question = Question.objects.create(question_text='Measured')
+        # as between requests, the next status transition is cached
+        advance()
+        self.client.get(reverse('polls:detail', args=(question.id,)))
+        text = metrics.exposition(self.registry.snapshot())
+        self.assertIn('http_requests_total{method="GET",status="200",view="polls:detail"} 1', text)
+        self.assertIn('http_request_db_queries_sum{method="GET",view="polls:detail"} 2', text)
+        self.assertIn('# TYPE http_template_render_seconds histogram', text)
+        self.assertIn('http_response_size_bytes_count{method="GET",view="polls:detail"} 1', text)
+
+    @override_settings(DEBUG=True)
+    async def test_async_requests_are_recorded(self):
+        """
+        Under ASGI the middleware runs async, without being adapted into a
+        thread, and still sees the queries the views run in their sync
+        thread.
+        """
+        question = await Question.objects.acreate(question_text='Measured')
+        await sync_to_async(advance)()
+        with self.assertNoLogs('django.request', 'DEBUG'):
+            await self.async_client.get(reverse('polls:detail', args=(question.id,)))
+        text = metrics.exposition(self.registry.snapshot())
+        self.assertIn('http_request_db_queries_sum{method="GET",view="polls:detail"} 2', text)
+
+    @override_settings(METRICS_TOKEN='scraper-token')
+    def test_metrics_endpoint_is_protected(self):
+        """
+        /metrics answers staff users and requests with the token only.
+        """
+        url = reverse('metrics')
+        self.assertEqual(self.client.get(url).status_code, 403)
+        response = self.client.get(url, HTTP_AUTHORIZATION='Bearer scraper-token')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('# TYPE http_requests_total counter', response.content.decode())
+        self.client.force_login(User.objects.create_user(username='admin', is_staff=True))
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+    @override_settings(METRICS_SLOW_REQUEST_MS=0)
+    def test_slow_requests_are_logged(self):
+        with self.assertLogs('mysite.middleware', 'WARNING') as logs:
+            self.client.get(reverse('polls:index'))
+        self.assertIn('SELECT', logs.output[0])
+
+    def test_processes_are_merged(self):
+        """
+        With a shared directory, the totals of every process are added up.
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            other = metrics.Registry(directory)
+            other.inc('http_requests_total', {'view': 'polls:index'}, 2)
+            other.write(other.snapshot())
+            # pretend the other registry belongs to another process
+            os.rename(os.path.join(directory, f'metrics-{os.getpid()}.json'),
+                      os.path.join(directory, 'metrics-0.json'))
+            mine = metrics.Registry(directory)
+            mine.inc('http_requests_total', {'view': 'polls:index'})
+            text = metrics.exposition(mine.snapshot(merge=True))
+        self.assertIn('http_requests_total{view="polls:index"} 3', text)
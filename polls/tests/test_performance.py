@@ -0,0 +1,258 @@
+import datetime
+import json
+import statistics
+import tempfile
+import time
+from unittest import mock
+
+from decouple import config
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import connection
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
+from django.utils import timezone
+
+from mysite.cache import SharedMemoryCache
+from mysite.middleware import RateLimitMiddleware
+from mysite.ratelimit import LocalBackend
+from polls.models import Choice, Question, Vote
+from polls.schedule import advance
+from polls.votelog import VoteLog, encode, read_events, replay
+from polls.voting import rebuild_tallies
+
+# Data volumes, raise them to benchmark a realistic database:
+#   POLLS_BENCHMARK_QUESTIONS=2000 POLLS_BENCHMARK_VOTERS=500 \
+#   POLLS_BENCHMARK_OUTPUT=bench.json python manage.py test polls.tests.test_performance
+# and add POLLS_BENCHMARK_STRICT=1 to fail on slow timings as well.
+QUESTIONS = config('POLLS_BENCHMARK_QUESTIONS', cast=int, default=30)
+CHOICES = config('POLLS_BENCHMARK_CHOICES', cast=int, default=5)
+VOTERS = config('POLLS_BENCHMARK_VOTERS', cast=int, default=20)
+REPEAT = config('POLLS_BENCHMARK_REPEAT', cast=int, default=20)
+# JSON file the measurements are written to, for comparing runs.
+OUTPUT = config('POLLS_BENCHMARK_OUTPUT', default='')
+# Also fail on wall-clock timings, which are only recorded otherwise as
+# they depend on the machine and its load.
+STRICT = config('POLLS_BENCHMARK_STRICT', cast=bool, default=False)
+
+# Most SQL queries one request of each view may run, whatever the volumes.
+# The vote budget counts the SAVEPOINT and RELEASE that stand in for
+# BEGIN and COMMIT inside a TestCase.
+BUDGETS = {
+    'index': 1,
+    'detail': 2,
+    'results': 2,
+    'vote': 9,
+    'signup': 12,
+    'search': 1,
+}
+
+
+def percentile(samples, percent):
+    """
+    Return the `percent` percentile of the samples, nearest rank.
+    """
+    ordered = sorted(samples)
+    rank = max(0, round(percent / 100 * len(ordered)) - 1)
+    return ordered[rank]
+
+
+# a fast hasher, so signup measures the view rather than PBKDF2, and no
+# rate limits, which would stop the repeated requests
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+                   RATELIMITS={})
+class ViewBudgetTests(TestCase):
+    """
+    Times every polls view on seeded data and fails when a view runs more
+    queries than its budget.
+    """
+
+    measurements = {}
+
+    @classmethod
+    def setUpTestData(cls):
+        now = timezone.now()
+        Question.objects.bulk_create(
+            Question(question_text=f'Question {n}',
+                     pub_date=now - datetime.timedelta(hours=n + 1),
+                     end_date=now + datetime.timedelta(days=1),
+                     status=Question.Status.OPEN)
+            for n in range(QUESTIONS))
+        questions = list(Question.objects.all())
+        Choice.objects.bulk_create(
+            Choice(question=question, choice_text=f'Choice {n}')
+            for question in questions for n in range(CHOICES))
+        User.objects.bulk_create(User(username=f'voter{n}') for n in range(VOTERS))
+        choices = {}
+        for choice in Choice.objects.all():
+            choices.setdefault(choice.question_id, []).append(choice.id)
+        Vote.objects.bulk_create(
+            Vote(user_id=user_id, question_id=question_id,
+                 choice_id=choices[question_id][user_id % CHOICES])
+            for user_id in User.objects.values_list('id', flat=True)
+            for question_id in choices)
+        rebuild_tallies()
+        cls.question = questions[0]
+        cls.user = User.objects.create_user(username='benchmark')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        if OUTPUT:
+            with open(OUTPUT, 'w') as file:
+                json.dump({
+                    'volumes': {'questions': QUESTIONS, 'choices': CHOICES,
+                                'voters': VOTERS, 'repeat': REPEAT},
+                    'views': cls.measurements,
+                }, file, indent=2)
+
+    def setUp(self):
+        cache.clear()
+        # measure the steady state, with the next status transition cached
+        advance()
+
+    def measure(self, name, request):
+        """
+        Run `request` REPEAT times, record its latency percentiles and query
+        counts, and check the queries against the budget of the view.
+        """
+        latencies = []
+        queries = []
+        for n in range(REPEAT):
+            with CaptureQueriesContext(connection) as context:
+                started = time.perf_counter()
+                response = request(n)
+                latencies.append((time.perf_counter() - started) * 1000)
+            self.assertLess(response.status_code, 400)
+            queries.append(len(context.captured_queries))
+        self.measurements[name] = {
+            'p50_ms': percentile(latencies, 50),
+            'p90_ms': percentile(latencies, 90),
+            'p99_ms': percentile(latencies, 99),
+            'mean_ms': statistics.mean(latencies),
+            'max_queries': max(queries),
+            'mean_queries': statistics.mean(queries),
+            'budget': BUDGETS[name],
+        }
+        self.assertLessEqual(max(queries), BUDGETS[name],
+                             f"{name} ran {max(queries)} queries, "
+                             f"over its budget of {BUDGETS[name]}")
+
+    def test_index(self):
+        url = reverse('polls:index')
+        self.measure('index', lambda n: self.client.get(url))
+
+    def test_detail(self):
+        url = reverse('polls:detail', args=(self.question.id,))
+        self.measure('detail', lambda n: self.client.get(url))
+
+    def test_results(self):
+        url = reverse('polls:results', args=(self.question.id,))
+        self.measure('results', lambda n: self.client.get(url))
+
+    def test_vote(self):
+        self.client.force_login(self.user)
+        url = reverse('polls:vote', args=(self.question.id,))
+        choices = list(self.question.choice_set.values_list('id', flat=True))
+        self.measure('vote', lambda n: self.client.post(
+            url, {'choice': choices[n % len(choices)]}))
+
+    def test_search(self):
+        url = reverse('polls:search')
+        self.measure('search', lambda n: self.client.get(
+            url, {'q': f'question {n % QUESTIONS}'}))
+
+    def test_signup(self):
+        url = reverse('polls:signup')
+        self.measure('signup', lambda n: self.client.post(url, {
+            'username': f'newcomer{n}',
+            'password1': 'Secret.Pass123',
+            'password2': 'Secret.Pass123',
+        }))
+
+    def test_ratelimit_overhead(self):
+        """
+        The rate limiter on its own takes microseconds per request.
+        """
+        middleware = RateLimitMiddleware(lambda request: HttpResponse())
+        request = RequestFactory().post(reverse('polls:vote', args=(self.question.id,)))
+        request.resolver_match = resolve(request.path)
+        request.user = self.user
+        backend = LocalBackend()
+        runs = REPEAT * 500
+        limits = {'polls:vote': [f'user:{runs}/s', f'ip:{runs}/s']}
+        with override_settings(RATELIMITS=limits), \
+                mock.patch.object(middleware, '_backend', return_value=backend):
+            started = time.perf_counter()
+            for n in range(runs):
+                self.assertIsNone(middleware.process_view(request, None, (), {}))
+            per_request = (time.perf_counter() - started) / runs * 1e6
+        self.measurements['ratelimit'] = {'mean_us': per_request}
+        if STRICT:
+            self.assertLess(per_request, 100, f"rate limiting took {per_request:.1f} us per request")
+
+    def test_cache_backends(self):
+        """
+        The shared memory cache reads about as fast as the per-process
+        LocMemCache and faster than FileBasedCache, the other cache every
+        worker of a host can share without a server.
+        """
+        runs = REPEAT * 100
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        params = {'OPTIONS': {'MAX_ENTRIES': runs}}
+        backends = {
+            'locmem': LocMemCache('benchmark', params),
+            'filebased': FileBasedCache(f'{directory.name}/files', params),
+            'shared': SharedMemoryCache(f'{directory.name}/shared', params),
+        }
+        results = {'polls': [(1, 'Choice 1', 10), (2, 'Choice 2', 20)],
+                   'total': 30}
+        timings = {}
+        for name, backend in backends.items():
+            timings[name] = {}
+            for operation, run in [
+                    ('set_us', lambda n: backend.set(f'results:{n % 100}', results)),
+                    ('get_us', lambda n: backend.get(f'results:{n % 100}')),
+                    ('incr_us', lambda n: backend.incr(f'results:{n % 100}:version')),
+            ]:
+                if operation == 'incr_us':
+                    backend.set_many({f'results:{n}:version': 0 for n in range(100)})
+                started = time.perf_counter()
+                for n in range(runs):
+                    run(n)
+                timings[name][operation] = (time.perf_counter() - started) / runs * 1e6
+            backend.clear()
+        self.measurements['cache'] = timings
+        if STRICT:
+            self.assertLess(timings['shared']['get_us'], timings['filebased']['get_us'])
+            self.assertLess(timings['shared']['incr_us'], timings['filebased']['incr_us'])
+
+    def test_vote_log_replay(self):
+        """
+        Replaying the vote event log streams millions of events a minute
+        from segments written by several processes.
+        """
+        events = REPEAT * 10000
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        logs = [VoteLog(directory.name) for _ in range(4)]
+        for batch in range(0, events, 100):
+            logs[batch // 100 % 4].append(encode(
+                [(n % 5000, n % 5000 % QUESTIONS, n % CHOICES,
+                  None if n < 5000 else (n - 1) % CHOICES)
+                 for n in range(batch, batch + 100)], batch))
+        for log in logs:
+            log.close()
+        started = time.perf_counter()
+        votes = replay(read_events(directory.name))
+        per_minute = events / (time.perf_counter() - started) * 60
+        self.measurements['vote_log'] = {'events_per_minute': per_minute}
+        self.assertEqual(len(votes), 5000)
+        if STRICT:
+            self.assertGreater(per_minute, 1_000_000,
+                               f"replay read {per_minute:,.0f} events a minute")
@@ -0,0 +1,98 @@
+import datetime
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from mysite.ratelimit import get_backend, parse_limit, refill
+from polls.models import Question
+
+
+class TokenBucketTests(SimpleTestCase):
+    def test_parse_limit(self):
+        self.assertEqual(parse_limit('ip:10/m'), ('ip', 10 / 60, 10))
+        with self.assertRaises(ValueError):
+            parse_limit('session:10/m')
+
+    def test_refill(self):
+        """
+        A bucket starts full, empties one token per request and refills at
+        its rate.
+        """
+        bucket, wait = refill(None, 1, 2, 0)
+        self.assertEqual((bucket, wait), ((1, 0), 0))
+        bucket, wait = refill(bucket, 1, 2, 0)
+        bucket, wait = refill(bucket, 1, 2, 0)
+        self.assertEqual(wait, 1)
+        bucket, wait = refill(bucket, 1, 2, 1)
+        self.assertEqual(wait, 0)
+
+
+@override_settings(RATELIMITS={'login': ['ip:2/m'], 'polls:vote': ['user:1/m']})
+class RateLimitMiddlewareTests(TestCase):
+    def setUp(self):
+        get_backend.cache_clear()
+        cache.clear()
+
+    def tearDown(self):
+        get_backend.cache_clear()
+
+    def login(self):
+        return self.client.post(reverse('login'), {'username': 'nobody', 'password': 'wrong'})
+
+    def assertThrottled(self, response):
+        self.assertEqual(response.status_code, 429)
+        self.assertGreaterEqual(int(response['Retry-After']), 1)
+
+    def test_login_is_limited_per_ip(self):
+        self.assertEqual(self.login().status_code, 200)
+        self.assertEqual(self.login().status_code, 200)
+        self.assertThrottled(self.login())
+        # only posts are counted
+        self.assertEqual(self.client.get(reverse('login')).status_code, 200)
+        response = self.client.post(reverse('login'), REMOTE_ADDR='10.0.0.2')
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(RATELIMIT_CLIENT_IP_HEADER='HTTP_X_FORWARDED_FOR')
+    def test_forged_forwarded_for_is_ignored(self):
+        """
+        Entries the client puts in X-Forwarded-For before the one its proxy
+        appends do not give it a fresh bucket.
+        """
+        for forged in ('1.1.1.1', '2.2.2.2', '3.3.3.3'):
+            response = self.client.post(
+                reverse('login'), HTTP_X_FORWARDED_FOR=f'{forged}, 10.0.0.9')
+        self.assertThrottled(response)
+        response = self.client.post(reverse('login'),
+                                    HTTP_X_FORWARDED_FOR='1.1.1.1, 10.0.0.8')
+        self.assertEqual(response.status_code, 200)
+        with override_settings(RATELIMIT_TRUSTED_PROXIES=2):
+            response = self.client.post(
+                reverse('login'),
+                HTTP_X_FORWARDED_FOR='1.1.1.1, 10.0.0.9, 172.16.0.1')
+        self.assertThrottled(response)
+
+    @override_settings(RATELIMIT_BACKEND='mysite.ratelimit.CacheBackend')
+    def test_cache_backend(self):
+        self.login()
+        self.login()
+        self.assertThrottled(self.login())
+
+    def test_votes_are_limited_per_user(self):
+        question = Question.objects.create(
+            question_text='Limited', pub_date=timezone.now() - datetime.timedelta(days=1))
+        choice = question.choice_set.create(choice_text='Only')
+        url = reverse('polls:vote', args=(question.id,))
+        for username in ('first', 'second'):
+            self.client.force_login(User.objects.create_user(username=username))
+            self.assertEqual(self.client.post(url, {'choice': choice.id}).status_code, 302)
+        self.assertThrottled(self.client.post(url, {'choice': choice.id}))
+
+    async def test_async_requests_are_limited(self):
+        url = reverse('login')
+        for n in range(2):
+            response = await self.async_client.post(url, {'username': 'nobody'})
+            self.assertEqual(response.status_code, 200)
+        self.assertThrottled(await self.async_client.post(url, {'username': 'nobody'}))
@@ -0,0 +1,107 @@
+from unittest import mock
+
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase
+
+from mysite import routers
+from mysite.middleware import ReplicaPinMiddleware
+from polls.models import Question
+from polls.results import compute_results, get_results
+
+
+class TwoReplicaRouter(routers.ReplicaRouter):
+    def replicas(self):
+        return ['replica1', 'replica2']
+
+
+class NoReplicaRouter(routers.ReplicaRouter):
+    def replicas(self):
+        return []
+
+
+class ReplicaRouterTests(SimpleTestCase):
+    def setUp(self):
+        self.router = TwoReplicaRouter()
+
+    def test_reads_go_to_replicas(self):
+        """
+        Reads are spread over the replicas and writes go to the primary.
+        """
+        self.assertIn(self.router.db_for_read(Question), ['replica1', 'replica2'])
+        self.assertEqual(self.router.db_for_write(Question), 'default')
+
+    def test_pinned_reads_go_to_primary(self):
+        """
+        Reads inside pin_to_primary() see the primary.
+        """
+        with routers.pin_to_primary():
+            self.assertEqual(self.router.db_for_read(Question), 'default')
+        self.assertNotEqual(self.router.db_for_read(Question), 'default')
+
+    def test_no_replicas(self):
+        """
+        Without replicas everything reads from the primary.
+        """
+        self.assertEqual(NoReplicaRouter().db_for_read(Question), 'default')
+
+    def test_only_primary_is_migrated(self):
+        self.assertTrue(self.router.allow_migrate('default', 'polls'))
+        self.assertFalse(self.router.allow_migrate('replica1', 'polls'))
+
+
+class ReplicaPinMiddlewareTests(SimpleTestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.pinned = None
+
+        def view(request):
+            self.pinned = routers._pinned.get()
+            return HttpResponse()
+
+        self.middleware = ReplicaPinMiddleware(view)
+
+    def test_post_pins_and_sets_cookie(self):
+        """
+        A POST reads from the primary and pins the next requests of the user.
+        """
+        response = self.middleware(self.factory.post('/polls/1/vote/'))
+        self.assertTrue(self.pinned)
+        self.assertIn(ReplicaPinMiddleware.cookie_name, response.cookies)
+
+    def test_get_with_cookie_is_pinned(self):
+        request = self.factory.get('/polls/1/results/')
+        request.COOKIES[ReplicaPinMiddleware.cookie_name] = '1'
+        self.middleware(request)
+        self.assertTrue(self.pinned)
+
+    def test_get_without_cookie_reads_replicas(self):
+        response = self.middleware(self.factory.get('/polls/'))
+        self.assertFalse(self.pinned)
+        self.assertNotIn(ReplicaPinMiddleware.cookie_name, response.cookies)
+
+    async def test_async_post_pins(self):
+        """
+        Under ASGI the middleware awaits the view and pins it the same way.
+        """
+        async def view(request):
+            self.pinned = routers._pinned.get()
+            return HttpResponse()
+
+        response = await ReplicaPinMiddleware(view)(self.factory.post('/polls/1/vote/'))
+        self.assertTrue(self.pinned)
+        self.assertIn(ReplicaPinMiddleware.cookie_name, response.cookies)
+
+
+
+class ResultsOnPrimaryTests(TestCase):
+    def test_results_cache_is_filled_from_primary(self):
+        """
+        Results about to be cached are counted on the primary, which has
+        every committed vote.
+        """
+        cache.clear()
+        question = Question.objects.create(question_text='Fresh')
+        with mock.patch('polls.results.compute_results', wraps=compute_results) as compute:
+            get_results(question.id)
+        compute.assert_called_once_with(question.id, 'default')
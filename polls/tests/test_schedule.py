@@ -0,0 +1,109 @@
+import datetime
+from io import StringIO
+
+from django.core.management import call_command
+from django.urls import reverse
+from django.utils import timezone
+
+from polls.caching import index_version
+from polls.models import Choice, Question, ResultSnapshot
+from polls.schedule import advance, apply_transitions, reschedule
+
+from .base import EmptyCacheTestCase
+
+Status = Question.Status
+
+
+def create_question(question_text='', opens_in=0, closes_in=1):
+    """
+    Create a question published `opens_in` hours from now and closing
+    `closes_in` hours from now.
+    """
+    now = timezone.now()
+    return Question.objects.create(
+        question_text=question_text,
+        pub_date=now + datetime.timedelta(hours=opens_in),
+        end_date=now + datetime.timedelta(hours=closes_in))
+
+
+class ScheduleTests(EmptyCacheTestCase):
+
+    def test_status_is_set_on_save(self):
+        self.assertEqual(create_question(opens_in=1, closes_in=2).status,
+                         Status.SCHEDULED)
+        self.assertEqual(create_question(opens_in=-1, closes_in=1).status,
+                         Status.OPEN)
+        self.assertEqual(create_question(opens_in=-2, closes_in=-1).status,
+                         Status.CLOSED)
+
+    def test_transitions_at_pub_date_and_end_date(self):
+        question = create_question(opens_in=1, closes_in=2)
+        now = timezone.now()
+        opened, closed, upcoming = apply_transitions(now)
+        self.assertEqual((opened, closed), ([], []))
+        self.assertEqual(upcoming, question.pub_date)
+        opened, closed, upcoming = apply_transitions(
+            now + datetime.timedelta(minutes=90))
+        self.assertEqual((opened, closed), ([question.id], []))
+        self.assertEqual(upcoming, question.end_date)
+        opened, closed, upcoming = apply_transitions(
+            now + datetime.timedelta(hours=3))
+        self.assertEqual((opened, closed), ([], [question.id]))
+        self.assertIsNone(upcoming)
+        question.refresh_from_db()
+        self.assertEqual(question.status, Status.CLOSED)
+
+    def test_advance_only_queries_when_a_transition_is_due(self):
+        create_question(opens_in=1, closes_in=2)
+        advance()
+        with self.assertNumQueries(0):
+            advance()
+
+    def test_reschedule_sees_dates_changed_in_bulk(self):
+        question = create_question(opens_in=1, closes_in=2)
+        advance()
+        Question.objects.filter(pk=question.pk).update(
+            pub_date=timezone.now() - datetime.timedelta(minutes=1))
+        advance()
+        question.refresh_from_db()
+        self.assertEqual(question.status, Status.SCHEDULED)
+        reschedule()
+        advance()
+        question.refresh_from_db()
+        self.assertEqual(question.status, Status.OPEN)
+
+    def test_cached_index_shows_question_once_published(self):
+        question = create_question('Soon', opens_in=1, closes_in=2)
+        url = reverse('polls:index')
+        self.assertNotContains(self.client.get(url), 'Soon')
+        Question.objects.filter(pk=question.pk).update(
+            pub_date=timezone.now() - datetime.timedelta(minutes=1))
+        reschedule()
+        # the request that applies the transition invalidates on commit
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.get(url)
+        self.assertContains(self.client.get(url), 'Soon')
+
+    def test_transition_invalidates_once_committed(self):
+        question = create_question('Soon', opens_in=-1, closes_in=2)
+        Question.objects.filter(pk=question.pk).update(status=Status.SCHEDULED)
+        version = index_version()
+        with self.captureOnCommitCallbacks() as callbacks:
+            apply_transitions()
+        self.assertEqual(index_version(), version)
+        self.assertEqual(len(callbacks), 1)
+        callbacks[0]()
+        self.assertEqual(index_version(), version + 1)
+
+    def test_run_schedule_finalizes_closed_polls(self):
+        question = create_question(opens_in=-2, closes_in=1)
+        Choice.objects.create(question=question, choice_text='Yes')
+        Question.objects.filter(pk=question.pk).update(
+            end_date=timezone.now() - datetime.timedelta(minutes=1))
+        out = StringIO()
+        call_command('run_schedule', '--once', stdout=out)
+        question.refresh_from_db()
+        self.assertEqual(question.status, Status.CLOSED)
+        self.assertTrue(ResultSnapshot.objects.filter(
+            question=question).exists())
+        self.assertIn(f'Closed questions [{question.id}]', out.getvalue())
@@ -0,0 +1,148 @@
+import datetime
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from polls.models import Choice, Question
+from polls.schedule import advance
+from polls.search import SEARCH_TABLE, search_questions
+
+from .base import EmptyCacheTestCase
+
+
+def create_question(question_text, days=-1, choices=()):
+    """
+    Create a question published `days` from now with the given choices.
+    """
+    question = Question.objects.create(
+        question_text=question_text,
+        pub_date=timezone.now() + datetime.timedelta(days=days))
+    for choice_text in choices:
+        Choice.objects.create(question=question, choice_text=choice_text)
+    return question
+
+
+def texts(questions):
+    return [question.question_text for question in questions]
+
+
+class SearchTests(EmptyCacheTestCase):
+
+    def test_matches_question_and_choice_text(self):
+        create_question('Favourite pizza topping?', choices=['Pineapple'])
+        create_question('Best editor?', choices=['Vim', 'Emacs'])
+        self.assertEqual(texts(search_questions('pizza')),
+                         ['Favourite pizza topping?'])
+        self.assertEqual(texts(search_questions('emacs')), ['Best editor?'])
+        self.assertEqual(texts(search_questions('edi')), ['Best editor?'])
+        self.assertEqual(search_questions('python'), [])
+
+    def test_unpublished_questions_are_not_found(self):
+        create_question('Secret pizza poll', days=1)
+        self.assertEqual(search_questions('pizza'), [])
+
+    def test_question_text_ranks_above_choices(self):
+        create_question('Which fruit?', choices=['Apple', 'Banana'])
+        create_question('Apple or nothing?', choices=['Yes', 'No'])
+        self.assertEqual(texts(search_questions('apple')),
+                         ['Apple or nothing?', 'Which fruit?'])
+
+    def test_index_follows_edits(self):
+        question = create_question('Old name', choices=['First'])
+        question.question_text = 'New name'
+        question.save()
+        choice = question.choice_set.get()
+        choice.choice_text = 'Renamed'
+        choice.save()
+        Choice.objects.create(question=question, choice_text='Added')
+        self.assertEqual(search_questions('old'), [])
+        self.assertEqual(texts(search_questions('new renamed added')),
+                         ['New name'])
+        Question.objects.filter(pk=question.pk).update(question_text='Bulk')
+        choice.delete()
+        self.assertEqual(search_questions('renamed'), [])
+        self.assertEqual(texts(search_questions('bulk')), ['Bulk'])
+        question.delete()
+        self.assertEqual(search_questions('bulk'), [])
+
+    def test_search_operators_are_not_interpreted(self):
+        create_question('Cats AND dogs')
+        self.assertEqual(texts(search_questions('"cats" AND (dogs*')),
+                         ['Cats AND dogs'])
+        self.assertEqual(search_questions('"* ( )'), [])
+
+    @override_settings(POLLS_SEARCH_PAGE_SIZE=2)
+    def test_pages_follow_the_cursor(self):
+        for n in range(5):
+            create_question(f'Poll number {n}')
+        url = reverse('polls:api-search')
+        seen = []
+        cursor = ''
+        while True:
+            data = self.client.get(url, {'q': 'poll', 'cursor': cursor}).json()
+            seen += [question['question_text'] for question in data['questions']]
+            cursor = data['next_cursor']
+            if cursor is None:
+                break
+        self.assertEqual(sorted(seen), [f'Poll number {n}' for n in range(5)])
+
+    def test_every_match_can_be_reached(self):
+        """
+        Paging goes through every match of a common word, old polls
+        included, best match first.
+        """
+        pub_date = timezone.now() - datetime.timedelta(days=1)
+        Question.objects.bulk_create(
+            Question(question_text=f'Common poll {n}' + ' filler' * (n % 3),
+                     pub_date=pub_date, status=Question.Status.OPEN)
+            for n in range(250))
+        seen = []
+        after = None
+        while page := search_questions('common', after=after, limit=40):
+            ranks = [question.search_rank for question in page]
+            self.assertEqual(ranks, sorted(ranks))
+            seen += page
+            after = (page[-1].search_rank, page[-1].id)
+        self.assertEqual(len({question.id for question in seen}), 250)
+
+    def test_invalid_cursor(self):
+        response = self.client.get(reverse('polls:search'),
+                                   {'q': 'poll', 'cursor': 'nonsense'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_search_page(self):
+        question = create_question('Favourite pizza topping?')
+        advance()
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('polls:search'),
+                                       {'q': 'pizza'})
+        self.assertContains(response, question.question_text)
+        self.assertContains(response, reverse('polls:detail',
+                                              args=(question.id,)))
+        response = self.client.get(reverse('polls:search'), {'q': 'sushi'})
+        self.assertContains(response, 'No polls match')
+
+    def test_icontains_fallback(self):
+        create_question('Favourite pizza topping?', choices=['Pineapple'])
+        create_question('Best editor?', choices=['Vim', 'Emacs'])
+        with mock.patch('polls.search.uses_fts', return_value=False):
+            self.assertEqual(texts(search_questions('APPLE')),
+                             ['Favourite pizza topping?'])
+            self.assertEqual(texts(search_questions('best vim')),
+                             ['Best editor?'])
+
+    def test_rebuild_command(self):
+        create_question('Favourite pizza topping?')
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {SEARCH_TABLE}")
+        self.assertEqual(search_questions('pizza'), [])
+        out = StringIO()
+        call_command('rebuild_search_index', stdout=out)
+        self.assertIn('Indexed 1 questions.', out.getvalue())
+        self.assertEqual(texts(search_questions('pizza')),
+                         ['Favourite pizza topping?'])
@@ -0,0 +1,99 @@
+import multiprocessing
+import tempfile
+import time
+
+from django.test import SimpleTestCase
+
+from mysite.cache import WAYS, SharedMemoryCache
+
+
+def _increment(path, times):
+    cache = SharedMemoryCache(path, {'OPTIONS': {'MAX_ENTRIES': 64,
+                                                 'SLOT_SIZE': 512}})
+    for _ in range(times):
+        cache.incr('votes')
+
+
+class SharedMemoryCacheTests(SimpleTestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = f'{directory.name}/cache'
+        self.cache = self.open()
+
+    def open(self, max_entries=64, slot_size=512):
+        return SharedMemoryCache(self.path, {'OPTIONS': {
+            'MAX_ENTRIES': max_entries, 'SLOT_SIZE': slot_size}})
+
+    def test_get_set_delete(self):
+        self.cache.set('question', {'id': 1, 'votes': [3, 4]})
+        self.assertEqual(self.cache.get('question'),
+                         {'id': 1, 'votes': [3, 4]})
+        self.assertTrue(self.cache.delete('question'))
+        self.assertIsNone(self.cache.get('question'))
+        self.assertFalse(self.cache.delete('question'))
+
+    def test_add_and_incr(self):
+        self.assertTrue(self.cache.add('version', 1))
+        self.assertFalse(self.cache.add('version', 5))
+        self.assertEqual(self.cache.incr('version'), 2)
+        self.assertEqual(self.cache.incr('version', 10), 12)
+        with self.assertRaises(ValueError):
+            self.cache.incr('missing')
+
+    def test_expiry(self):
+        self.cache.set('short', 1, 0.05)
+        self.cache.set('forever', 1, None)
+        time.sleep(0.1)
+        self.assertIsNone(self.cache.get('short'))
+        self.assertTrue(self.cache.add('short', 2))
+        self.assertEqual(self.cache.get('forever'), 1)
+        self.assertTrue(self.cache.touch('short', 0.05))
+        time.sleep(0.1)
+        self.assertFalse(self.cache.has_key('short'))
+
+    def test_value_larger_than_a_slot(self):
+        """
+        A value that does not fit is not cached, and does not leave the
+        previous value of its key behind.
+        """
+        self.cache.set('results', 'small')
+        self.cache.set('results', 'x' * 1000)
+        self.assertIsNone(self.cache.get('results'))
+
+    def test_least_recently_used_is_evicted(self):
+        cache = self.open(max_entries=WAYS)
+        for n in range(WAYS):
+            cache.set(f'key{n}', n)
+        cache.get('key0')
+        cache.set('new', 'value')
+        self.assertEqual(cache.get('key0'), 0)
+        self.assertIsNone(cache.get('key1'))
+        self.assertEqual(cache.get('new'), 'value')
+
+    def test_shared_between_instances(self):
+        """
+        Every instance on the same file sees the same entries, as the
+        workers of one host do.
+        """
+        other = self.open()
+        self.cache.set('results', [1, 2])
+        self.assertEqual(other.get('results'), [1, 2])
+        other.clear()
+        self.assertIsNone(self.cache.get('results'))
+
+    def test_incr_is_atomic_across_processes(self):
+        self.cache.set('votes', 0)
+        context = multiprocessing.get_context('fork')
+        workers = [context.Process(target=_increment, args=(self.path, 200))
+                   for _ in range(4)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        self.assertEqual(self.cache.get('votes'), 800)
+
+    def test_file_is_laid_out_again_for_other_settings(self):
+        self.cache.set('results', 1)
+        self.assertIsNone(self.open(slot_size=1024).get('results'))
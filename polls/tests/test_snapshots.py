@@ -0,0 +1,99 @@
+import datetime
+import gzip
+import json
+import os
+import tempfile
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from polls.models import Question, ResultSnapshot, Vote
+from polls.results import compute_results
+from polls.voting import cast_vote, rebuild_tallies, write_votes
+
+
+def create_question(question_text='', days=0, end_time=1):
+    """
+    Create a question with the given `question_text` and published the
+    given number of `days` offset to now, open for `end_time` days.
+    """
+    time = timezone.now() + datetime.timedelta(days=days)
+    time_end = timezone.now() + datetime.timedelta(days=end_time)
+    return Question.objects.create(question_text=question_text, pub_date=time, end_date=time_end)
+
+
+class ResultSnapshotTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='voter')
+        self.question = create_question(question_text='Closing question', days=-2)
+        self.choice = self.question.choice_set.create(choice_text='Only choice')
+        cast_vote(self.user, self.question, self.choice)
+
+    def close(self):
+        self.question.end_date = timezone.now() - datetime.timedelta(minutes=1)
+        self.question.save()
+
+    def test_open_question_has_no_snapshot(self):
+        self.client.get(reverse('polls:results', args=(self.question.id,)))
+        self.assertFalse(ResultSnapshot.objects.exists())
+
+    def test_first_results_view_after_close_writes_snapshot(self):
+        """
+        The first results request after a poll closes freezes its results,
+        and later requests read them in a single query.
+        """
+        self.close()
+        url = reverse('polls:results', args=(self.question.id,))
+        self.client.get(url)
+        snapshot = ResultSnapshot.objects.get(question=self.question)
+        self.assertEqual(snapshot.total_votes, 1)
+        self.assertEqual(snapshot.choices[0]['votes'], 1)
+        cache.clear()
+        with self.assertNumQueries(1):
+            response = self.client.get(url)
+        self.assertContains(response, '>1</td>')
+
+    def test_late_buffered_vote_drops_snapshot(self):
+        """
+        A vote written after its question was finalized, as from the vote
+        buffer, drops the snapshot so the results are counted again.
+        """
+        self.close()
+        self.assertEqual(compute_results(self.question.id)['total_votes'], 1)
+        late = User.objects.create_user(username='late')
+        write_votes({(late.id, self.question.id): self.choice.id})
+        self.assertFalse(ResultSnapshot.objects.exists())
+        self.assertEqual(compute_results(self.question.id)['total_votes'], 2)
+
+    def test_reopening_drops_snapshot(self):
+        self.close()
+        call_command('finalize_polls', stdout=StringIO())
+        self.question.end_date = timezone.now() + datetime.timedelta(days=1)
+        self.question.save()
+        self.assertFalse(ResultSnapshot.objects.exists())
+
+    def test_finalize_and_archive(self):
+        """
+        finalize_polls freezes closed polls, and --archive-dir moves their
+        votes to a file while the results stay the same.
+        """
+        self.close()
+        with tempfile.TemporaryDirectory() as directory:
+            call_command('finalize_polls', '--archive-dir', directory, stdout=StringIO())
+            path = os.path.join(directory, f'question-{self.question.id}-votes.ndjson.gz')
+            with gzip.open(path, 'rt') as file:
+                rows = [json.loads(line) for line in file]
+        self.assertEqual([row['username'] for row in rows], ['voter'])
+        self.assertFalse(Vote.objects.exists())
+        self.assertTrue(ResultSnapshot.objects.get(question=self.question).archived)
+        self.assertEqual(rebuild_tallies(), [])
+        cache.clear()
+        response = self.client.get(reverse('polls:api-results', args=(self.question.id,)))
+        self.assertEqual(response.json()['total_votes'], 1)
+        self.assertTrue(response.json()['final'])
@@ -0,0 +1,110 @@
+import datetime
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from polls import streams
+from polls.models import Question
+from polls.results import results_version
+from polls.voting import cast_vote
+
+
+def create_question(question_text='', days=0, end_time=1):
+    """
+    Create a question with the given `question_text` and published the
+    given number of `days` offset to now, open for `end_time` days.
+    """
+    time = timezone.now() + datetime.timedelta(days=days)
+    time_end = timezone.now() + datetime.timedelta(days=end_time)
+    return Question.objects.create(question_text=question_text, pub_date=time, end_date=time_end)
+
+
+@override_settings(POLLS_STREAM_POLL_MS=10, POLLS_STREAM_HEARTBEAT_SECONDS=0.05)
+class ResultsStreamTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='tester')
+        self.question = create_question(question_text='Live question', days=-1)
+        self.first = self.question.choice_set.create(choice_text='First')
+        self.second = self.question.choice_set.create(choice_text='Second')
+
+    def vote(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            cast_vote(self.user, self.question, self.first)
+
+    async def test_snapshot_then_delta(self):
+        """
+        The stream starts with every tally and then sends only the choices
+        a vote changed.
+        """
+        events = streams.results_events(self.question.id)
+        try:
+            self.assertTrue((await events.__anext__()).startswith('retry:'))
+            snapshot = await events.__anext__()
+            self.assertIn('event: snapshot', snapshot)
+            self.assertIn('Live question', snapshot)
+            await sync_to_async(self.vote)()
+            delta = await events.__anext__()
+            while delta.startswith(':'):
+                delta = await events.__anext__()
+            self.assertIn('event: delta', delta)
+            self.assertIn(f'"choices": {{"{self.first.id}": 1}}', delta)
+            self.assertIn('"total_votes": 1', delta)
+        finally:
+            await events.aclose()
+
+    async def test_one_publisher_per_question(self):
+        """
+        Watchers of the same question share one publisher, which stops when
+        the last watcher leaves.
+        """
+        first = streams.results_events(self.question.id)
+        second = streams.results_events(self.question.id)
+        await first.__anext__()
+        await second.__anext__()
+        self.assertEqual(len(streams._publishers[self.question.id].subscribers), 2)
+        await first.aclose()
+        await second.aclose()
+        self.assertEqual(streams._publishers[self.question.id].subscribers, set())
+
+    async def test_reconnect_with_current_id(self):
+        """
+        A client reconnecting with the current Last-Event-ID gets no snapshot
+        again, only heartbeats.
+        """
+        version = await sync_to_async(results_version)(self.question.id)
+        events = streams.results_events(self.question.id, str(version))
+        try:
+            await events.__anext__()
+            self.assertEqual(await events.__anext__(), ': heartbeat\n\n')
+        finally:
+            await events.aclose()
+
+    async def test_stream_view(self):
+        """
+        The stream endpoint answers with an event stream, or 404.
+        """
+        response = await self.async_client.get(
+            reverse('polls:results-stream', args=(self.question.id,)))
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        await response.streaming_content.aclose()
+        response = await self.async_client.get(reverse('polls:results-stream', args=(999,)))
+        self.assertEqual(response.status_code, 404)
+
+    def test_stream_view_under_wsgi(self):
+        """
+        Under WSGI the stream sends one snapshot and ends, and the browser
+        reconnects after the retry interval.
+        """
+        url = reverse('polls:results-stream', args=(self.question.id,))
+        response = self.client.get(url)
+        content = b''.join(response.streaming_content).decode()
+        self.assertTrue(content.startswith('retry:'))
+        self.assertIn('event: snapshot', content)
+        version = results_version(self.question.id)
+        response = self.client.get(url, HTTP_LAST_EVENT_ID=str(version))
+        self.assertNotIn('snapshot', b''.join(response.streaming_content).decode())
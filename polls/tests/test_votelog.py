@@ -0,0 +1,241 @@
+import datetime
+import gzip
+import os
+import tempfile
+from io import StringIO
+
+from django.contrib.admin.helpers import ACTION_CHECKBOX_NAME
+from django.contrib.auth.models import User
+from django.core.management import CommandError, call_command
+from django.test import override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from polls.models import Choice, Question, Vote
+from polls.votelog import (VoteLog, baseline, encode, get_vote_log,
+                           read_events, replay, segments, timeline)
+from polls.voting import cast_vote, restore_votes, write_votes
+
+from .base import EmptyCacheTestCase
+
+SECOND = 10**9
+
+
+def create_question(question_text='', days=-1):
+    return Question.objects.create(
+        question_text=question_text,
+        pub_date=timezone.now() + datetime.timedelta(days=days))
+
+
+class VoteLogTests(EmptyCacheTestCase):
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        overridden = override_settings(POLLS_VOTE_LOG_DIR=self.directory)
+        overridden.enable()
+        self.addCleanup(overridden.disable)
+        self.addCleanup(lambda: get_vote_log().close())
+        self.users = [User.objects.create_user(username=f'user{n}')
+                      for n in range(3)]
+        self.question = create_question('Question')
+        self.first = self.question.choice_set.create(choice_text='First')
+        self.second = self.question.choice_set.create(choice_text='Second')
+
+    def events(self):
+        get_vote_log().close()
+        return [event[1:] for event in read_events(self.directory)]
+
+    def write_log(self, events):
+        """
+        Write (seconds, user, question, choice, previous) events to a
+        segment of their own.
+        """
+        log = VoteLog(self.directory)
+        for seconds, *event in events:
+            log.append(encode([event], seconds * SECOND))
+        log.close()
+
+    def test_votes_are_logged_on_commit(self):
+        self.client.force_login(self.users[0])
+        url = reverse('polls:vote', args=(self.question.id,))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(url, {'choice': self.first.id})
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(url, {'choice': self.second.id})
+        with self.captureOnCommitCallbacks(execute=False):
+            cast_vote(self.users[1], self.question, self.first)
+        user_id, question_id = self.users[0].pk, self.question.pk
+        self.assertEqual(self.events(), [
+            (user_id, question_id, self.first.pk, None),
+            (user_id, question_id, self.second.pk, self.first.pk),
+        ])
+
+    def test_buffered_votes_are_logged(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            write_votes({(self.users[0].pk, self.question.pk): self.first.pk,
+                         (self.users[1].pk, self.question.pk): self.first.pk})
+        with self.captureOnCommitCallbacks(execute=True):
+            write_votes({(self.users[0].pk, self.question.pk): self.second.pk,
+                         (self.users[1].pk, self.question.pk): self.first.pk})
+        self.assertEqual(sorted(self.events()), [
+            (self.users[0].pk, self.question.pk, self.first.pk, None),
+            (self.users[0].pk, self.question.pk, self.second.pk,
+             self.first.pk),
+            (self.users[1].pk, self.question.pk, self.first.pk, None),
+        ])
+
+    def test_admin_deletions_are_logged(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            for user in self.users:
+                cast_vote(user, self.question, self.first)
+        admin = User.objects.create_superuser(username='admin')
+        self.client.force_login(admin)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('admin:polls_vote_changelist'), {
+                'action': 'delete_selected',
+                ACTION_CHECKBOX_NAME: [Vote.objects.get(user=self.users[0]).pk],
+                'post': 'yes',
+            })
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('admin:polls_question_changelist'), {
+                'action': 'reset_votes',
+                ACTION_CHECKBOX_NAME: [self.question.pk],
+            })
+        self.assertEqual(Vote.objects.count(), 0)
+        self.assertEqual(replay(read_events(self.directory)), {})
+        deleted = [event for event in self.events() if event[2] is None]
+        self.assertEqual(sorted(event[0] for event in deleted),
+                         sorted(user.pk for user in self.users))
+
+    def test_segments_rotate(self):
+        log = VoteLog(self.directory, segment_bytes=1)
+        for user in self.users:
+            log.append(encode([(user.pk, self.question.pk, self.first.pk,
+                                None)], user.pk))
+        log.close()
+        self.assertEqual(len(segments(self.directory)), 3)
+        self.assertEqual([event[1] for event in read_events(self.directory)],
+                         [user.pk for user in self.users])
+
+    def test_torn_lines_are_skipped(self):
+        self.write_log([(1, 1, 1, 1, None)])
+        with open(segments(self.directory)[0], 'a') as segment:
+            segment.write('[2,2,1,')
+        with gzip.open(os.path.join(self.directory,
+                                    'votes-0-0.ndjson.gz'), 'wt') as segment:
+            segment.write('[0,3,1,2,null]\n')
+        self.assertEqual(list(read_events(self.directory)),
+                         [(0, 3, 1, 2, None), (SECOND, 1, 1, 1, None)])
+
+    def test_replay_until(self):
+        question_id = self.question.pk
+        first, second = self.first.pk, self.second.pk
+        self.write_log([(1, 1, question_id, first, None),
+                        (3, 1, question_id, second, first)])
+        self.write_log([(2, 2, question_id, first, None),
+                        (4, 2, question_id, None, first)])
+        self.assertEqual(replay(read_events(self.directory, until=2 * SECOND)),
+                         {(1, question_id): first, (2, question_id): first})
+        self.assertEqual(replay(read_events(self.directory)),
+                         {(1, question_id): second})
+        self.assertEqual(
+            list(read_events(self.directory, question_ids={question_id + 1})),
+            [])
+
+    def test_restore_votes(self):
+        other = create_question('Other')
+        choice = other.choice_set.create(choice_text='Kept')
+        with self.captureOnCommitCallbacks(execute=True):
+            cast_vote(self.users[0], other, choice)
+            cast_vote(self.users[0], self.question, self.second)
+        question_id = self.question.pk
+        restored, written = restore_votes({
+            (self.users[1].pk, question_id): self.first.pk,
+            (self.users[2].pk, question_id): self.second.pk,
+            # a deleted user and a choice of another question are skipped
+            (0, question_id): self.first.pk,
+            (self.users[0].pk, question_id): choice.pk,
+        }, {question_id})
+        self.assertEqual((restored, written), ({question_id}, 2))
+        self.assertEqual(
+            set(Vote.objects.values_list('user_id', 'choice_id')),
+            {(self.users[0].pk, choice.pk), (self.users[1].pk, self.first.pk),
+             (self.users[2].pk, self.second.pk)})
+        self.question.refresh_from_db()
+        self.assertEqual(self.question.total_votes, 2)
+        self.assertEqual(Choice.objects.get(pk=self.first.pk).votes, 1)
+
+    def test_timeline(self):
+        first, second = self.first.pk, self.second.pk
+        self.write_log([(1, 1, 1, first, None), (2, 2, 1, first, None),
+                        (11, 1, 1, second, first), (35, 2, 1, None, first)])
+        self.assertEqual(list(timeline(read_events(self.directory), 10)), [
+            (10 * SECOND, {first: 2}, 2, 0, 0),
+            (20 * SECOND, {first: 1, second: 1}, 0, 1, 0),
+            (40 * SECOND, {second: 1}, 0, 0, 1),
+        ])
+
+    def test_replay_votes_command(self):
+        question_id = self.question.pk
+        self.write_log([(1, self.users[0].pk, question_id, self.first.pk,
+                         None),
+                        (3, self.users[0].pk, question_id, self.second.pk,
+                         self.first.pk)])
+        out = StringIO()
+        call_command('replay_votes', until='1970-01-01T00:00:02+00:00',
+                     stdout=out)
+        self.assertIn('Replayed 1 events into 1 votes', out.getvalue())
+        self.assertFalse(Vote.objects.exists())
+        call_command('replay_votes', str(question_id), apply=True,
+                     stdout=out)
+        self.assertIn('Restored 1 votes of 1 questions.', out.getvalue())
+        self.assertEqual(Vote.objects.get().choice_id, self.second.pk)
+        self.assertEqual(Choice.objects.get(pk=self.second.pk).votes, 1)
+
+    def test_votes_from_before_the_log_are_kept(self):
+        """
+        The first vote logged writes a baseline of the votes cast before
+        the log was started, so restoring the log keeps them.
+        """
+        extra = [User.objects.create_user(username=f'early{n}')
+                 for n in range(2)]
+        with override_settings(POLLS_VOTE_LOG_DIR=''):
+            for user in self.users + extra:
+                cast_vote(user, self.question, self.first)
+        with self.captureOnCommitCallbacks(execute=True):
+            cast_vote(self.users[0], self.question, self.second)
+        self.assertIsNotNone(baseline(self.directory))
+        out = StringIO()
+        call_command('replay_votes', apply=True, stdout=out)
+        self.assertIn('Restored 5 votes of 1 questions.', out.getvalue())
+        self.question.refresh_from_db()
+        self.assertEqual(self.question.total_votes, 5)
+        self.assertEqual(Choice.objects.get(pk=self.second.pk).votes, 1)
+        self.assertEqual(list(timeline(read_events(self.directory), 60))[-1][1],
+                         {self.first.pk: 4, self.second.pk: 1})
+
+    def test_apply_refuses_votes_missing_from_the_log(self):
+        with override_settings(POLLS_VOTE_LOG_DIR=''):
+            for user in self.users:
+                cast_vote(user, self.question, self.first)
+        self.write_log([(1, self.users[0].pk, self.question.pk,
+                         self.second.pk, self.first.pk)])
+        with self.assertRaisesMessage(CommandError, '2 votes'):
+            call_command('replay_votes', apply=True, stdout=StringIO())
+        self.assertEqual(Vote.objects.count(), 3)
+
+    def test_vote_timeline_command(self):
+        question_id = self.question.pk
+        self.write_log([(1, 1, question_id, self.first.pk, None),
+                        (61, 1, question_id, self.second.pk, self.first.pk)])
+        out = StringIO()
+        call_command('vote_timeline', str(question_id), interval=60,
+                     stdout=out)
+        self.assertEqual(out.getvalue().splitlines(), [
+            f'time,cast,changed,deleted,choice_{self.first.pk},'
+            f'choice_{self.second.pk}',
+            '1970-01-01T00:01:00+00:00,1,0,0,1,0',
+            '1970-01-01T00:02:00+00:00,0,1,0,0,1',
+        ])
@@ -0,0 +1,324 @@
+import datetime
+import re
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command, CommandError
+from django.db import IntegrityError, connection, transaction
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.urls import reverse
+
+from mysite import metrics
+from polls.models import Choice, ChoiceShard, Question, Vote
+from polls.results import compute_results, results_version
+from polls.voting import (cast_vote, claim_vote_token, compact_tallies,
+                          write_votes)
+
+
+def create_question(question_text='', days=0, end_time=1):
+    """
+    Create a question with the given `question_text` and published the
+    given number of `days` offset to now, open for `end_time` days.
+    """
+    time = timezone.now() + datetime.timedelta(days=days)
+    time_end = timezone.now() + datetime.timedelta(days=end_time)
+    return Question.objects.create(question_text=question_text, pub_date=time, end_date=time_end)
+
+
+class VoteTallyTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='tester', password='Secret.Pass123')
+        self.client.login(username='tester', password='Secret.Pass123')
+        self.question = create_question(question_text='Question', days=-1)
+        self.first = self.question.choice_set.create(choice_text='First')
+        self.second = self.question.choice_set.create(choice_text='Second')
+
+    def vote(self, choice):
+        url = reverse('polls:vote', args=(self.question.id,))
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(url, {'choice': choice.id})
+
+    def test_first_vote_increments_tallies(self):
+        """
+        A first vote increments the chosen choice and the question total.
+        """
+        response = self.vote(self.first)
+        self.assertRedirects(response, reverse('polls:results', args=(self.question.id,)))
+        self.first.refresh_from_db()
+        self.question.refresh_from_db()
+        self.assertEqual(self.first.votes, 1)
+        self.assertEqual(self.question.total_votes, 1)
+
+    def test_switching_vote_moves_tally(self):
+        """
+        Changing a vote decrements the old choice and leaves the total alone.
+        """
+        self.vote(self.first)
+        self.vote(self.second)
+        self.first.refresh_from_db()
+        self.second.refresh_from_db()
+        self.question.refresh_from_db()
+        self.assertEqual((self.first.votes, self.second.votes), (0, 1))
+        self.assertEqual(self.question.total_votes, 1)
+        self.assertEqual(Vote.objects.filter(user=self.user).count(), 1)
+
+    def test_same_vote_twice(self):
+        """
+        Voting for the same choice again does not change the tallies.
+        """
+        self.vote(self.first)
+        self.vote(self.first)
+        self.first.refresh_from_db()
+        self.assertEqual(self.first.votes, 1)
+
+    def test_results_page_is_cached(self):
+        """
+        The results page is tallied in one query and then served from the
+        cache until the next vote.
+        """
+        url = reverse('polls:results', args=(self.question.id,))
+        with self.assertNumQueries(2):
+            self.client.get(url)
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertNotContains(response, '>1</td>')
+        self.vote(self.first)
+        response = self.client.get(url)
+        self.assertContains(response, '>1</td>')
+
+    def test_results_of_missing_question(self):
+        """
+        The results page of a question that does not exist returns 404.
+        """
+        response = self.client.get(reverse('polls:results', args=(999,)))
+        self.assertEqual(response.status_code, 404)
+
+    def test_rebuild_tallies(self):
+        """
+        rebuild_tallies repairs tallies that drifted from the Vote table,
+        and --check reports without fixing them.
+        """
+        self.vote(self.first)
+        Choice.objects.filter(pk=self.first.pk).update(votes=7)
+        with self.assertRaises(CommandError):
+            call_command('rebuild_tallies', '--check', stdout=StringIO())
+        self.first.refresh_from_db()
+        self.assertEqual(self.first.votes, 7)
+        call_command('rebuild_tallies', stdout=StringIO())
+        self.first.refresh_from_db()
+        self.assertEqual(self.first.votes, 1)
+
+    def test_concurrent_first_vote(self):
+        """
+        A first vote that lost the insert to a concurrent one is counted as
+        a switch from its choice, not as another vote.
+        """
+        self.vote(self.first)
+        with mock.patch('polls.voting._locked_choice',
+                        side_effect=[None, self.first.id]):
+            self.assertTrue(cast_vote(self.user, self.question, self.second))
+        self.first.refresh_from_db()
+        self.second.refresh_from_db()
+        self.question.refresh_from_db()
+        self.assertEqual((self.first.votes, self.second.votes), (0, 1))
+        self.assertEqual(self.question.total_votes, 1)
+        self.assertEqual(Vote.objects.get(user=self.user).choice, self.second)
+
+    def test_deleting_a_choice_recounts(self):
+        """
+        Deleting a choice takes its votes out of the question total.
+        """
+        other = User.objects.create_user(username='other')
+        self.vote(self.first)
+        cast_vote(other, self.question, self.second)
+        version = results_version(self.question.id)
+        self.first.delete()
+        self.question.refresh_from_db()
+        self.assertEqual(self.question.total_votes, 1)
+        self.assertNotEqual(results_version(self.question.id), version)
+
+    def test_deleting_a_user_recounts(self):
+        """
+        Deleting a user takes their votes out of the tallies.
+        """
+        other = User.objects.create_user(username='other')
+        self.vote(self.first)
+        cast_vote(other, self.question, self.first)
+        version = results_version(self.question.id)
+        other.delete()
+        self.first.refresh_from_db()
+        self.question.refresh_from_db()
+        self.assertEqual((self.first.votes, self.question.total_votes), (1, 1))
+        self.assertNotEqual(results_version(self.question.id), version)
+
+    def test_one_vote_per_user_per_question(self):
+        """
+        The database refuses a second Vote row for the same user and question.
+        """
+        self.vote(self.first)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Vote.objects.create(user=self.user, choice=self.second)
+
+    def test_vote_records_question(self):
+        """
+        A vote carries its question directly, without joining through Choice.
+        """
+        self.vote(self.second)
+        vote = Vote.objects.get(user=self.user, question=self.question)
+        self.assertEqual(vote.choice, self.second)
+
+
+class ShardedTallyTests(TestCase):
+    def setUp(self):
+        self.users = [User.objects.create_user(username=f'user{n}') for n in range(6)]
+        self.question = create_question(question_text='Hot question', days=-1)
+        self.question.tally_shards = 4
+        self.question.save()
+        self.first = self.question.choice_set.create(choice_text='First')
+        self.second = self.question.choice_set.create(choice_text='Second')
+
+    def live_votes(self):
+        choices = Choice.objects.with_live_votes().order_by('id')
+        total = Question.objects.with_live_total().get(pk=self.question.pk).live_total_votes
+        return [choice.live_votes for choice in choices], total
+
+    def test_votes_go_to_shards(self):
+        """
+        Votes on a sharded question are spread over shard rows and leave the
+        stored tallies alone until they are compacted.
+        """
+        for user in self.users:
+            cast_vote(user, self.question, self.first)
+        cast_vote(self.users[0], self.question, self.second)
+        self.first.refresh_from_db()
+        self.assertEqual(self.first.votes, 0)
+        self.assertEqual(ChoiceShard.objects.filter(choice=self.first).count(), 4)
+        self.assertEqual(self.live_votes(), ([5, 1], 6))
+        self.assertEqual(compact_tallies(), 6)
+        self.first.refresh_from_db()
+        self.question.refresh_from_db()
+        self.assertEqual((self.first.votes, self.question.total_votes), (5, 6))
+        self.assertEqual(self.live_votes(), ([5, 1], 6))
+
+    def test_results_read_tallies_not_votes(self):
+        """
+        Results computed on a cache miss add up the tallies and shards
+        without reading the Vote table.
+        """
+        for user in self.users[:3]:
+            cast_vote(user, self.question, self.first)
+        cast_vote(self.users[3], self.question, self.second)
+        with CaptureQueriesContext(connection) as context:
+            results = compute_results(self.question.id)
+        self.assertEqual([choice['votes'] for choice in results['choices']], [3, 1])
+        self.assertEqual(results['total_votes'], 4)
+        self.assertFalse(any('"polls_vote"' in query['sql']
+                             for query in context.captured_queries))
+
+    def test_buffered_votes_go_to_shards(self):
+        write_votes({(user.id, self.question.id): self.second.id for user in self.users})
+        self.assertEqual(self.live_votes(), ([0, 6], 6))
+
+    def test_rebuild_counts_shards(self):
+        """
+        rebuild_tallies sees the votes held in shards and empties them when
+        it repairs a question.
+        """
+        for user in self.users[:3]:
+            cast_vote(user, self.question, self.first)
+        out = StringIO()
+        call_command('rebuild_tallies', '--check', stdout=out)
+        self.assertIn('correct', out.getvalue())
+        Choice.objects.filter(pk=self.second.pk).update(votes=2)
+        call_command('rebuild_tallies', stdout=StringIO())
+        self.assertEqual(self.live_votes(), ([3, 0], 3))
+        self.assertFalse(ChoiceShard.objects.exclude(votes=0).exists())
+
+
+class IdempotentVoteTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.registry = metrics.Registry()
+        self.original, metrics._registry = metrics._registry, self.registry
+        self.user = User.objects.create_user(username='retrier', password='Secret.Pass123')
+        self.client.login(username='retrier', password='Secret.Pass123')
+        self.question = create_question(question_text='Flaky Wi-Fi', days=-1)
+        self.first = self.question.choice_set.create(choice_text='First')
+        self.url = reverse('polls:vote', args=(self.question.id,))
+
+    def tearDown(self):
+        metrics._registry = self.original
+
+    def form_token(self):
+        response = self.client.get(reverse('polls:detail', args=(self.question.id,)))
+        return re.search(r'name="vote_token" value="([0-9a-f]{32})"',
+                         response.content.decode()).group(1)
+
+    def submit(self, token):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(self.url, {'choice': self.first.id, 'vote_token': token})
+
+    def avoided(self, reason):
+        for name, labels, value in self.registry.snapshot()['counters']:
+            if name == 'polls_vote_writes_avoided_total' and dict(labels) == {'reason': reason}:
+                return value
+        return 0
+
+    def test_replayed_form_writes_nothing(self):
+        """
+        Submitting the same form again redirects to the results without a
+        query.
+        """
+        token = self.form_token()
+        self.submit(token)
+        with self.assertNumQueries(0):
+            response = self.submit(token)
+        self.assertRedirects(response, reverse('polls:results', args=(self.question.id,)))
+        self.assertEqual(Choice.objects.get(pk=self.first.pk).votes, 1)
+        self.assertEqual(self.avoided('duplicate'), 1)
+
+    def test_same_choice_skips_update(self):
+        """
+        Voting again for the current choice from a new form does not write.
+        """
+        self.submit(self.form_token())
+        token = self.form_token()
+        with self.assertNumQueries(2) as context:
+            self.submit(token)
+        self.assertFalse(any(query['sql'].startswith(('UPDATE', 'INSERT'))
+                             for query in context.captured_queries))
+        self.assertEqual(Choice.objects.get(pk=self.first.pk).votes, 1)
+        self.assertEqual(self.avoided('unchanged'), 1)
+
+    def test_failed_vote_releases_token(self):
+        """
+        A form whose vote failed can be submitted again.
+        """
+        token = self.form_token()
+        with mock.patch('polls.views.cast_vote', side_effect=IntegrityError):
+            with self.assertRaises(IntegrityError):
+                self.submit(token)
+        self.assertTrue(claim_vote_token(self.user.id, token, self.first.id))
+
+    def test_rejected_submission_keeps_token(self):
+        """
+        A form turned down for a missing or closed poll still votes when it
+        is sent again once it can be.
+        """
+        token = self.form_token()
+        response = self.client.post(reverse('polls:vote', args=(999,)),
+                                    {'choice': self.first.id, 'vote_token': token})
+        self.assertEqual(response.status_code, 404)
+        end_date = self.question.end_date
+        Question.objects.filter(pk=self.question.pk).update(
+            end_date=timezone.now() - datetime.timedelta(days=1))
+        self.submit(token)
+        Question.objects.filter(pk=self.question.pk).update(end_date=end_date)
+        self.submit(token)
+        self.assertEqual(Choice.objects.get(pk=self.first.pk).votes, 1)
+        self.assertEqual(self.avoided('duplicate'), 0)
@@ -1,13 +1,22 @@
 from django.urls import path, include
 
-from . import views
+from . import api, async_views, exports, views
 
 app_name = 'polls'
 urlpatterns = [
     path('', views.IndexView.as_view(), name='index'),
+    path('search/', views.search, name='search'),
     path('<int:pk>/', views.DetailView.as_view(), name='detail'),
     path('<int:pk>/results/', views.ResultsView.as_view(), name='results'),
+    # async in both URL confs, so a watcher never holds a worker thread
+    path('<int:pk>/results/stream/', async_views.results_stream,
+         name='results-stream'),
     path('<int:question_id>/vote/', views.vote, name='vote'),
+    path('api/questions/', api.questions, name='api-questions'),
+    path('api/questions/<int:pk>/results/', api.results,
+         name='api-results'),
+    path('api/search/', api.search, name='api-search'),
+    path('export/<str:kind>/', exports.export, name='export'),
     path('accounts/', include('django.contrib.auth.urls')),
     path('signup/', views.signup, name='signup')
 ]
@@ -1,12 +1,22 @@
-from django.http import HttpResponseRedirect
+from datetime import datetime
+
+from django.conf import settings
+from django.http import Http404, HttpResponseRedirect
 from django.urls import reverse
 from django.views import generic
-from django.utils import timezone
+from django.utils.http import urlsafe_base64_decode, urlsafe_base64_encode
 from django.contrib import messages
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
-from .models import Vote
+from django.utils.decorators import method_decorator
+from .buffer import get_vote_buffer
+from .caching import anonymous_page_cache, cache_page_until
 from .models import Choice, Question
+from .results import get_results, results_version, results_versions
+from .schedule import advance, current_index_version, current_results_version
+from .search import search_questions
+from .voting import (cast_vote, claim_vote_token, count_avoided_writes,
+                     release_vote_token)
 from django.contrib.auth import login, authenticate
 from django.contrib.auth.forms import UserCreationForm
 
@@ -32,23 +42,148 @@ def signup(request):
     return render(request, 'registration/signup.html', {'form': form})
 
 
+@method_decorator(anonymous_page_cache(current_index_version),
+                  name='dispatch')
 class IndexView(generic.ListView):
     """
     Redirect to index.html
+
+    Questions are paged with a keyset cursor on (pub_date, id) instead of an
+    OFFSET, so every page costs the same however many polls there are.
+    Anonymous visitors get the page from the cache until a question changes
+    or one of the listed polls closes.
     """
     template_name = 'polls/index.html'
     context_object_name = 'latest_question_list'
+    statuses = ('open', 'closed')
 
     def get_queryset(self):
         """
-        Return the last five published questions (not including those set to be
-        published in the future).
+        Return one page of published questions (not including those set to
+        be published in the future), newest first.
+        """
+        page, self.has_next = question_page(self.request.GET)
+        return page
+
+    def get_context_data(self, **kwargs):
+        """
+        Add the cursor of the next page, the status filter and the version
+        of each question, which keys its cached card.
         """
-        return Question.objects.filter(
-            pub_date__lte=timezone.now()
-        ).order_by('-pub_date')[:5]
+        context = super().get_context_data(**kwargs)
+        questions = context['latest_question_list']
+        versions = results_versions([question.id for question in questions])
+        for question in questions:
+            question.version = versions[question.id]
+        cache_page_until(self.request,
+                         *(question.end_date for question in questions))
+        status = self.request.GET.get('status')
+        context['status'] = status if status in self.statuses else None
+        if self.has_next:
+            context['next_cursor'] = encode_cursor(questions[-1])
+        return context
+
+
+def question_page(params, questions=None):
+    """
+    Return one page of published questions, newest first, and whether
+    another page follows.
+
+    `params` holds the optional `status` filter and page `cursor` of the
+    request, and `questions` the queryset to page through, all questions
+    by default. Raises Http404 for a cursor that cannot be decoded.
+    """
+    advance()
+    if questions is None:
+        questions = Question.objects.all()
+    status = params.get('status')
+    if status in IndexView.statuses:
+        questions = getattr(questions, status)()
+    else:
+        questions = questions.published()
+    cursor = params.get('cursor')
+    if cursor:
+        try:
+            questions = questions.before(*decode_cursor(cursor))
+        except ValueError:
+            raise Http404("Invalid page cursor")
+    page_size = settings.POLLS_INDEX_PAGE_SIZE
+    page = list(questions.newest_first()[:page_size + 1])
+    return page[:page_size], len(page) > page_size
+
+
+def encode_cursor(question):
+    """
+    Return the page cursor pointing just after this question.
+    """
+    raw = f"{question.pub_date.isoformat()}|{question.id}"
+    return urlsafe_base64_encode(raw.encode())
+
+
+def decode_cursor(cursor):
+    """
+    Return the (pub_date, id) pair of a page cursor, or raise ValueError.
+    """
+    raw = urlsafe_base64_decode(cursor).decode()
+    pub_date, _, pk = raw.partition('|')
+    return datetime.fromisoformat(pub_date), int(pk)
+
+
+@anonymous_page_cache(lambda: current_index_version())
+def search(request):
+    """
+    Show the published questions whose text or choices match the `q`
+    parameter, best match first, a page at a time.
+    """
+    query = request.GET.get('q', '')
+    page, has_next = search_page(request.GET)
+    return render(request, 'polls/search.html', {
+        'query': query,
+        'questions': page,
+        'next_cursor': encode_search_cursor(page[-1]) if has_next else None,
+    })
 
 
+def search_page(params):
+    """
+    Return one page of the questions matching the `q` parameter, and
+    whether another page follows.
+
+    Raises Http404 for a `cursor` that cannot be decoded.
+    """
+    advance()
+    after = None
+    cursor = params.get('cursor')
+    if cursor:
+        try:
+            after = decode_search_cursor(cursor)
+        except ValueError:
+            raise Http404("Invalid page cursor")
+    page_size = settings.POLLS_SEARCH_PAGE_SIZE
+    page = search_questions(params.get('q', ''), after, page_size + 1)
+    return page[:page_size], len(page) > page_size
+
+
+def encode_search_cursor(question):
+    """
+    Return the search page cursor pointing just after this question.
+    """
+    raw = f"{question.search_rank!r}|{question.id}"
+    return urlsafe_base64_encode(raw.encode())
+
+
+def decode_search_cursor(cursor):
+    """
+    Return the (search_rank, id) pair of a search page cursor, or raise
+    ValueError.
+    """
+    raw = urlsafe_base64_decode(cursor).decode()
+    rank, _, pk = raw.partition('|')
+    return float(rank), int(pk)
+
+
+@method_decorator(anonymous_page_cache(
+    lambda pk: current_results_version(pk)), name='dispatch')
 class DetailView(generic.DetailView):
     """
     Redirect to detail.html
@@ -60,47 +195,91 @@ class DetailView(generic.DetailView):
         """
         Excludes any questions that aren't published yet.
         """
-        return Question.objects.filter(pub_date__lte=timezone.now())
+        advance()
+        return Question.objects.published()
+
+    def get_context_data(self, **kwargs):
+        """
+        Add the choices of the question, which are only read when their
+        cached list is out of date.
+        """
+        context = super().get_context_data(**kwargs)
+        context['choices'] = self.object.choice_set.all()
+        context['question_version'] = results_version(self.object.id)
+        return context
 
 
+@method_decorator(anonymous_page_cache(lambda pk: results_version(pk)),
+                  name='dispatch')
 class ResultsView(generic.DetailView):
     """
     Redirect to results.html
     """
-    model = Question
     template_name = 'polls/results.html'
+    context_object_name = 'results'
+
+    def get_object(self, queryset=None):
+        """
+        Return the cached results of the question instead of the model.
+        """
+        return get_results(self.kwargs['pk'])
 
 
 @login_required
 def vote(request, question_id):
     """
     A function for voting and checking if the user voted or not
+
+    A form submitted again with the same `vote_token` and choice, and a
+    vote for the choice the user already has, are answered with the
+    results page without writing anything.
     """
-    question = get_object_or_404(Question, pk=question_id)
     this_user = request.user
+    token = request.POST.get('vote_token')
+    choice_id = request.POST.get('choice')
+    results_url = reverse("polls:results", args=(question_id,))
+    if not claim_vote_token(this_user.id, token, choice_id):
+        count_avoided_writes('duplicate')
+        return HttpResponseRedirect(results_url)
+    # a submission turned down below can be sent again
+    try:
+        question = get_object_or_404(Question, pk=question_id)
+    except Http404:
+        release_vote_token(this_user.id, token, choice_id)
+        raise
 
     if not question.can_vote():
+        release_vote_token(this_user.id, token, choice_id)
         messages.error(request, f"Poll number {question.id}"
                                 f"id not available to vote")
         return redirect("polls:index")
 
     try:
-        selected_choice = question.choice_set.get(pk=request.POST['choice'])
+        selected_choice = (question.choice_set.with_voted(this_user)
+                           .get(pk=request.POST['choice']))
 
     except (KeyError, Choice.DoesNotExist):
+        release_vote_token(this_user.id, token, choice_id)
         return render(request, 'polls/detail.html', {
             'question': question,
+            'choices': question.choice_set.all(),
+            'question_version': results_version(question.id),
             'error_message': "You didn't select a choice.",
         })
 
     else:
-        try:
-            # find a vote for this user and this question
-            vote = Vote.objects.get(user=this_user, choice__question=question)
-            # update his vote
-            vote.choice = selected_choice
-            vote.save()
-        except Vote.DoesNotExist:
-            Vote.objects.create(user=this_user, choice=selected_choice).save()
-        return HttpResponseRedirect(reverse
-                                    ("polls:results", args=(question_id,)))
+        buffer = get_vote_buffer()
+        if buffer is not None:
+            # a newer choice may still be waiting in the buffer
+            buffer.submit(this_user.id, question.id, selected_choice.id)
+        elif selected_choice.voted:
+            count_avoided_writes('unchanged')
+        else:
+            try:
+                changed = cast_vote(this_user, question, selected_choice)
+            except Exception:
+                release_vote_token(this_user.id, token, choice_id)
+                raise
+            if not changed:
+                count_avoided_writes('unchanged')
+        return HttpResponseRedirect(results_url)
@@ -0,0 +1,278 @@
+import gzip
+import heapq
+import os
+import tempfile
+import threading
+import time
+from collections import Counter
+from operator import itemgetter
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+from .models import Vote
+
+# suffix of the segment holding the Vote rows as they were when the log
+# was started
+BASELINE = '-baseline.ndjson'
+
+
+class VoteLog:
+    """
+    Appends vote events to NDJSON segment files in a directory.
+
+    Each event is a line [time_ns, user_id, question_id, choice_id,
+    previous_choice_id], with a null choice when a vote was deleted and a
+    null previous choice on a first vote. Every process writes its own
+    segments, named after the time of their first event and the process
+    id, and starts a new one once a segment holds `segment_bytes`. Events
+    are only appended in batches, one write per committed transaction.
+    The log starts with a baseline segment of the votes already in the
+    Vote table, see write_baseline().
+    """
+
+    def __init__(self, directory, segment_bytes=64 * 1024 * 1024,
+                 fsync=False):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.fsync = fsync
+        self._file = None
+        self._pid = None
+        self._lock = threading.Lock()
+        # whether the baseline segment is known to exist
+        self.baselined = False
+
+    def append(self, lines):
+        """
+        Write a batch of encoded event lines to the current segment.
+        """
+        with self._lock:
+            if (self._file is None or self._pid != os.getpid()
+                    or self._file.tell() >= self.segment_bytes):
+                self._rotate()
+            self._file.write(lines)
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def _rotate(self):
+        # a forked process must not write to the segment of its parent
+        if self._file is not None and self._pid == os.getpid():
+            self._file.close()
+        self._pid = os.getpid()
+        name = f'votes-{time.time_ns():020d}-{self._pid}.ndjson'
+        self._file = open(os.path.join(self.directory, name), 'a',
+                          encoding='ascii')
+
+
+def encode(events, timestamp):
+    """
+    Return the NDJSON lines of (user_id, question_id, choice_id,
+    previous_choice_id) events that happened at `timestamp` nanoseconds.
+    """
+    return ''.join(
+        f'[{timestamp},{user_id},{question_id},'
+        f'{"null" if choice_id is None else choice_id},'
+        f'{"null" if previous is None else previous}]\n'
+        for user_id, question_id, choice_id, previous in events)
+
+
+_log = None
+_log_lock = threading.Lock()
+
+
+def get_vote_log():
+    """
+    Return the vote log of this process, or None when POLLS_VOTE_LOG_DIR
+    is not set.
+    """
+    global _log
+    if not settings.POLLS_VOTE_LOG_DIR:
+        return None
+    with _log_lock:
+        if _log is None or _log.directory != settings.POLLS_VOTE_LOG_DIR:
+            os.makedirs(settings.POLLS_VOTE_LOG_DIR, exist_ok=True)
+            _log = VoteLog(settings.POLLS_VOTE_LOG_DIR,
+                           settings.POLLS_VOTE_LOG_SEGMENT_BYTES,
+                           settings.POLLS_VOTE_LOG_FSYNC)
+    return _log
+
+
+def record_votes(events, using=None):
+    """
+    Log (user_id, question_id, choice_id, previous_choice_id) events once
+    the current transaction commits.
+
+    Called while the write lock of the vote is held, so the timestamps of
+    events from every process follow the order their votes committed in.
+    """
+    log = get_vote_log()
+    if log is None or not events:
+        return
+    lines = encode(events, time.time_ns())
+    if not log.baselined:
+        log.baselined = baseline(log.directory) is not None
+        if not log.baselined:
+            write_baseline(log, using)
+    transaction.on_commit(lambda: log.append(lines), using=using)
+
+
+def write_baseline(log, using=None):
+    """
+    Write every row of the Vote table as a first vote into the baseline
+    segment of the log, once the current transaction commits.
+
+    Runs inside the transaction of the first vote logged, which holds the
+    write lock, so the baseline sees every vote committed before it and
+    the events logged so far are all older than it. read_events() skips
+    those. A baseline whose transaction rolls back leaves a hidden
+    temporary file behind and is written again by the next vote.
+    """
+    using = using or DEFAULT_DB_ALIAS
+    timestamp = time.time_ns()
+    rows = (Vote.objects.using(using).order_by()
+            .values_list('user_id', 'question_id', 'choice_id'))
+    fd, temporary = tempfile.mkstemp(prefix='.baseline-', suffix='.tmp',
+                                     dir=log.directory)
+    with os.fdopen(fd, 'w', encoding='ascii') as file:
+        file.writelines(
+            f'[{timestamp},{user_id},{question_id},{choice_id},null]\n'
+            for user_id, question_id, choice_id in rows.iterator(10000))
+    path = os.path.join(log.directory, f'votes-{timestamp:020d}{BASELINE}')
+
+    def publish():
+        os.replace(temporary, path)
+        log.baselined = True
+
+    transaction.on_commit(publish, using=using)
+
+
+def _timestamp(path):
+    return int(os.path.basename(path).split('-')[1])
+
+
+def baseline(directory):
+    """
+    Return the path of the baseline segment in `directory`, or None.
+
+    Processes that started the log at the same time can each write one;
+    only the oldest is used.
+    """
+    return next((path for path in _all_segments(directory)
+                 if BASELINE in path), None)
+
+
+def _all_segments(directory):
+    return sorted(
+        os.path.join(directory, name) for name in os.listdir(directory)
+        if name.startswith('votes-')
+        and name.endswith(('.ndjson', '.ndjson.gz')))
+
+
+def segments(directory):
+    """
+    Return the paths of the segments in `directory`, gzipped ones
+    included, oldest first.
+    """
+    first = baseline(directory)
+    return [path for path in _all_segments(directory)
+            if BASELINE not in path or path == first]
+
+
+def _optional(value):
+    return None if value == b'null' else int(value)
+
+
+def read_segment(path):
+    """
+    Yield the (time_ns, user_id, question_id, choice_id,
+    previous_choice_id) events of one segment, skipping the torn last
+    line a crash can leave.
+    """
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rb') as segment:
+        for line in segment:
+            try:
+                timestamp, user_id, question_id, choice_id, previous = (
+                    line.strip()[1:-1].split(b','))
+                yield (int(timestamp), int(user_id), int(question_id),
+                       _optional(choice_id), _optional(previous))
+            except ValueError:
+                continue
+
+
+def read_events(directory, until=None, question_ids=None):
+    """
+    Yield the events of every segment in `directory` in time order, up to
+    `until` nanoseconds when given, and only for `question_ids` when
+    given.
+
+    Segments are read line by line and merged, so memory does not grow
+    with the size of the log. Events older than the baseline are already
+    counted in it and are skipped.
+    """
+    paths = segments(directory)
+    first = baseline(directory)
+    start = _timestamp(first) if first is not None else 0
+    events = heapq.merge(*(read_segment(path) for path in paths),
+                         key=itemgetter(0))
+    for event in events:
+        if event[0] < start:
+            continue
+        if until is not None and event[0] > until:
+            return
+        if question_ids is None or event[2] in question_ids:
+            yield event
+
+
+def replay(events):
+    """
+    Return the votes left by a stream of events, a dict mapping
+    (user_id, question_id) to choice_id.
+    """
+    votes = {}
+    for _, user_id, question_id, choice_id, _ in events:
+        if choice_id is None:
+            votes.pop((user_id, question_id), None)
+        else:
+            votes[user_id, question_id] = choice_id
+    return votes
+
+
+def timeline(events, interval):
+    """
+    Yield the tallies of a stream of events every `interval` seconds.
+
+    Each item is (end of the interval in nanoseconds, Counter of votes by
+    choice_id at that time, votes cast in the interval, votes changed to
+    another choice in the interval, votes deleted in the interval). Only
+    intervals with events are yielded.
+    """
+    step = int(interval * 1e9)
+    tallies = Counter()
+    end = None
+    cast = changed = deleted = 0
+    for timestamp, _, _, choice_id, previous in events:
+        if end is not None and timestamp >= end:
+            yield end, +tallies, cast, changed, deleted
+            cast = changed = deleted = 0
+        if end is None or timestamp >= end:
+            end = (timestamp // step + 1) * step
+        if previous is not None:
+            tallies[previous] -= 1
+        if choice_id is None:
+            deleted += 1
+        elif previous is None:
+            cast += 1
+        else:
+            changed += 1
+        if choice_id is not None:
+            tallies[choice_id] += 1
+    if end is not None:
+        yield end, +tallies, cast, changed, deleted
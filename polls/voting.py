@@ -0,0 +1,422 @@
+import re
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from mysite.metrics import get_registry
+
+from .models import Choice, ChoiceShard, Question, ResultSnapshot, Vote
+from .results import bump_results_version
+from .votelog import record_votes
+
+_VOTE_TOKEN = re.compile(r'[0-9a-f]{32}')
+
+
+@contextmanager
+def immediate_atomic(using=None):
+    """
+    transaction.atomic() that takes the write lock up front.
+
+    A deferred SQLite transaction that reads before it writes has to
+    upgrade its lock, and fails at once with "database is locked" when
+    another writer got there first. BEGIN IMMEDIATE waits for the lock
+    (up to busy_timeout) instead. Other backends, and blocks nested in
+    an outer transaction, get a plain atomic().
+    """
+    connection = transaction.get_connection(using)
+    immediate = (hasattr(connection, 'transaction_mode')
+                 and not connection.in_atomic_block)
+    if immediate:
+        connection.transaction_mode = 'IMMEDIATE'
+    try:
+        with transaction.atomic(using=using):
+            yield
+    finally:
+        if immediate:
+            # normally used up by BEGIN already
+            connection.transaction_mode = None
+
+
+def tally_shard(shards, user_id):
+    """
+    Return the tally shard a user's votes count in, or None when the
+    question keeps its tallies on Choice and Question directly.
+    """
+    if shards <= 1:
+        return None
+    return user_id % shards
+
+
+def _write_tallies(choice_deltas, question_deltas):
+    """
+    Apply tally changes with one UPDATE per changed row.
+
+    `choice_deltas` maps (choice_id, shard) to a change, with shard None
+    for Choice.votes itself, and `question_deltas` maps question ids to a
+    change of Question.total_votes.
+    """
+    for (choice_id, shard), delta in choice_deltas.items():
+        if not delta:
+            continue
+        if shard is None:
+            Choice.objects.filter(pk=choice_id).update(
+                votes=F('votes') + delta)
+            continue
+        shards = ChoiceShard.objects.filter(choice_id=choice_id, shard=shard)
+        if not shards.update(votes=F('votes') + delta):
+            ChoiceShard.objects.bulk_create(
+                [ChoiceShard(choice_id=choice_id, shard=shard)],
+                ignore_conflicts=True)
+            shards.update(votes=F('votes') + delta)
+    for question_id, delta in question_deltas.items():
+        if delta:
+            Question.objects.filter(pk=question_id).update(
+                total_votes=F('total_votes') + delta)
+
+
+def new_vote_token():
+    """
+    Return a fresh idempotency token for a vote form.
+    """
+    return uuid.uuid4().hex
+
+
+def _vote_token_key(user_id, token, choice_id):
+    return f'polls:vote-token:{user_id}:{choice_id}:{token}'
+
+
+def _vote_token_claim(user_id, token, choice_id):
+    """
+    Return the cache key a submission claims, or None when it has no
+    well-formed token and choice and is never taken for a replay.
+    """
+    if not _VOTE_TOKEN.fullmatch(token or '') or not str(choice_id).isdigit():
+        return None
+    return _vote_token_key(user_id, token, choice_id)
+
+
+def claim_vote_token(user_id, token, choice_id):
+    """
+    Record the submission of a vote form for a choice.
+
+    Returns False when the same form was already submitted for the same
+    choice in the last POLLS_VOTE_TOKEN_TIMEOUT seconds, so a retried
+    submission can be answered without touching the database. Choosing
+    another option on the same form is a new vote.
+    """
+    key = _vote_token_claim(user_id, token, choice_id)
+    if key is None:
+        return True
+    return cache.add(key, True, settings.POLLS_VOTE_TOKEN_TIMEOUT)
+
+
+async def aclaim_vote_token(user_id, token, choice_id):
+    """
+    Async version of claim_vote_token().
+    """
+    key = _vote_token_claim(user_id, token, choice_id)
+    if key is None:
+        return True
+    return await cache.aadd(key, True, settings.POLLS_VOTE_TOKEN_TIMEOUT)
+
+
+def release_vote_token(user_id, token, choice_id):
+    """
+    Forget a claimed submission whose vote failed, so it can be retried.
+    """
+    key = _vote_token_claim(user_id, token, choice_id)
+    if key is not None:
+        cache.delete(key)
+
+
+def count_avoided_writes(reason, amount=1):
+    """
+    Count vote submissions that were answered without writing, by reason:
+    `duplicate` form submissions, `unchanged` votes for the current
+    choice, and votes `coalesced` in the write-behind buffer.
+    """
+    if amount:
+        get_registry().inc('polls_vote_writes_avoided_total',
+                           {'reason': reason}, amount)
+
+
+def _is_closed(end_date):
+    return end_date is not None and end_date <= timezone.now()
+
+
+def _drop_snapshots(question_ids):
+    """
+    Delete the results snapshots of closed questions that just got a late
+    vote, so they are counted again. Archived snapshots are kept, as the
+    votes behind them are gone.
+    """
+    if question_ids:
+        ResultSnapshot.objects.filter(question_id__in=question_ids,
+                                      archived=False).delete()
+
+
+def _locked_choice(user, question):
+    """
+    Return the choice of the user's vote on the question, locking its row,
+    or None.
+    """
+    return (Vote.objects.select_for_update()
+            .filter(user=user, question=question)
+            .values_list('choice_id', flat=True).first())
+
+
+def _insert_vote(user, question, choice):
+    """
+    Insert a first vote, and return False when a vote of the user on the
+    question was committed first.
+    """
+    with transaction.get_connection().cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {Vote._meta.db_table} "
+            f"(user_id, question_id, choice_id) VALUES (%s, %s, %s) "
+            f"ON CONFLICT (user_id, question_id) DO NOTHING",
+            [user.pk, question.pk, choice.pk])
+        return cursor.rowcount == 1
+
+
+def cast_vote(user, question, choice):
+    """
+    Record the vote of a user for a choice and keep the tallies in step.
+
+    The user's previous choice is read with its row locked and the vote
+    is updated in place; a first vote is inserted with ON CONFLICT DO
+    NOTHING, and when a concurrent first vote won the insert its choice
+    is read again, so the tallies are right on any backend and a user
+    never has two votes. The old choice is decremented when the user
+    switches, and the question total only grows on a first vote.
+    On a question with several tally shards the changes go to the
+    user's shard instead. The cached results of the question are
+    invalidated once the transaction commits.
+
+    Returns False, without writing, when the user already voted for
+    `choice`, and True otherwise.
+    """
+    with immediate_atomic():
+        previous = _locked_choice(user, question)
+        if previous is None and not _insert_vote(user, question, choice):
+            previous = _locked_choice(user, question)
+        if previous == choice.id:
+            return False
+        if previous is not None:
+            Vote.objects.filter(user=user, question=question).update(
+                choice=choice)
+        shard = tally_shard(question.tally_shards, user.pk)
+        choice_deltas = Counter({(choice.pk, shard): 1})
+        question_deltas = Counter()
+        if previous is not None:
+            choice_deltas[(previous, shard)] -= 1
+        elif shard is None:
+            question_deltas[question.pk] += 1
+        _write_tallies(choice_deltas, question_deltas)
+        if _is_closed(question.end_date):
+            _drop_snapshots([question.pk])
+        record_votes([(user.pk, question.pk, choice.pk, previous)])
+        transaction.on_commit(lambda: bump_results_version(question.pk))
+    return True
+
+
+def write_votes(votes):
+    """
+    Write a batch of votes and their tallies in one transaction.
+
+    `votes` maps (user_id, question_id) to the chosen choice_id, so each
+    user has at most one vote per question in the batch. The previous
+    choices are read in one query, the votes are written with one bulk
+    upsert, and every touched choice and question gets a single tally
+    update. Returns the number of votes that changed something.
+    """
+    if not votes:
+        return 0
+    with immediate_atomic():
+        user_ids = {user_id for user_id, _ in votes}
+        question_ids = {question_id for _, question_id in votes}
+        previous = {
+            (user_id, question_id): choice_id
+            for user_id, question_id, choice_id in Vote.objects.filter(
+                user_id__in=user_ids, question_id__in=question_ids,
+            ).values_list('user_id', 'question_id', 'choice_id')
+        }
+        shards = {}
+        closed = []
+        for question_id, tally_shards, end_date in (
+                Question.objects.filter(pk__in=question_ids)
+                .values_list('id', 'tally_shards', 'end_date')):
+            shards[question_id] = tally_shards
+            if _is_closed(end_date):
+                closed.append(question_id)
+        choice_deltas = Counter()
+        question_deltas = Counter()
+        changed = []
+        events = []
+        for (user_id, question_id), choice_id in votes.items():
+            old_choice_id = previous.get((user_id, question_id))
+            if old_choice_id == choice_id:
+                continue
+            shard = tally_shard(shards.get(question_id, 1), user_id)
+            if old_choice_id is not None:
+                choice_deltas[(old_choice_id, shard)] -= 1
+            elif shard is None:
+                question_deltas[question_id] += 1
+            choice_deltas[(choice_id, shard)] += 1
+            changed.append(Vote(user_id=user_id, question_id=question_id,
+                                choice_id=choice_id))
+            events.append((user_id, question_id, choice_id, old_choice_id))
+        Vote.objects.bulk_create(
+            changed,
+            update_conflicts=True,
+            unique_fields=['user', 'question'],
+            update_fields=['choice'],
+        )
+        _write_tallies(choice_deltas, question_deltas)
+        # buffered votes can land after their question was finalized
+        _drop_snapshots({vote.question_id for vote in changed}
+                        .intersection(closed))
+        record_votes(events)
+
+        def invalidate():
+            for question_id in {vote.question_id for vote in changed}:
+                bump_results_version(question_id)
+
+        transaction.on_commit(invalidate)
+    return len(changed)
+
+
+def restore_votes(votes, question_ids):
+    """
+    Replace the votes of the given questions with `votes`, a dict mapping
+    (user_id, question_id) to choice_id such as polls.votelog.replay()
+    returns, and recount their tallies.
+
+    Questions that no longer exist or whose votes were archived are left
+    alone, as are votes of users or choices deleted since. Returns the
+    ids of the questions restored and the number of votes written.
+    """
+    with immediate_atomic():
+        question_ids = set(
+            Question.objects.filter(pk__in=question_ids)
+            .exclude(snapshot__archived=True).values_list('id', flat=True))
+        choices = set(Choice.objects.filter(question__in=question_ids)
+                      .values_list('id', 'question_id'))
+        user_ids = set(get_user_model().objects.values_list('id', flat=True)
+                       .iterator())
+        restored = [
+            Vote(user_id=user_id, question_id=question_id,
+                 choice_id=choice_id)
+            for (user_id, question_id), choice_id in votes.items()
+            if (choice_id, question_id) in choices and user_id in user_ids
+        ]
+        Vote.objects.filter(question__in=question_ids).delete()
+        Vote.objects.bulk_create(restored, batch_size=5000)
+        _drop_snapshots(question_ids)
+        recount_tallies(Question.objects.filter(pk__in=question_ids))
+
+        def invalidate():
+            for question_id in question_ids:
+                bump_results_version(question_id)
+
+        transaction.on_commit(invalidate)
+    return question_ids, len(restored)
+
+
+def rebuild_tallies(questions=None, fix=True):
+    """
+    Recount the tallies of the given questions (all by default) from the
+    Vote table.
+
+    Returns a list of (object, stored, actual) tuples for every Choice or
+    Question whose stored tally, counting its shards, was wrong. The
+    tallies are only rewritten when `fix` is True, and a rewritten
+    question has its shards emptied.
+    """
+    if questions is None:
+        questions = Question.objects.all()
+    # archived votes are gone from the Vote table, their tallies stay
+    questions = questions.exclude(snapshot__archived=True)
+    drift = []
+    for question in questions.with_live_total().iterator():
+        with transaction.atomic():
+            total = 0
+            question_drift = []
+            choices = (question.choice_set.with_live_votes()
+                       .annotate(actual=Count('vote')))
+            for choice in choices:
+                total += choice.actual
+                if choice.live_votes != choice.actual:
+                    question_drift.append(
+                        (choice, choice.live_votes, choice.actual))
+            if question.live_total_votes != total:
+                question_drift.append(
+                    (question, question.live_total_votes, total))
+            drift.extend(question_drift)
+            if fix and question_drift:
+                for choice in choices:
+                    if choice.votes != choice.actual:
+                        Choice.objects.filter(pk=choice.pk).update(
+                            votes=choice.actual)
+                ChoiceShard.objects.filter(
+                    choice__question=question).update(votes=0)
+                Question.objects.filter(pk=question.pk).update(
+                    total_votes=total)
+    return drift
+
+
+def recount_tallies(questions):
+    """
+    Rewrite the tallies of the given questions from the Vote table with
+    set-based UPDATEs, whatever the number of questions.
+
+    Unlike rebuild_tallies() nothing is reported, and archived questions
+    must not be passed in. Returns the number of questions updated.
+    """
+    with immediate_atomic():
+        ChoiceShard.objects.filter(choice__question__in=questions).update(
+            votes=0)
+        Choice.objects.filter(question__in=questions).update(votes=Coalesce(
+            Subquery(Vote.objects.filter(choice=OuterRef('pk'))
+                     .values('choice').annotate(count=Count('id'))
+                     .values('count')), 0))
+        return questions.update(total_votes=Coalesce(
+            Subquery(Vote.objects.filter(question=OuterRef('pk'))
+                     .values('question').annotate(count=Count('id'))
+                     .values('count')), 0))
+
+
+def compact_tallies(questions=None):
+    """
+    Fold the tally shards of the given questions (all by default) back
+    into Choice.votes and Question.total_votes.
+
+    Each question is compacted in its own short transaction, so voting
+    carries on in between. Returns the number of votes moved.
+    """
+    shards = ChoiceShard.objects.exclude(votes=0)
+    if questions is not None:
+        shards = shards.filter(choice__question__in=questions)
+    question_ids = set(shards.values_list('choice__question_id', flat=True))
+    moved = 0
+    for question_id in question_ids:
+        with immediate_atomic():
+            question_shards = ChoiceShard.objects.filter(
+                choice__question_id=question_id).exclude(votes=0)
+            sums = dict(question_shards.values('choice_id')
+                        .annotate(total=Sum('votes'))
+                        .values_list('choice_id', 'total'))
+            question_shards.update(votes=0)
+            _write_tallies({(choice_id, None): delta
+                            for choice_id, delta in sums.items()},
+                           {question_id: sum(sums.values())})
+        moved += sum(sums.values())
+    return moved